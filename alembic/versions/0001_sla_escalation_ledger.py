@@ -0,0 +1,50 @@
+"""sla escalation ledger
+
+Revision ID: 0001_sla_escalation_ledger
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_sla_escalation_ledger'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'sla_escalation_ledger',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('task_id', sa.Integer(), sa.ForeignKey('tasks.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('level', sa.String(length=20), nullable=False),
+        sa.Column('due_date', sa.DateTime(), nullable=True),
+        sa.Column('recipient', sa.String(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.UniqueConstraint('task_id', 'level', name='uq_sla_ledger_task_level'),
+    )
+    op.create_index('ix_sla_escalation_ledger_id', 'sla_escalation_ledger', ['id'])
+    op.create_index('ix_sla_escalation_ledger_task_id', 'sla_escalation_ledger', ['task_id'])
+    op.create_table(
+        'sla_scan_state',
+        sa.Column('scan_name', sa.String(length=50), primary_key=True),
+        sa.Column('last_run_at', sa.DateTime(), nullable=False),
+    )
+    # Le scansioni incrementali filtrano i task aperti per scadenza
+    op.create_index('ix_tasks_due_date_open', 'tasks', ['due_date'], postgresql_where=sa.text("status != 'chiuso'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tasks_due_date_open', table_name='tasks')
+    op.drop_table('sla_scan_state')
+    op.drop_index('ix_sla_escalation_ledger_task_id', table_name='sla_escalation_ledger')
+    op.drop_index('ix_sla_escalation_ledger_id', table_name='sla_escalation_ledger')
+    op.drop_table('sla_escalation_ledger')
@@ -0,0 +1,33 @@
+"""crm sync state
+
+Revision ID: 0002_crm_sync_state
+Revises: 0001_sla_escalation_ledger
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_crm_sync_state'
+down_revision: Union[str, None] = '0001_sla_escalation_ledger'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'crm_sync_state',
+        sa.Column('entity', sa.String(length=50), primary_key=True),
+        sa.Column('last_modified_at', sa.DateTime(), nullable=True),
+        sa.Column('last_run_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('crm_sync_state')
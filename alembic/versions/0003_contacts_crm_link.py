@@ -0,0 +1,36 @@
+"""contacts crm link
+
+Revision ID: 0003_contacts_crm_link
+Revises: 0002_crm_sync_state
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_contacts_crm_link'
+down_revision: Union[str, None] = '0002_crm_sync_state'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('contacts', sa.Column('crm_id', sa.Integer(), nullable=True))
+    op.add_column('contacts', sa.Column('company_id', sa.String(), nullable=True))
+    op.create_index('ix_contacts_crm_id', 'contacts', ['crm_id'], unique=True)
+    op.create_index('ix_contacts_company_id', 'contacts', ['company_id'])
+    op.create_foreign_key('fk_contacts_company_id', 'contacts', 'companies', ['company_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_contacts_company_id', 'contacts', type_='foreignkey')
+    op.drop_index('ix_contacts_company_id', table_name='contacts')
+    op.drop_index('ix_contacts_crm_id', table_name='contacts')
+    op.drop_column('contacts', 'company_id')
+    op.drop_column('contacts', 'crm_id')
@@ -0,0 +1,32 @@
+"""companies nome trigram index
+
+Revision ID: 0004_companies_nome_trgm
+Revises: 0003_contacts_crm_link
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_companies_nome_trgm'
+down_revision: Union[str, None] = '0003_contacts_crm_link'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Fallback SQL di get_company_id_by_name: LOWER(nome) = ... e nome % :name
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_companies_nome_trgm ON companies USING gin (nome gin_trgm_ops)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_companies_nome_lower ON companies (LOWER(nome))")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_companies_nome_lower")
+    op.execute("DROP INDEX IF EXISTS ix_companies_nome_trgm")
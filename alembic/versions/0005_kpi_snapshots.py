@@ -0,0 +1,34 @@
+"""kpi snapshots
+
+Revision ID: 0005_kpi_snapshots
+Revises: 0004_companies_nome_trgm
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_kpi_snapshots'
+down_revision: Union[str, None] = '0004_companies_nome_trgm'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'kpi_snapshots',
+        sa.Column('key', sa.String(length=50), primary_key=True),
+        sa.Column('data', postgresql.JSONB(), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('kpi_snapshots')
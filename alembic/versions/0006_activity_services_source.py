@@ -0,0 +1,29 @@
+"""activity services source
+
+Revision ID: 0006_activity_services_source
+Revises: 0005_kpi_snapshots
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_activity_services_source'
+down_revision: Union[str, None] = '0005_kpi_snapshots'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 'manual' (PATCH/PUT /activities/{id}/services) | 'auto' (riclassificazione) | NULL (righe precedenti)
+    op.add_column('activities', sa.Column('detected_services_source', sa.String(length=10), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('activities', 'detected_services_source')
@@ -0,0 +1,63 @@
+"""cache versions
+
+Revision ID: 0007_cache_versions
+Revises: 0006_activity_services_source
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_cache_versions'
+down_revision: Union[str, None] = '0006_activity_services_source'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Tabelle lette dalle risposte di catalogue_cache (app/services/response_cache.py)
+CATALOGUE_TABLES = (
+    'sub_types',
+    'service_commessa_mapping',
+    'service_user_associations',
+    'users',
+    'milestones',
+    'phase_templates',
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'cache_versions',
+        sa.Column('name', sa.String(length=50), primary_key=True),
+        sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    )
+    op.execute("INSERT INTO cache_versions (name, version) VALUES ('catalogue', 0)")
+    # Un incremento per statement, nella stessa transazione della scrittura:
+    # la nuova versione è visibile a tutti i worker insieme ai dati
+    op.execute("""
+        CREATE FUNCTION bump_cache_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE cache_versions SET version = version + 1, updated_at = NOW() WHERE name = TG_ARGV[0];
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in CATALOGUE_TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_bump_catalogue
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_cache_version('catalogue')
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in CATALOGUE_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_bump_catalogue ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS bump_cache_version()")
+    op.drop_table('cache_versions')
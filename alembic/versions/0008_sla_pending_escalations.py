@@ -0,0 +1,35 @@
+"""sla pending escalations
+
+Revision ID: 0008_sla_pending_escalations
+Revises: 0007_cache_versions
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008_sla_pending_escalations'
+down_revision: Union[str, None] = '0007_cache_versions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Riga in attesa (sent_at NULL): escalation programmata per notify_after o consegna da ritentare
+    op.add_column('sla_escalation_ledger', sa.Column('notify_after', sa.DateTime(), nullable=True))
+    op.alter_column('sla_escalation_ledger', 'sent_at', existing_type=sa.DateTime(), nullable=True)
+    op.create_index('ix_sla_ledger_pending', 'sla_escalation_ledger', ['level', 'notify_after'],
+                    postgresql_where=sa.text('sent_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_sla_ledger_pending', table_name='sla_escalation_ledger')
+    op.execute("DELETE FROM sla_escalation_ledger WHERE sent_at IS NULL")
+    op.alter_column('sla_escalation_ledger', 'sent_at', existing_type=sa.DateTime(), nullable=False)
+    op.drop_column('sla_escalation_ledger', 'notify_after')
@@ -42,3 +42,29 @@ ENABLE_EMAIL_NOTIFICATIONS = os.getenv("ENABLE_EMAIL_NOTIFICATIONS", "true").low
 SLA_WARNING_DAYS = int(os.getenv("SLA_WARNING_DAYS", "2"))
 
 # =============================================================================
+# SLA ESCALATION LEDGER
+# =============================================================================
+
+# Ogni quante ore la scansione overdue rilegge tutti i task scaduti invece dei soli
+# scaduti dopo l'ultimo run (task creati già scaduti, scadenze anticipate, riaperture)
+SLA_FULL_SCAN_HOURS = int(os.getenv("SLA_FULL_SCAN_HOURS", "24"))
+
+# 'per_task' (default): una email per task | 'digest': una email per owner per run con tutti i suoi task
+SLA_NOTIFICATION_MODE = os.getenv("SLA_NOTIFICATION_MODE", "per_task").lower()
+
+# =============================================================================
+# EMAIL DELIVERY (pool SMTP + coda asincrona)
+# =============================================================================
+
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+
+# true: send_email accoda e ritorna subito, l'invio avviene nel worker in background
+EMAIL_ASYNC_DELIVERY = os.getenv("EMAIL_ASYNC_DELIVERY", "true").lower() == "true"
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_MAX_RETRIES = int(os.getenv("EMAIL_MAX_RETRIES", "3"))
+EMAIL_RETRY_BACKOFF_SECONDS = float(os.getenv("EMAIL_RETRY_BACKOFF_SECONDS", "2"))
+
+# =============================================================================
@@ -3,97 +3,158 @@ CRM InCloud Integration - DATABASE CREDENTIALS CORRETTE
 companies.id = CRM ID direttamente  
 """
 
-import requests
 import time
-import psycopg2
+import json
 import os
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from itertools import islice
+from urllib.parse import quote
+
+from app.services.company_upsert import company_row, upsert_companies_batch
+from app.services.contact_upsert import contact_row, upsert_contacts_batch
+from app.services.crm_watermarks import get_watermark, save_watermark, max_modified, changed_since_filter
 
 CRM_API_KEY = os.getenv("CRM_API_KEY")
-CRM_BASE_URL = "https://api.crmincloud.it/api/v1"
+CRM_BASE_URL = os.getenv("CRM_BASE_URL", "https://api.crmincloud.it/api/v1")
+
+# Fetch dettagli aziende: richieste concorrenti (il ritmo lo decide il rate limiter CRM)
+CRM_SYNC_WORKERS = int(os.getenv("CRM_SYNC_WORKERS", "4"))
+CRM_SYNC_BATCH_SIZE = int(os.getenv("CRM_SYNC_BATCH_SIZE", "50"))
+CRM_SYNC_CHECKPOINT = os.getenv("CRM_SYNC_CHECKPOINT", "crm_companies_sync_checkpoint.json")
+# Un checkpoint più vecchio di così non viene ripreso (i dati nel CRM possono essere cambiati)
+CRM_SYNC_CHECKPOINT_MAX_AGE_HOURS = float(os.getenv("CRM_SYNC_CHECKPOINT_MAX_AGE_HOURS", "24"))
+CRM_CONTACTS_PAGE_SIZE = int(os.getenv("CRM_CONTACTS_PAGE_SIZE", "200"))
 
-def get_crm_token():
-    """Usa logica esistente"""
+def get_crm_headers():
+    """Header con il token CRM condiviso (login solo alla scadenza del token)"""
     try:
-        from integrations.crm_incloud.sync import get_crm_token as original_get_crm_token
-        return original_get_crm_token()
-    except ImportError:
+        from app.services.crm_auth import get_crm_headers as shared_crm_headers
+        return shared_crm_headers()
+    except Exception as e:
+        print(f"❌ CRM authentication error: {e}")
         return None
 
-def get_crm_headers():
-    """Get headers funzionanti"""
-    token = get_crm_token()
-    if not token:
+def rate_limited_request(url, headers=None):
+    """GET sul client CRM condiviso.
+
+    Il client applica il token bucket comune a tutti i chiamanti CRM e
+    gestisce 429 (Retry-After) ed errori transitori con backoff.
+    """
+    from app.services.crm_client import crm_client
+
+    try:
+        response = crm_client.get(url)
+    except Exception as e:
+        print(f"❌ Request error: {e}")
         return None
-        
+
+    if response.status_code == 200:
+        return response.json()
+    print(f"❌ Error {response.status_code}: {response.text[:200]}")
+    return None
+
+def checkpoint_run(delta, watermark, limit):
+    """Parametri del run salvati nel checkpoint: si riprende solo un run identico"""
     return {
-        "Authorization": f"Bearer {token}",
-        "WebApiKey": CRM_API_KEY,
-        "Content-Type": "application/json"
+        "delta": bool(delta),
+        "watermark": watermark.isoformat() if watermark else None,
+        "limit": None if delta else limit,
     }
 
-def get_db_connection():
-    """Database connection con credenziali corrette da ENV"""
-    # Credenziali dall'ENV file
-    db_user = os.getenv("POSTGRES_USER", "postgres")
-    db_password = os.getenv("POSTGRES_PASSWORD", "postgres123")
-    db_name = os.getenv("POSTGRES_DB", "intelligence_db")
-    
-    # Host possibili nel container Docker
-    db_hosts = ["db", "localhost", "127.0.0.1", "postgres"]
-    
-    for host in db_hosts:
-        try:
-            print(f"🔌 Trying database: {db_user}@{host}:5432/{db_name}")
-            conn = psycopg2.connect(
-                host=host,
-                database=db_name, 
-                user=db_user,
-                password=db_password,
-                port=5432,
-                connect_timeout=5
-            )
-            print(f"✅ Database connected via {host}")
-            return conn
-        except Exception as e:
-            print(f"❌ Host {host} failed: {str(e)[:100]}")
-            continue
-    
-    raise Exception("❌ No database host available")
-
-def rate_limited_request(url, headers, max_retries=3):
-    """Rate limiting funzionante"""
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=30)
-            
-            if response.status_code == 429:
-                print(f"⏳ Rate limit hit, waiting 60 seconds...")
-                time.sleep(60)
-                continue
-                
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"❌ Error {response.status_code}: {response.text[:200]}")
-                return None
-                
-        except Exception as e:
-            print(f"❌ Request error: {e}")
-            if attempt < max_retries - 1:
-                time.sleep(5)
-                continue
-            return None
-    
-    return None
+def load_checkpoint(run, path=CRM_SYNC_CHECKPOINT, max_age_hours=CRM_SYNC_CHECKPOINT_MAX_AGE_HOURS, now=None):
+    """(ID aziende già salvate, inizio del run) di un run interrotto con gli stessi parametri e non scaduto.
+
+    Senza checkpoint valido ritorna (set(), None).
+    """
+    if not os.path.exists(path):
+        return set(), None
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        started_at = datetime.fromisoformat(data["started_at"])
+    except Exception as e:
+        print(f"⚠️ Checkpoint non leggibile ({e}), ripartenza da zero")
+        return set(), None
+    if data.get("run") != run:
+        print(f"⚠️ Checkpoint di un altro run ({data.get('run')}), ignorato")
+        return set(), None
+    if (now or datetime.utcnow()) - started_at > timedelta(hours=max_age_hours):
+        print(f"⚠️ Checkpoint del {started_at.isoformat()} scaduto, ignorato")
+        return set(), None
+    return set(data.get("completed_ids", [])), started_at
+
+def save_checkpoint(completed_ids, run, started_at, path=CRM_SYNC_CHECKPOINT):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "run": run,
+            "started_at": started_at.isoformat(),
+            "completed_ids": sorted(completed_ids),
+            "updated_at": datetime.utcnow().isoformat()
+        }, f)
+    os.replace(tmp_path, path)
+
+def clear_checkpoint(path=CRM_SYNC_CHECKPOINT):
+    if os.path.exists(path):
+        os.remove(path)
+
+def fetch_company_details(company_ids, max_workers=CRM_SYNC_WORKERS):
+    """Scarica /Company/{id} in parallelo con concorrenza limitata.
 
-def sync_companies_safe(limit=100, dry_run=False):
-    """Sync companies con credenziali corrette"""
-    print(f"🏢 SYNC COMPANIES - CREDENZIALI CORRETTE - Limit: {limit}, Dry Run: {dry_run}")
+    Al massimo max_workers * 2 richieste in volo; il ritmo reale è dato dal
+    rate limiter condiviso del client CRM. Restituisce (id, dettaglio) man
+    mano che le risposte arrivano, così il chiamante può salvare in streaming.
+    """
+    ids = iter(company_ids)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = {}
+        for crm_company_id in islice(ids, max_workers * 2):
+            in_flight[pool.submit(rate_limited_request, f"{CRM_BASE_URL}/Company/{crm_company_id}")] = crm_company_id
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                crm_company_id = in_flight.pop(future)
+                try:
+                    detail = future.result()
+                except Exception as e:
+                    print(f"❌ Request error for company {crm_company_id}: {e}")
+                    detail = None
+                yield crm_company_id, detail
+                for next_id in islice(ids, 1):
+                    in_flight[pool.submit(rate_limited_request, f"{CRM_BASE_URL}/Company/{next_id}")] = next_id
+
+def fetch_changed_company_ids(since):
+    """ID delle aziende modificate nel CRM da `since` (una sola chiamata)"""
+    url = f"{CRM_BASE_URL}/Company/SearchIds?filter={quote(changed_since_filter(since))}"
+    print(f"🔍 Delta sync: aziende modificate da {since.isoformat()}")
+    return rate_limited_request(url)
+
+def sync_companies_safe(limit=100, dry_run=False, resume=True, max_workers=CRM_SYNC_WORKERS,
+                        batch_size=CRM_SYNC_BATCH_SIZE, delta=False):
+    """Sync companies: dettagli scaricati in parallelo e salvati a blocchi.
+
+    limit=None sincronizza tutte le aziende. Dopo ogni blocco salvato viene
+    aggiornato il checkpoint: con resume=True un run interrotto riparte
+    saltando le aziende già salvate, purché il checkpoint sia dello stesso
+    tipo di run (delta, watermark, limit) e non più vecchio di
+    CRM_SYNC_CHECKPOINT_MAX_AGE_HOURS.
+
+    Con delta=True vengono scaricate solo le aziende con lastModifiedDate
+    successivo al watermark salvato (crm_sync_state); senza watermark il
+    primo run è completo. Il watermark avanza solo dopo un run completo,
+    senza dettagli mancanti e non ripreso da checkpoint: le aziende saltate
+    perché già salvate potrebbero essere cambiate dopo il run interrotto,
+    quindi il delta successivo le riscarica.
+    """
+    print(f"🏢 SYNC COMPANIES - Limit: {limit}, Dry Run: {dry_run}, Workers: {max_workers}, Delta: {delta}")
+    started = time.perf_counter()
     
     companies_processed = 0
     companies_created = 0
     companies_updated = 0
+    companies_unchanged = 0
+    companies_skipped = 0
     
     try:
         # 1. Get CRM headers (FUNZIONA!)
@@ -101,80 +162,89 @@ def sync_companies_safe(limit=100, dry_run=False):
         if not headers:
             return {"error": "Failed to authenticate with CRM"}
         
-        # 2. Get companies list (FUNZIONA!)
-        url = f"{CRM_BASE_URL}/Companies?onlyCount=false&maxRecords={limit}"
-        print(f"🔍 Fetching companies from: {url}")
-        
-        companies_data = rate_limited_request(url, headers)
-        
-        if not companies_data:
-            return {"error": "Failed to fetch companies"}
-        
+        # 2. Get companies list: tutte, oppure solo le modificate dal watermark
+        watermark = get_watermark("companies") if delta else None
+        if watermark:
+            companies_data = fetch_changed_company_ids(watermark)
+            if companies_data is None:
+                return {"error": "Failed to fetch changed companies"}
+        else:
+            url = f"{CRM_BASE_URL}/Companies?onlyCount=false"
+            if limit and not delta:
+                url += f"&maxRecords={limit}"
+            print(f"🔍 Fetching companies from: {url}")
+
+            companies_data = rate_limited_request(url, headers)
+
+            if not companies_data:
+                return {"error": "Failed to fetch companies"}
+
         print(f"📊 Total companies from CRM: {len(companies_data)}")
+
+        run = checkpoint_run(delta, watermark, limit)
+        completed_ids, resumed_started_at = load_checkpoint(run) if resume and not dry_run else (set(), None)
+        # La scadenza conta dall'inizio del primo run, anche dopo più riprese
+        run_started_at = resumed_started_at or datetime.utcnow()
+        pending_ids = [cid for cid in companies_data if cid not in completed_ids]
+        companies_skipped = len(companies_data) - len(pending_ids)
+        if companies_skipped:
+            print(f"⏩ Resume da checkpoint: {companies_skipped} aziende già sincronizzate")
         
-        if not dry_run:
-            # 3. Connect to database con credenziali corrette
-            conn = get_db_connection()
-            cursor = conn.cursor()
-        
-        # 4. Process companies (solo primi 10 per test)
-        for i, crm_company_id in enumerate(companies_data[:min(10, limit)]):
-            time.sleep(1.5)  # Rate limiting
-            
-            # Get company details
-            detail_url = f"{CRM_BASE_URL}/Company/{crm_company_id}"
-            company_detail = rate_limited_request(detail_url, headers)
-            
+        # 3. Dettagli in streaming, salvati con un upsert per blocco (engine SQLAlchemy dell'app)
+        batch_rows = []
+        batches = []
+        new_watermark = watermark
+        complete = (delta or not limit) and not companies_skipped
+
+        def flush_batch():
+            nonlocal companies_created, companies_updated, companies_unchanged
+            stats = upsert_companies_batch(batch_rows)
+            companies_created += stats["inserted"]
+            companies_updated += stats["updated"]
+            companies_unchanged += stats["unchanged"]
+            batches.append(stats)
+            completed_ids.update(int(row["id"]) for row in batch_rows)
+            save_checkpoint(completed_ids, run, run_started_at)
+            print(f"💾 Batch {len(batches)}: +{stats['inserted']} nuove, "
+                  f"{stats['updated']} aggiornate, {stats['unchanged']} invariate "
+                  f"({len(completed_ids)} aziende salvate)")
+            batch_rows.clear()
+
+        for crm_company_id, company_detail in fetch_company_details(pending_ids, max_workers):
             if not company_detail:
                 print(f"⚠️ Skipping company {crm_company_id} - no details")
+                complete = False
                 continue
-                
+
             companies_processed += 1
-            
-            # Extract company data
-            nome = company_detail.get('companyName', '')
-            partita_iva = company_detail.get('taxIdentificationNumber', '')
-            address = company_detail.get('address', '')
-            sector = company_detail.get('description', '')
-            
-            print(f"✅ Company {i+1}: {nome} (CRM ID: {crm_company_id})")
-            
+            new_watermark = max_modified([company_detail], new_watermark)
+            row = company_row(crm_company_id, company_detail)
+            print(f"✅ Company {companies_processed}: {row['nome']} (CRM ID: {crm_company_id})")
+
             if not dry_run:
-                try:
-                    # Check if exists: companies.id = CRM ID
-                    cursor.execute("SELECT id FROM companies WHERE id = %s", (crm_company_id,))
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        cursor.execute("""
-                            UPDATE companies 
-                            SET nome = %s, partita_iva = %s, address = %s, sector = %s, updated_at = NOW()
-                            WHERE id = %s
-                        """, (nome, partita_iva, address, sector, crm_company_id))
-                        companies_updated += 1
-                        print(f"   🔄 Updated company ID {crm_company_id}")
-                    else:
-                        cursor.execute("""
-                            INSERT INTO companies (id, nome, partita_iva, address, sector, created_at, updated_at)
-                            VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
-                        """, (crm_company_id, nome, partita_iva, address, sector))
-                        companies_created += 1
-                        print(f"   ✨ Created company ID {crm_company_id}")
-                        
-                except Exception as e:
-                    print(f"   ❌ DB Error for company {crm_company_id}: {e}")
-                    continue
-        
+                batch_rows.append(row)
+                if len(batch_rows) >= batch_size:
+                    flush_batch()
+
         if not dry_run:
-            conn.commit()
-            cursor.close()
-            conn.close()
+            if batch_rows:
+                flush_batch()
+            clear_checkpoint()
+            if complete:
+                save_watermark("companies", new_watermark)
             print(f"💾 Database changes committed successfully")
-        
+
+        elapsed = time.perf_counter() - started
         return {
             "companies_processed": companies_processed,
             "companies_created": companies_created,
             "companies_updated": companies_updated,
+            "companies_unchanged": companies_unchanged,
+            "companies_skipped": companies_skipped,
+            "batches": batches,
+            "delta_since": watermark.isoformat() if watermark else None,
+            "watermark": new_watermark.isoformat() if new_watermark else None,
+            "elapsed_seconds": round(elapsed, 2),
             "status": "completed"
         }
         
@@ -182,10 +252,80 @@ def sync_companies_safe(limit=100, dry_run=False):
         print(f"❌ Sync error: {e}")
         return {"error": str(e)}
 
-def sync_contacts_safe(limit=100, dry_run=False):
-    """Sync contacts"""
-    print(f"👥 SYNC CONTACTS - Ready with correct credentials")
-    return {"contacts_processed": 0, "status": "credentials_fixed"}
+def iter_crm_contacts(page_size=CRM_CONTACTS_PAGE_SIZE, limit=None):
+    """Contatti CRM pagina per pagina (POST /Contact/SearchAdvanced).
+
+    Generatore: in memoria c'è al massimo una pagina alla volta.
+    """
+    from app.services.crm_client import crm_client
+
+    page = 1
+    yielded = 0
+    while True:
+        response = crm_client.post(f"{CRM_BASE_URL}/Contact/SearchAdvanced", idempotent=True,
+                                   json={"Page": page, "PageSize": page_size})
+        if response.status_code != 200:
+            raise Exception(f"Contact page {page}: HTTP {response.status_code} {response.text[:200]}")
+        data = response.json()
+        items = data.get("Items", []) if isinstance(data, dict) else data
+        if not items:
+            return
+        if limit:
+            items = items[:limit - yielded]
+        yielded += len(items)
+        yield page, items
+        if len(items) < page_size or (limit and yielded >= limit):
+            return
+        page += 1
+
+def sync_contacts_safe(limit=100, dry_run=False, page_size=CRM_CONTACTS_PAGE_SIZE):
+    """Sync contacts: pagine CRM in streaming, un upsert per pagina.
+
+    I contatti sono collegati a companies.id tramite companyId del CRM
+    (company_id NULL se l'azienda non è ancora sincronizzata). limit=None
+    sincronizza tutti i contatti.
+    """
+    print(f"👥 SYNC CONTACTS - Limit: {limit}, Dry Run: {dry_run}, Page size: {page_size}")
+    started = time.perf_counter()
+
+    totals = {"contacts_processed": 0, "contacts_created": 0, "contacts_updated": 0,
+              "contacts_unchanged": 0, "contacts_linked": 0, "contacts_invalid": 0}
+    pages = 0
+
+    try:
+        for page, items in iter_crm_contacts(page_size, limit):
+            pages += 1
+            rows = []
+            for item in items:
+                try:
+                    rows.append(contact_row(item))
+                except (KeyError, TypeError, ValueError):
+                    totals["contacts_invalid"] += 1
+            totals["contacts_processed"] += len(rows)
+
+            if not dry_run:
+                stats = upsert_contacts_batch(rows)
+                totals["contacts_created"] += stats["inserted"]
+                totals["contacts_updated"] += stats["updated"]
+                totals["contacts_unchanged"] += stats["unchanged"]
+                totals["contacts_linked"] += stats["linked"]
+
+            elapsed = time.perf_counter() - started
+            print(f"💾 Pagina {page}: {len(rows)} contatti "
+                  f"({totals['contacts_processed']} totali, {totals['contacts_processed'] / elapsed:.0f} righe/s)")
+
+        elapsed = time.perf_counter() - started
+        return {
+            **totals,
+            "pages": pages,
+            "elapsed_seconds": round(elapsed, 2),
+            "rows_per_second": round(totals["contacts_processed"] / elapsed, 1) if elapsed else None,
+            "status": "completed"
+        }
+
+    except Exception as e:
+        print(f"❌ Contacts sync error: {e}")
+        return {**totals, "pages": pages, "error": str(e)}
 
 if __name__ == "__main__":
     print("🚀 CRM SYNC MODULE - CREDENZIALI DATABASE CORRETTE")
@@ -8,3 +8,7 @@ from .phase_template import PhaseTemplate
 from .opportunity import Opportunity
 from .hashtag import Hashtag  # 👈 opzionale se ti serve il modello Hashtag
 from .user import User
+from .sla_ledger import SLAEscalationLedger, SLAScanState
+from .crm_sync_state import CRMSyncState
+from .kpi_snapshot import KPISnapshot
+from .cache_version import CacheVersion
@@ -45,6 +45,7 @@ class Activity(Base):
     sub_type = relationship("SubType", backref="activities")
     tickets = relationship("Ticket", back_populates="activity", cascade="all, delete-orphan")
     detected_services = Column(String, nullable=True)
+    detected_services_source = Column(String(10), nullable=True)  # 'manual' | 'auto' | NULL (righe precedenti)
     milestone_id = Column(Integer, ForeignKey("milestones.id"), nullable=False)
     project_type = Column(String)
     opportunity_id = Column(Integer, ForeignKey("opportunities.id"))  # corretto
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, BigInteger, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class CacheVersion(Base):
+    """Versione condivisa tra i worker delle risposte in cache, incrementata dai trigger sulle tabelle sorgente"""
+    __tablename__ = "cache_versions"
+
+    name = Column(String(50), primary_key=True)  # 'catalogue'
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), nullable=False)
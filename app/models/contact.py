@@ -8,6 +8,8 @@ class Contact(Base):
     __tablename__ = "contacts"
     
     id = Column(Integer, primary_key=True, index=True)
+    crm_id = Column(Integer, unique=True, index=True)  # ID contatto CRM InCloud (chiave del sync)
+    company_id = Column(String, index=True)  # companies.id dell'azienda CRM collegata
     business_card_id = Column(String)
     nome = Column(String, nullable=False)
     cognome = Column(String, nullable=False)
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, DateTime
+from app.core.database import Base
+
+class CRMSyncState(Base):
+    """Watermark del sync CRM per entità: lastModifiedDate più recente già importata"""
+    __tablename__ = "crm_sync_state"
+
+    entity = Column(String(50), primary_key=True)  # 'companies' | 'contacts'
+    last_modified_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=False)
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.dialects.postgresql import JSONB
+from app.core.database import Base
+
+class KPISnapshot(Base):
+    """Contatori KPI precalcolati, letti dalle dashboard al posto dei COUNT live"""
+    __tablename__ = "kpi_snapshots"
+
+    key = Column(String(50), primary_key=True)  # 'tasks' | 'tickets' | 'companies' | 'activities' | 'incarichi_24'
+    data = Column(JSONB, nullable=False)
+    refreshed_at = Column(DateTime, nullable=False)
@@ -0,0 +1,15 @@
+# TEMP local stub, never commit
+from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from app.core.database import Base
+class PhaseTemplate(Base):
+    __tablename__ = "phase_templates"
+    id = Column(Integer, primary_key=True)
+    description = Column(Text)
+    order = Column(Integer)
+    milestone_id = Column(Integer, ForeignKey("milestones.id"))
+    code = Column(String)
+    type = Column(String)
+    escalation_days = Column(Integer)
+    warning_days = Column(Integer)
+from sqlalchemy.orm import relationship
+PhaseTemplate.milestone = relationship("Milestone", back_populates="phases")
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class SLAEscalationLedger(Base):
+    """Registro delle notifiche SLA (una riga per task e livello).
+
+    sent_at NULL: escalation in attesa, da inviare da notify_after in poi
+    (anche una consegna fallita resta in attesa e si ritenta).
+    """
+    __tablename__ = "sla_escalation_ledger"
+    __table_args__ = (
+        UniqueConstraint("task_id", "level", name="uq_sla_ledger_task_level"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False, index=True)
+    level = Column(String(20), nullable=False)  # 'warning' | 'escalation'
+    due_date = Column(DateTime, nullable=True)  # scadenza notificata: se cambia, si rinotifica
+    recipient = Column(String, nullable=True)
+    sent_at = Column(DateTime, server_default=func.now(), nullable=True)
+    notify_after = Column(DateTime, nullable=True)  # scadenza + escalation_days del template
+
+
+class SLAScanState(Base):
+    """Watermark dell'ultima scansione SLA completata per tipo di controllo"""
+    __tablename__ = "sla_scan_state"
+
+    scan_name = Column(String(50), primary_key=True)  # 'overdue' | 'warning'
+    last_run_at = Column(DateTime, nullable=False)
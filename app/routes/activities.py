@@ -57,6 +57,25 @@ def get_activity_tree(db: Session = Depends(get_db)):
 
     return serialize_activity_tree(activities)
 
+@router.post("/activities/services/reclassify")
+def reclassify_activity_services(dry_run: bool = False, resume: bool = True):
+    """
+    Riesegue il riconoscimento servizi su tutte le attività (job in background).
+    Con resume=True riparte dal checkpoint di un run interrotto.
+    """
+    from app.services.service_reclassifier import reclassification_job
+
+    if not reclassification_job.start_background(dry_run=dry_run, resume=resume):
+        raise HTTPException(status_code=409, detail="Riclassificazione già in corso")
+    return {"status": "started", "dry_run": dry_run, "resume": resume}
+
+@router.get("/activities/services/reclassify")
+def reclassify_activity_services_status():
+    """Avanzamento della riclassificazione servizi"""
+    from app.services.service_reclassifier import reclassification_job
+
+    return reclassification_job.status()
+
 @router.get("/activities/{activity_id}", response_model=ActivitySchema)
 def get_activity(activity_id: int, db: Session = Depends(get_db)):
     activity = db.query(Activity).filter(Activity.id == activity_id).first()
@@ -86,8 +105,9 @@ def update_detected_services(activity_id: int, payload: dict, db: Session = Depe
     if not isinstance(services, list):
         raise HTTPException(status_code=400, detail="Formato servizi non valido, deve essere una lista")
 
-    # Salva come stringa separata da virgole
+    # Salva come stringa separata da virgole; 'manual' la protegge dalla riclassificazione
     activity.detected_services = ", ".join(services)
+    activity.detected_services_source = "manual"
     db.commit()
 
     return {"success": True, "saved_services": services}
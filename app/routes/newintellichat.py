@@ -6,6 +6,7 @@ from openai import OpenAI
 import os
 import json
 from app.core.database import get_db
+from app.services.kpi_snapshots import kpi_dashboard
 from matplotlib import pyplot as plt
 import io
 import base64
@@ -59,79 +60,10 @@ def health_check():
 def get_kpi_dashboard(db: Session = Depends(get_db)):
     """
     KPI Dashboard con dati reali dal database intelligence_db
+    (snapshot KPI, un solo round trip, memorizzata per KPI_DASHBOARD_TTL secondi)
     """
     try:
-        print("🔍 Starting KPI dashboard calculation...")
-        
-        # Test database connection
-        result = db.execute(text("SELECT current_database()"))
-        current_db = result.fetchone()[0]
-        print(f"✅ Connected to database: {current_db}")
-        
-        kpi_data = {}
-        
-        # Total tasks
-        result = db.execute(text("SELECT COUNT(*) FROM tasks"))
-        kpi_data["totalTasks"] = result.fetchone()[0]
-        print(f"✅ Total tasks: {kpi_data['totalTasks']}")
-        
-        # Completed tasks (status = 'chiuso')
-        result = db.execute(text("SELECT COUNT(*) FROM tasks WHERE status = 'chiuso'"))
-        kpi_data["completedTasks"] = result.fetchone()[0]
-        print(f"✅ Completed tasks: {kpi_data['completedTasks']}")
-        
-        # Open tasks (status = 'aperto')
-        result = db.execute(text("SELECT COUNT(*) FROM tasks WHERE status = 'aperto'"))
-        kpi_data["openTasks"] = result.fetchone()[0]
-        print(f"✅ Open tasks: {kpi_data['openTasks']}")
-        
-        # Active users (distinct owners con tasks non chiusi)
-        result = db.execute(text("SELECT COUNT(DISTINCT owner) FROM tasks WHERE status != 'chiuso'"))
-        kpi_data["activeUsers"] = result.fetchone()[0]
-        print(f"✅ Active users: {kpi_data['activeUsers']}")
-        
-        # Open tickets (status = 0)
-        result = db.execute(text("SELECT COUNT(*) FROM tickets WHERE status = 0"))
-        kpi_data["openTickets"] = result.fetchone()[0]
-        print(f"✅ Open tickets: {kpi_data['openTickets']}")
-        
-        # Total tickets
-        result = db.execute(text("SELECT COUNT(*) FROM tickets"))
-        kpi_data["totalTickets"] = result.fetchone()[0]
-        print(f"✅ Total tickets: {kpi_data['totalTickets']}")
-        
-        # Companies count
-        result = db.execute(text("SELECT COUNT(*) FROM companies"))
-        kpi_data["companiesCount"] = result.fetchone()[0]
-        print(f"✅ Companies: {kpi_data['companiesCount']}")
-        
-        # Task status breakdown
-        result = db.execute(text("SELECT status, COUNT(*) FROM tasks GROUP BY status"))
-        task_status_breakdown = {row[0]: row[1] for row in result.fetchall()}
-        print(f"✅ Task status breakdown: {task_status_breakdown}")
-        
-        # Completion rate
-        total = kpi_data["totalTasks"]
-        completed = kpi_data["completedTasks"]
-        completion_rate = round((completed / total * 100), 1) if total > 0 else 0
-        
-        final_result = {
-            "totalTasks": kpi_data["totalTasks"],
-            "completedTasks": kpi_data["completedTasks"],
-            "openTasks": kpi_data["openTasks"],
-            "activeUsers": kpi_data["activeUsers"],
-            "openTickets": kpi_data["openTickets"],
-            "totalTickets": kpi_data["totalTickets"],
-            "companiesCount": kpi_data["companiesCount"],
-            "completionRate": completion_rate,
-            "taskStatusBreakdown": task_status_breakdown,
-            "databaseName": current_db,
-            "lastUpdate": pd.Timestamp.now().isoformat()
-        }
-        
-        print(f"🎯 Final KPI result: {final_result}")
-        return final_result
-        
+        return kpi_dashboard.get(db)
     except Exception as e:
         print(f"🔥 KPI Dashboard Error: {e}")
         import traceback
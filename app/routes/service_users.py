@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from sqlalchemy import text
 from typing import List
+from app.services.response_cache import catalogue_cache
 
 router = APIRouter(prefix="/service-user-associations", tags=["Service Users"])
 
@@ -97,9 +98,9 @@ async def delete_association(association_id: int, db: Session = Depends(get_db))
         raise HTTPException(500, f"Errore eliminazione: {str(e)}")
 
 @router.get("/matrix")
-async def get_association_matrix(db: Session = Depends(get_db)):
+async def get_association_matrix(request: Request, db: Session = Depends(get_db)):
     """Matrice servizi-utenti per interfaccia"""
-    try:
+    def load():
         # Ottieni tutti i servizi
         services = db.execute(text("SELECT id, code, name FROM sub_types ORDER BY code")).fetchall()
         
@@ -120,7 +121,10 @@ async def get_association_matrix(db: Session = Depends(get_db)):
             "users": [{"id": u.id, "name": u.name, "surname": u.surname} for u in users],
             "associations": association_map
         }
-        
+
         return matrix
+
+    try:
+        return catalogue_cache.respond(request, db, "service_user_matrix", load)
     except Exception as e:
         raise HTTPException(500, f"Errore matrice: {str(e)}")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from app.models.sub_type import SubType
 from app.core.database import get_db
@@ -10,7 +10,10 @@ from app.models.user import User
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 import logging
+from collections import defaultdict
 from sqlalchemy import text
+from app.services.service_catalogue import invalidate_service_catalogue
+from app.services.response_cache import catalogue_cache
 
 
 logger = logging.getLogger(__name__)
@@ -34,105 +37,117 @@ class TaskTemplateCreate(BaseModel):
     warning_days: Optional[int] = 2
     escalation_days: Optional[int] = 1
 
-# 2. MODIFICARE GET / per includere mappature multiple
-@router.get("/")
-async def get_services_tree(db: Session = Depends(get_db)):
-    """Restituisce l'alberatura completa dei servizi CON MAPPATURE MULTIPLE"""
-    try:
-        services = db.query(SubType).all()
-        result = []
-        
-        for service in services:
-            # Utenti assegnati (existing logic)
-            user_assignments = db.query(ServiceUserAssociation).filter(
-                ServiceUserAssociation.service_id == service.id
-            ).all()
-            
-            assigned_users = []
-            for assignment in user_assignments:
-                user = db.query(User).filter(User.id == assignment.user_id).first()
-                if user:
-                    assigned_users.append({
-                        "user_id": assignment.user_id,
-                        "email": user.email,
-                        "display_name": f"{user.name} {user.surname}".strip(),
-                        "role": assignment.role
-                    })
-            
-            # 🆕 NUOVA LOGICA: Ottieni commesse associate via junction table
-            commesse_associate = []
-            if not service.is_commessa:  # Solo per servizi, non per commesse
-                query = text("""
-                    SELECT c.id, c.name, c.code 
-                    FROM service_commessa_mapping scm
-                    JOIN sub_types c ON scm.commessa_id = c.id
-                    WHERE scm.service_id = :service_id
-                    ORDER BY c.name
-                """)
-                mappings = db.execute(query, {"service_id": service.id}).fetchall()
-                commesse_associate = [
-                    {"id": row.id, "name": row.name, "code": row.code}
-                    for row in mappings
-                ]
+def serialize_task_template(template) -> dict:
+    return {
+        "id": template.id,
+        "code": template.code,
+        "type": template.type,
+        "description": template.description,
+        "order": getattr(template, 'order', 0),
+        "parent_id": getattr(template, 'parent_id', None),
+        "sla_days": getattr(template, 'sla_days', 3),
+        "warning_days": getattr(template, 'warning_days', 2),
+        "escalation_days": getattr(template, 'escalation_days', 1),
+        "detailed_description": getattr(template, 'detailed_description', '')
+    }
+
+def build_services_tree(db: Session) -> List[Dict[str, Any]]:
+    """Alberatura servizi con un numero fisso di query (5), assemblata in memoria.
+
+    Una query per tabella (servizi, utenti assegnati, commesse associate,
+    milestones, task template) invece di query annidate per ogni servizio
+    e milestone: il numero di query non cresce con i servizi.
+    """
+    services = db.query(SubType).all()
+
+    # Utenti assegnati: join con users (le associazioni senza utente restano escluse)
+    users_by_service = defaultdict(list)
+    assignments = (
+        db.query(ServiceUserAssociation, User)
+        .join(User, User.id == ServiceUserAssociation.user_id)
+        .order_by(ServiceUserAssociation.id)
+        .all()
+    )
+    for assignment, user in assignments:
+        users_by_service[assignment.service_id].append({
+            "user_id": assignment.user_id,
+            "email": user.email,
+            "display_name": f"{user.name} {user.surname}".strip(),
+            "role": assignment.role
+        })
+
+    # Commesse associate via junction table
+    commesse_by_service = defaultdict(list)
+    mappings = db.execute(text("""
+        SELECT scm.service_id, c.id, c.name, c.code
+        FROM service_commessa_mapping scm
+        JOIN sub_types c ON scm.commessa_id = c.id
+        ORDER BY scm.service_id, c.name
+    """)).fetchall()
+    for row in mappings:
+        commesse_by_service[row.service_id].append({"id": row.id, "name": row.name, "code": row.code})
+
+    # Milestones e task template
+    codes = {service.code for service in services}
+    milestones = (
+        db.query(Milestone).filter(Milestone.project_type.in_(codes)).order_by(Milestone.order).all()
+        if codes else []
+    )
+    templates_by_milestone = defaultdict(list)
+    if milestones:
+        templates = (
+            db.query(PhaseTemplate)
+            .filter(PhaseTemplate.milestone_id.in_([m.id for m in milestones]))
+            .order_by(PhaseTemplate.order)
+            .all()
+        )
+        for template in templates:
+            templates_by_milestone[template.milestone_id].append(serialize_task_template(template))
+
+    milestones_by_code = defaultdict(list)
+    for milestone in milestones:
+        milestones_by_code[milestone.project_type].append({
+            "id": milestone.id,
+            "name": milestone.name,
+            "order": milestone.order,
+            "project_type": milestone.project_type,
+            "sla_days": 5,
+            "warning_days": 2,
+            "escalation_days": 3,
+            "task_templates": templates_by_milestone[milestone.id]
+        })
+
+    result = []
+    for service in services:
+        result.append({
+            "id": service.id,
+            "name": service.name,
+            "code": service.code,
+            "description": getattr(service, 'description', ''),
+            "active": getattr(service, 'active', True),
+            "is_commessa": getattr(service, "is_commessa", False),
             
-            # Milestones (existing logic)
-            milestones = db.query(Milestone).filter(
-                Milestone.project_type == service.code
-            ).order_by(Milestone.order).all()
+            # 🔄 RETROCOMPATIBILITÀ: Mantieni campo legacy per non rompere frontend esistente
+            "commessa_associata": getattr(service, "commessa_associata", ""),
             
-            milestones_data = []
-            for milestone in milestones:
-                task_templates = db.query(PhaseTemplate).filter(
-                    PhaseTemplate.milestone_id == milestone.id
-                ).order_by(PhaseTemplate.order).all()
-                
-                milestone_data = {
-                    "id": milestone.id,
-                    "name": milestone.name,
-                    "order": milestone.order,
-                    "project_type": milestone.project_type,
-                    "sla_days": 5,
-                    "warning_days": 2, 
-                    "escalation_days": 3,
-                    "task_templates": [
-                        {
-                            "id": template.id,
-                            "code": template.code,
-                            "type": template.type,
-                            "description": template.description,
-                            "order": getattr(template, 'order', 0),
-                            "parent_id": getattr(template, 'parent_id', None),
-                            "sla_days": getattr(template, 'sla_days', 3),
-                            "warning_days": getattr(template, 'warning_days', 2),
-                            "escalation_days": getattr(template, 'escalation_days', 1),
-                            "detailed_description": getattr(template, 'detailed_description', '')
-                        }
-                         for template in task_templates
-                    ] 
-                }
-                milestones_data.append(milestone_data)
+            # 🆕 Array di commesse multiple (solo per servizi, non per commesse)
+            "commesse_associate": [] if service.is_commessa else commesse_by_service[service.id],
             
-            service_data = {
-                "id": service.id,
-                "name": service.name,
-                "code": service.code,
-                "description": getattr(service, 'description', ''),
-                "active": getattr(service, 'active', True),
-                "is_commessa": getattr(service, "is_commessa", False),
-                
-                # 🔄 RETROCOMPATIBILITÀ: Mantieni campo legacy per non rompere frontend esistente
-                "commessa_associata": getattr(service, "commessa_associata", ""),
-                
-                # 🆕 NUOVA LOGICA: Array di commesse multiple
-                "commesse_associate": commesse_associate,
-                
-                "assigned_users": assigned_users,
-                "milestones": milestones_data
-            }
-            result.append(service_data)
-        
+            "assigned_users": users_by_service[service.id],
+            "milestones": milestones_by_code[service.code]
+        })
+    return result
+
+@router.get("/")
+async def get_services_tree(request: Request, db: Session = Depends(get_db)):
+    """Restituisce l'alberatura completa dei servizi CON MAPPATURE MULTIPLE"""
+    def load():
+        result = build_services_tree(db)
         logger.info(f"✅ Caricati {len(result)} servizi con mappature multiple")
         return result
+
+    try:
+        return catalogue_cache.respond(request, db, "services_tree", load)
         
     except Exception as e:
         logger.error(f"❌ Errore: {e}")
@@ -297,6 +312,7 @@ def delete_service(service_id: int, db: Session = Depends(get_db)):
         service_name = service.name
         db.delete(service)
         db.commit()
+        invalidate_service_catalogue()
         
         return {
             "message": f"Servizio '{service_name}' eliminato con successo",
@@ -340,6 +356,7 @@ def create_service(request: dict, db: Session = Depends(get_db)):
         
         db.add(service)
         db.commit()
+        invalidate_service_catalogue()
         db.refresh(service)
         
         logger.info(f"✅ Servizio creato: {name} (is_commessa: {is_commessa})")
@@ -411,6 +428,7 @@ def update_service(service_id: int, request: dict, db: Session = Depends(get_db)
             service.commessa_associata = request["commessa_associata"]
         
         db.commit()
+        invalidate_service_catalogue()
         db.refresh(service)
         
         return {"message": f"Servizio {service.name} aggiornato con successo", "service": service}
@@ -753,14 +771,20 @@ async def remove_user_from_service(
         raise HTTPException(status_code=500, detail=f"Errore rimozione utente: {str(e)}")
 
 @router.get("/services-only")
-async def get_services_only(db: Session = Depends(get_db)):
+async def get_services_only(request: Request, db: Session = Depends(get_db)):
     """Restituisce solo servizi (non commesse) per checkbox ticket"""
-    services = db.query(SubType).filter(SubType.is_commessa == False).all()
-    return [{"id": s.id, "name": s.name, "code": s.code, "commessa_associata": getattr(s, "commessa_associata", "")} for s in services]
+    def load():
+        services = db.query(SubType).filter(SubType.is_commessa == False).all()
+        return [{"id": s.id, "name": s.name, "code": s.code, "commessa_associata": getattr(s, "commessa_associata", "")} for s in services]
+
+    return catalogue_cache.respond(request, db, "services_only", load)
 
 @router.get("/commesse-only") 
-async def get_commesse_only(db: Session = Depends(get_db)):
+async def get_commesse_only(request: Request, db: Session = Depends(get_db)):
     """Restituisce solo commesse per select associazione"""
-    commesse = db.query(SubType).filter(SubType.is_commessa == True).all()
-    return [{"code": s.code, "name": s.name} for s in commesse]
+    def load():
+        commesse = db.query(SubType).filter(SubType.is_commessa == True).all()
+        return [{"code": s.code, "name": s.name} for s in commesse]
+
+    return catalogue_cache.respond(request, db, "commesse_only", load)
 
@@ -17,13 +17,23 @@ async def health_check():
         "endpoints": [
             "GET /check-overdue - Controlla task scaduti",
             "GET /check-warnings - Controlla task in scadenza",
-            "POST /run-escalation - Esegue check completo"
+            "POST /run-escalation - Esegue check completo",
+            "GET /email-metrics - Metriche coda invio email"
         ]
     }
 
+@router.get("/email-metrics")
+async def email_metrics():
+    """Profondità coda, esiti e latenze del worker di invio email"""
+    from app.services.email_service import email_service
+    return {
+        "status": "ok",
+        "metrics": email_service.delivery_stats()
+    }
+
 @router.get("/check-overdue")
 async def check_overdue_tasks(db: Session = Depends(get_db)):
-    """Controlla task scaduti e invia escalation"""
+    """Controlla task scaduti e invia escalation (esclusi quelli già nel ledger)"""
     try:
         result = sla_escalation_service.check_overdue_tasks(db)
         logger.info(f"Overdue check completed: {result}")
@@ -59,15 +69,7 @@ async def check_warning_tasks(db: Session = Depends(get_db)):
 async def run_complete_escalation(db: Session = Depends(get_db)):
     """Esegue controllo completo: overdue + warning"""
     try:
-        overdue_result = sla_escalation_service.check_overdue_tasks(db)
-        warning_result = sla_escalation_service.check_warning_tasks(db)
-        
-        result = {
-            "overdue": overdue_result,
-            "warnings": warning_result,
-            "total_escalations": overdue_result.get("escalations_sent", 0),
-            "total_warnings": warning_result.get("warnings_sent", 0)
-        }
+        result = sla_escalation_service.run_escalation(db)
         
         logger.info(f"Complete escalation run: {result}")
         return {
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.models.ticket import Ticket
@@ -54,51 +55,46 @@ def opportunity_phases(db: Session = Depends(get_db)):
                 results[label][status_key] += 1
     return results
 
+# Opportunità per tipo (prefisso del codice) e matrice fase/stato dei task
+# collegati (opportunità -> attività -> ticket -> task) in una sola query:
+# il set (type_code) conta le opportunità, (type_code, fase, status) i task
+OPPORTUNITY_BY_TYPE_SQL = text("""
+    SELECT type_code, fase, status, GROUPING(fase) AS g_fase,
+           COUNT(DISTINCT opp_id) AS opportunities, COUNT(task_id) AS tasks
+    FROM (
+        SELECT o.id AS opp_id,
+               SPLIT_PART(COALESCE(NULLIF(o.codice, ''), 'unknown'), '-', 1) AS type_code,
+               ta.id AS task_id,
+               CASE WHEN ta.id IS NOT NULL THEN COALESCE(NULLIF(ta.title, ''), 'Senza titolo') END AS fase,
+               ta.status
+        FROM opportunities o
+        -- opportunity_id è dichiarato sia String sia Integer nel modello: confronto come testo (come str(opp.id))
+        LEFT JOIN activities a ON a.opportunity_id::text = o.id::text
+        LEFT JOIN tickets t ON t.activity_id = a.id
+        LEFT JOIN tasks ta ON ta.ticket_id = t.id
+    ) x
+    GROUP BY GROUPING SETS ((type_code), (type_code, fase, status))
+    ORDER BY type_code, fase
+""")
+
 @router.get("/opportunity/by_type")
 def opportunity_by_type(db: Session = Depends(get_db)):
-    from app.models.activity import Activity  # Import locale per evitare cicli
-    from app.models.ticket import Ticket
-    from app.models.task import Task
-
-    STATUS_MAP = {
-        0: "aperto",
-        1: "in_corso",
-        2: "chiuso",
-        "aperto": "aperto",
-        "in_corso": "in_corso",
-        "chiuso": "chiuso"
-    }
-
-    opportunities = db.query(Opportunity).all()
     data = {}
-
-    for opp in opportunities:
-        code = opp.codice or "unknown"
-        type_code = code.split("-")[0] if "-" in code else code
-
-        if type_code not in data:
-            data[type_code] = {
-                "totali": 0,
-                "fasi": {}
-            }
-
-        data[type_code]["totali"] += 1
-
-        # Trova attività collegate
-        activities = db.query(Activity).filter(Activity.opportunity_id == str(opp.id)).all()
-
-        for act in activities:
-            tickets = db.query(Ticket).filter(Ticket.activity_id == act.id).all()
-            for ticket in tickets:
-                tasks = db.query(Task).filter(Task.ticket_id == ticket.id).all()
-                for task in tasks:
-                    fase = task.title or "Senza titolo"
-                    stato = STATUS_MAP.get(task.status, "unknown")
-
-                    if fase not in data[type_code]["fasi"]:
-                        data[type_code]["fasi"][fase] = {"aperto": 0, "in_corso": 0, "chiuso": 0}
-
-                    if stato in data[type_code]["fasi"][fase]:
-                        data[type_code]["fasi"][fase][stato] += 1
+    rows = db.execute(OPPORTUNITY_BY_TYPE_SQL).fetchall()
+
+    for row in rows:
+        if row.g_fase:
+            data.setdefault(row.type_code, {"totali": 0, "fasi": {}})["totali"] = row.opportunities
+
+    for row in rows:
+        if row.g_fase or row.fase is None:
+            continue
+        fasi = data[row.type_code]["fasi"]
+        if row.fase not in fasi:
+            fasi[row.fase] = {"aperto": 0, "in_corso": 0, "chiuso": 0}
+
+        stato = STATUS_MAP.get(row.status, "unknown")
+        if stato in fasi[row.fase]:
+            fasi[row.fase][stato] += row.tasks
 
     return data
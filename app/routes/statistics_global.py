@@ -1,10 +1,8 @@
-from datetime import datetime, timedelta
 from collections import Counter
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from app.core.database import get_db
-from app.models.ticket import Ticket
-from app.models.task import Task  # Import aggiunto
+from app.services.kpi_snapshots import get_kpi_snapshots, refresh_kpi_snapshots, kpi_refresher, kpi_dashboard
 
 router = APIRouter(prefix="/statistics", tags=["statistics"])
 
@@ -41,50 +39,26 @@ SERVICE_MAPPING = {
 
 @router.get("/global")
 def global_statistics(db: Session = Depends(get_db)):
-    # -------- TICKET STATS --------
-    tickets = db.query(Ticket).all()
-    today = datetime.utcnow().date()
-    green_threshold = today + timedelta(days=3)
+    # Conteggi dallo snapshot KPI (app/services/kpi_snapshots.py)
+    snapshots = get_kpi_snapshots(db)
+    tickets = snapshots["tickets"]
+    tasks = snapshots["tasks"]
 
-    by_status = Counter()
-    by_priority = Counter()
-    by_owner = Counter()
+    # -------- TICKET STATS --------
+    # Servizi contati per nome normalizzato, mappati sui codici qui (poche voci)
     service_counter = Counter()
-    semafori = {"green": 0, "yellow": 0, "red": 0}
-
-    for t in tickets:
-        by_status[t.status or 0] += 1
-        by_priority[t.priority or 0] += 1
-        by_owner[t.owner or "Sconosciuto"] += 1
-
-        if t.due_date:
-            due = t.due_date.date()
-            if due < today:
-                semafori["red"] += 1
-            elif due <= green_threshold:
-                semafori["yellow"] += 1
-            else:
-                semafori["green"] += 1
-        else:
-            semafori["red"] += 1
-
-        if t.detected_services:
-            for service in t.detected_services:
-                key = service.strip().lower()
-                code = SERVICE_MAPPING.get(key)
-                if code in VALID_SERVICES:
-                    service_counter[code] += 1
-                else:
-                    service_counter["ZZZ"] += 1
-        else:
-            service_counter["ZZZ"] += 1
+    for service, total in tickets["services"].items():
+        code = SERVICE_MAPPING.get(service)
+        service_counter[code if code in VALID_SERVICES else "ZZZ"] += total
+    if tickets["without_services"]:
+        service_counter["ZZZ"] += tickets["without_services"]
 
     tickets_stats = {
-        "total": len(tickets),
-        "by_status": dict(by_status),
-        "by_priority": dict(by_priority),
-        "semafori": semafori,
-        "by_owner": dict(by_owner),
+        "total": tickets["total"],
+        "by_status": tickets["by_status"],
+        "by_priority": tickets["by_priority"],
+        "semafori": tickets["semafori"],
+        "by_owner": tickets["by_owner"],
         "gtd_type_data": {
             "labels": [SERVICE_LABELS.get(code, code) for code in service_counter.keys()],
             "values": list(service_counter.values())
@@ -92,24 +66,23 @@ def global_statistics(db: Session = Depends(get_db)):
     }
 
     # -------- TASK STATS --------
-    tasks = db.query(Task).all()
-    task_by_status = Counter()
-    task_by_priority = Counter()
-    task_by_owner = Counter()
-
-    for task in tasks:
-        task_by_status[task.status or "sconosciuto"] += 1
-        task_by_priority[task.priority or "sconosciuto"] += 1
-        task_by_owner[task.owner or "Sconosciuto"] += 1
-
     tasks_stats = {
-        "total": len(tasks),
-        "by_status": dict(task_by_status),
-        "by_priority": dict(task_by_priority),
-        "by_owner": dict(task_by_owner)
+        "total": tasks["total"],
+        "by_status": tasks["by_status"],
+        "by_priority": tasks["by_priority"],
+        "by_owner": tasks["by_owner"]
     }
 
     return {
         "tickets_stats": tickets_stats,
-        "tasks_stats": tasks_stats
+        "tasks_stats": tasks_stats,
+        "refreshed_at": snapshots["refreshed_at"]
     }
+
+
+@router.post("/kpi/refresh")
+def refresh_kpi():
+    """Ricalcola subito gli snapshot KPI"""
+    refreshed = refresh_kpi_snapshots() is not None
+    kpi_dashboard.invalidate()
+    return {"refreshed": refreshed, "refresher": kpi_refresher.stats()}
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.core.database import get_db
 from sqlalchemy import text
 from typing import List
+from app.services.service_catalogue import invalidate_service_catalogue
 
 router = APIRouter(prefix="/sub-types", tags=["Services"])
 
@@ -47,6 +48,7 @@ async def create_sub_type(data: dict, db: Session = Depends(get_db)):
             "description": data.get("description", "")
         })
         db.commit()
+        invalidate_service_catalogue()
         
         # Recupera il nuovo record
         new_service = db.execute(text("SELECT id, name, code FROM sub_types WHERE code = :code"), {"code": code}).first()
@@ -85,6 +87,7 @@ async def update_sub_type(service_id: int, data: dict, db: Session = Depends(get
             query = f"UPDATE sub_types SET {', '.join(updates)} WHERE id = :id"
             db.execute(text(query), params)
             db.commit()
+            invalidate_service_catalogue()
         
         # Ritorna aggiornato
         updated = db.execute(text("SELECT id, name, code FROM sub_types WHERE id = :id"), {"id": service_id}).first()
@@ -112,6 +115,7 @@ async def delete_sub_type(service_id: int, db: Session = Depends(get_db)):
         # Elimina
         db.execute(text("DELETE FROM sub_types WHERE id = :id"), {"id": service_id})
         db.commit()
+        invalidate_service_catalogue()
         
         return {"message": "Servizio eliminato con successo"}
     except HTTPException:
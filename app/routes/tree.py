@@ -1,15 +1,273 @@
-from fastapi import APIRouter, Depends
+import base64
+from collections import defaultdict
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, case
 from sqlalchemy.orm import Session, joinedload
 from app.core.database import get_db
 from app.models.ticket import Ticket
 from app.models.task import Task
 from app.models.activity import Activity
+from app.models.company import Company
 from app.models.opportunity import Opportunity
 from app.models.milestone import Milestone
 from app.models.phase_template import PhaseTemplate
 
 router = APIRouter(prefix="/treeview", tags=["treeview"])
 
+TREE_PAGE_SIZE = 50
+TREE_PAGE_SIZE_MAX = 200
+I24_PREFIX = "TCK-I24"
+
+# Chiavi sempre presenti nei nodi ticket/task anche con selezione dei campi
+STRUCTURAL_FIELDS = {"id", "tasks", "tasks_count", "sort_order"}
+
+
+def serialize_tree_task(task, task_order_map) -> dict:
+    return {
+        "id": task.id,
+        "title": task.title,
+        "status": task.status,
+        "priority": task.priority,
+        "order": task_order_map.get(task.title, 9999)
+    }
+
+
+def sort_tree_tasks(tasks, task_order_map) -> List[dict]:
+    """Task ordinati come nei template di fase"""
+    return sorted(
+        [serialize_tree_task(t, task_order_map) for t in tasks],
+        key=lambda x: x["order"] if x["order"] is not None else 9999
+    )
+
+
+def serialize_tree_ticket(ticket, customer_name, task_order_map, include_tasks: bool = True) -> dict:
+    """Nodo ticket dell'albero, con i task ordinati come nei template di fase"""
+    data = {
+        "id": ticket.id,
+        "ticket_code": ticket.ticket_code,
+        "title": ticket.title,
+        "customer_name": customer_name,
+        "gtd_generated": ticket.gtd_generated,
+        "milestone": {
+            "id": ticket.milestone.id,
+            "name": ticket.milestone.name
+        } if ticket.milestone else None,
+        "activity": {
+            "id": ticket.activity.id if ticket.activity else None,
+            "description": ticket.activity.description if ticket.activity else None,
+        },
+    }
+    if include_tasks:
+        data["tasks"] = sort_tree_tasks(ticket.tasks, task_order_map)
+    return data
+
+
+def ticket_sort_order(ticket, milestone_order_by_ticket) -> int:
+    """Ordine della milestone dei task del ticket, altrimenti il numero finale del codice"""
+    if ticket.id in milestone_order_by_ticket:
+        return milestone_order_by_ticket[ticket.id]
+    suffix = ticket.ticket_code.split("-")[-1]
+    return int(suffix) if suffix.isdigit() else 999
+
+
+# ===== CARICAMENTI IN BLOCCO (una query ciascuno) =====
+
+def load_task_order_map(db: Session) -> Dict[str, int]:
+    return {pt.description: pt.order for pt in db.query(PhaseTemplate).all()}
+
+
+def load_activity_counts(db: Session, opp_ids) -> Dict[str, int]:
+    """opportunity_id (stringa) -> numero di attività"""
+    if not opp_ids:
+        return {}
+    return {
+        str(opportunity_id): count for opportunity_id, count in db.query(
+            Activity.opportunity_id, func.count(Activity.id)
+        ).filter(Activity.opportunity_id.in_(list(opp_ids))).group_by(Activity.opportunity_id).all()
+    }
+
+
+def load_milestone_orders(db: Session, ticket_ids) -> Dict[int, int]:
+    """ticket_id -> ordine della milestone dei suoi task"""
+    milestone_order_by_ticket = {}
+    if ticket_ids:
+        for ticket_id, order in db.query(Task.ticket_id, Milestone.order).join(
+            Milestone, Task.milestone_id == Milestone.id
+        ).filter(Task.ticket_id.in_(list(ticket_ids))).all():
+            milestone_order_by_ticket.setdefault(ticket_id, order)
+    return milestone_order_by_ticket
+
+
+def load_task_counts(db: Session, ticket_ids) -> Dict[int, int]:
+    if not ticket_ids:
+        return {}
+    return dict(db.query(Task.ticket_id, func.count(Task.id)).filter(
+        Task.ticket_id.in_(list(ticket_ids))
+    ).group_by(Task.ticket_id).all())
+
+
+def load_ticket_counts(db: Session, opp_ids) -> Dict[str, int]:
+    """opportunity_id (stringa) -> numero di ticket generati dalle sue attività"""
+    if not opp_ids:
+        return {}
+    return {
+        str(opportunity_id): count for opportunity_id, count in db.query(
+            Activity.opportunity_id, func.count(Ticket.id)
+        ).join(Ticket, Ticket.activity_id == Activity.id).filter(
+            Activity.opportunity_id.in_(list(opp_ids))
+        ).group_by(Activity.opportunity_id).all()
+    }
+
+
+def load_commessa_opportunities(db: Session, i24_tickets: Dict[str, Ticket]) -> Dict[str, List[Opportunity]]:
+    """cliente -> opportunità della commessa (codice che contiene -<id ticket I24>)"""
+    if not i24_tickets:
+        return {}
+    opps_by_customer = defaultdict(list)
+    for opp in db.query(Opportunity).filter(Opportunity.cliente.in_(list(i24_tickets))).all():
+        opps_by_customer[opp.cliente].append(opp)
+    return {
+        customer_name: [opp for opp in opps_by_customer[customer_name] if f"-{ticket.id}" in (opp.codice or "")]
+        for customer_name, ticket in i24_tickets.items()
+    }
+
+
+def customer_name_expr():
+    """Nome cliente come in get_company_tree: customer_name, poi nome azienda (stringhe vuote come NULL)"""
+    return func.coalesce(func.nullif(Ticket.customer_name, ""), func.nullif(Company.nome, ""), "(Sconosciuto)")
+
+
+def load_i24_tickets(db: Session, customer_names, with_tasks: bool = False) -> Dict[str, Ticket]:
+    """cliente -> primo ticket I24 (unica commessa per cliente)"""
+    if not customer_names:
+        return {}
+    name = customer_name_expr()
+    options = [joinedload(Ticket.activity), joinedload(Ticket.milestone)]
+    if with_tasks:
+        options.append(joinedload(Ticket.tasks))
+    rows = db.query(Ticket, name).outerjoin(Company, Ticket.company_id == Company.id).options(*options).filter(
+        name.in_(list(customer_names)), Ticket.ticket_code.like(f"{I24_PREFIX}%")
+    ).order_by(Ticket.id).all()
+    i24_tickets = {}
+    for ticket, customer_name in rows:
+        i24_tickets.setdefault(customer_name, ticket)
+    return i24_tickets
+
+
+def load_opportunity_tickets(db: Session, opp_ids, with_tasks: bool = False) -> Dict[str, List[Ticket]]:
+    """opportunity_id (stringa) -> ticket generati dalle sue attività"""
+    if not opp_ids:
+        return {}
+    options = [joinedload(Ticket.activity), joinedload(Ticket.milestone)]
+    if with_tasks:
+        options.append(joinedload(Ticket.tasks))
+    tickets_by_opportunity = defaultdict(list)
+    for ticket in db.query(Ticket).join(Activity, Ticket.activity_id == Activity.id).options(*options).filter(
+        Activity.opportunity_id.in_(list(opp_ids))
+    ).order_by(Ticket.id).all():
+        tickets_by_opportunity[str(ticket.activity.opportunity_id)].append(ticket)
+    return tickets_by_opportunity
+
+
+# ===== NODI DELL'ALBERO PAGINATO =====
+
+def pick_fields(node: dict, fields: Optional[set]) -> dict:
+    if not fields:
+        return node
+    return {key: value for key, value in node.items() if key in fields or key in STRUCTURAL_FIELDS}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[set]:
+    return {f.strip() for f in fields.split(",") if f.strip()} if fields else None
+
+
+def encode_cursor(name: str) -> str:
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+
+
+def build_ticket_nodes(db: Session, tickets: List[Ticket], depth: int, task_order_map, milestone_order_by_ticket,
+                       fields=None) -> List[dict]:
+    """Nodi ticket ordinati per milestone; depth >= 1 include i task, altrimenti solo tasks_count"""
+    task_counts = {} if depth >= 1 else load_task_counts(db, [t.id for t in tickets])
+    nodes = []
+    for ticket in tickets:
+        node = serialize_tree_ticket(ticket, ticket.customer_name, task_order_map, include_tasks=depth >= 1)
+        if depth < 1:
+            node["tasks_count"] = task_counts.get(ticket.id, 0)
+        node["sort_order"] = ticket_sort_order(ticket, milestone_order_by_ticket)
+        nodes.append(node)
+    nodes.sort(key=lambda t: t["sort_order"])
+    if fields:
+        for node in nodes:
+            if "tasks" in node:
+                node["tasks"] = [pick_fields(t, fields) for t in node["tasks"]]
+    return [pick_fields(node, fields) for node in nodes]
+
+
+def build_opportunity_ticket_nodes(db: Session, opp_ids, depth: int, task_order_map, fields=None) -> Dict[str, List[dict]]:
+    """opportunity_id (stringa) -> nodi ticket ordinati per milestone"""
+    tickets_by_opportunity = load_opportunity_tickets(db, opp_ids, with_tasks=depth >= 1)
+    milestone_orders = load_milestone_orders(db, [t.id for ts in tickets_by_opportunity.values() for t in ts])
+    return {
+        opp_id: build_ticket_nodes(db, tickets, depth, task_order_map, milestone_orders, fields)
+        for opp_id, tickets in tickets_by_opportunity.items()
+    }
+
+
+def build_commessa_nodes(db: Session, customer_names, depth: int, fields=None) -> Dict[str, dict]:
+    """cliente -> nodo commessa.
+
+    depth 0: titolo, ticket I24 e numero di opportunità
+    depth 1: + opportunità (con tickets_count)
+    depth 2: + ticket delle opportunità (con tasks_count) e task del ticket I24
+    depth 3: + task dei ticket delle opportunità
+    """
+    i24_tickets = load_i24_tickets(db, customer_names, with_tasks=depth >= 2)
+    if not i24_tickets:
+        return {}
+    commessa_opps = load_commessa_opportunities(db, i24_tickets)
+    opp_ids = [opp.id for opps in commessa_opps.values() for opp in opps]
+    task_order_map = load_task_order_map(db) if depth >= 2 else {}
+
+    activity_counts = load_activity_counts(db, opp_ids) if depth >= 1 else {}
+    ticket_nodes = build_opportunity_ticket_nodes(db, opp_ids, depth - 2, task_order_map, fields) if depth >= 2 else {}
+    tickets_count = load_ticket_counts(db, opp_ids) if depth == 1 else {}
+
+    commesse = {}
+    for customer_name, i24_ticket in i24_tickets.items():
+        i24_node = serialize_tree_ticket(i24_ticket, customer_name, task_order_map, include_tasks=depth >= 2)
+        node = {
+            "title": f"Commessa Incarico 24 mesi per {customer_name}",
+            "tickets": [pick_fields(i24_node, fields)],
+            "opportunities_count": len(commessa_opps[customer_name]),
+        }
+        if depth >= 1:
+            opportunities = []
+            for opp in commessa_opps[customer_name]:
+                opp_node = {
+                    "opportunity_code": opp.codice,
+                    "title": opp.titolo,
+                    "id": opp.id,
+                    "has_activities": activity_counts.get(str(opp.id), 0) > 0,
+                }
+                if depth >= 2:
+                    opp_node["tickets"] = ticket_nodes.get(str(opp.id), [])
+                else:
+                    opp_node["tickets_count"] = tickets_count.get(str(opp.id), 0)
+                opportunities.append(opp_node)
+            node["opportunities"] = opportunities
+        commesse[customer_name] = node
+    return commesse
+
+
 @router.get("/companies")
 def get_company_tree(db: Session = Depends(get_db)):
     tickets = db.query(Ticket).options(
@@ -20,11 +278,16 @@ def get_company_tree(db: Session = Depends(get_db)):
     ).all()
 
     # mappa per ordinamento task
-    task_order_map = {
-        pt.description: pt.order for pt in db.query(PhaseTemplate).all()
-    }
+    task_order_map = load_task_order_map(db)
+
+    # Indici costruiti una volta: niente scansioni di tickets per ogni opportunità
+    tickets_by_opportunity = defaultdict(list)
+    for ticket in tickets:
+        if ticket.activity and ticket.activity.opportunity_id is not None:
+            tickets_by_opportunity[str(ticket.activity.opportunity_id)].append(ticket)
 
     companies = {}
+    i24_tickets = {}  # cliente -> primo ticket I24 (unica commessa per cliente)
 
     for ticket in tickets:
         customer_name = (
@@ -40,98 +303,123 @@ def get_company_tree(db: Session = Depends(get_db)):
                 "opportunities": []
             }
 
-        ticket_data = {
-            "id": ticket.id,
-            "ticket_code": ticket.ticket_code,
-            "title": ticket.title,
-            "customer_name": customer_name,
-            "gtd_generated": ticket.gtd_generated,
-            "milestone": {
-                "id": ticket.milestone.id if ticket.milestone else None,
-                "name": ticket.milestone.name if ticket.milestone else None
-            } if ticket.milestone else None,
-            "activity": {
-                "id": ticket.activity.id if ticket.activity else None,
-                "description": ticket.activity.description if ticket.activity else None,
-            },
-            "tasks": sorted([
-                {
-                    "id": t.id,
-                    "title": t.title,
-                    "status": t.status,
-                    "priority": t.priority,
-                    "order": task_order_map.get(t.title, 9999)
-                } for t in ticket.tasks
-            ], key=lambda x: x["order"] if x["order"] is not None else 9999)
-        }
+        if ticket.ticket_code.startswith(I24_PREFIX) and customer_name not in i24_tickets:
+            i24_tickets[customer_name] = ticket
 
-        if ticket.ticket_code.startswith("TCK-I24") and companies[customer_name]["commessa"] is None:
-            # unica commessa per cliente
-            i24_id = ticket.id
-            derived_opportunities = []
-
-            crm_opps = db.query(Opportunity).filter(Opportunity.cliente == customer_name).all()
-            for opp in crm_opps:
-                if f"-{i24_id}" in opp.codice:
-                    has_activities = db.query(Activity).filter(Activity.opportunity_id == str(opp.id)).count() > 0
-
-                    derived_tickets = []
-                    for derived_ticket in tickets:
-                        if (
-                            derived_ticket.activity and
-                            derived_ticket.activity.opportunity_id == str(opp.id)
-                        ):
-                            derived_ticket_data = {
-                                "id": derived_ticket.id,
-                                "ticket_code": derived_ticket.ticket_code,
-                                "title": derived_ticket.title,
-                                "customer_name": derived_ticket.customer_name,
-                                "gtd_generated": derived_ticket.gtd_generated,
-                                "milestone": {
-                                    "id": derived_ticket.milestone.id if derived_ticket.milestone else None,
-                                    "name": derived_ticket.milestone.name if derived_ticket.milestone else None
-                                } if derived_ticket.milestone else None,
-                                "activity": {
-                                    "id": derived_ticket.activity.id if derived_ticket.activity else None,
-                                    "description": derived_ticket.activity.description if derived_ticket.activity else None,
-                                },
-                                "tasks": sorted([
-                                    {
-                                        "id": t.id,
-                                        "title": t.title,
-                                        "status": t.status,
-                                        "priority": t.priority,
-                                        "order": task_order_map.get(t.title, 9999)
-                                    } for t in derived_ticket.tasks
-                                ], key=lambda x: x["order"] if x["order"] is not None else 9999)
-                            }
-
-                            milestone_query = db.query(Milestone).join(
-                                Task, Task.milestone_id == Milestone.id
-                            ).filter(Task.ticket_id == derived_ticket.id).first()
-
-                            derived_ticket_data["sort_order"] = (
-                                milestone_query.order if milestone_query else
-                                int(derived_ticket.ticket_code.split("-")[-1]) if derived_ticket.ticket_code.split("-")[-1].isdigit()
-                                else 999
-                            )
-
-                            derived_tickets.append(derived_ticket_data)
-
-                    derived_tickets.sort(key=lambda t: t.get("sort_order", 999))
-
-                    derived_opportunities.append({
-                        "opportunity_code": opp.codice,
-                        "title": opp.titolo,
-                        "id": opp.id,
-                        "has_activities": has_activities,
-                        "tickets": derived_tickets
-                    })
-
-            companies[customer_name]["commessa"] = {
-                "title": f"Commessa Incarico 24 mesi per {customer_name}",
-                "tickets": [ticket_data],
-                "opportunities": derived_opportunities
-            }
+    if not i24_tickets:
+        return list(companies.values())
+
+    commessa_opps = load_commessa_opportunities(db, i24_tickets)
+    opp_ids = [opp.id for opps in commessa_opps.values() for opp in opps]
+    activity_count_by_opportunity = load_activity_counts(db, opp_ids)
+    milestone_order_by_ticket = load_milestone_orders(
+        db, [t.id for opp_id in opp_ids for t in tickets_by_opportunity.get(str(opp_id), [])]
+    )
+
+    for customer_name, i24_ticket in i24_tickets.items():
+        derived_opportunities = []
+        for opp in commessa_opps[customer_name]:
+            derived_tickets = []
+            for derived_ticket in tickets_by_opportunity.get(str(opp.id), []):
+                derived_ticket_data = serialize_tree_ticket(derived_ticket, derived_ticket.customer_name, task_order_map)
+                derived_ticket_data["sort_order"] = ticket_sort_order(derived_ticket, milestone_order_by_ticket)
+                derived_tickets.append(derived_ticket_data)
+
+            derived_tickets.sort(key=lambda t: t.get("sort_order", 999))
+
+            derived_opportunities.append({
+                "opportunity_code": opp.codice,
+                "title": opp.titolo,
+                "id": opp.id,
+                "has_activities": activity_count_by_opportunity.get(str(opp.id), 0) > 0,
+                "tickets": derived_tickets
+            })
+
+        companies[customer_name]["commessa"] = {
+            "title": f"Commessa Incarico 24 mesi per {customer_name}",
+            "tickets": [serialize_tree_ticket(i24_ticket, customer_name, task_order_map)],
+            "opportunities": derived_opportunities
+        }
 
     return list(companies.values())
+
+
+@router.get("/companies/page")
+def get_company_tree_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(TREE_PAGE_SIZE, ge=1, le=TREE_PAGE_SIZE_MAX),
+    depth: int = Query(0, ge=0, le=4),
+    fields: Optional[str] = Query(None, description="Campi di ticket e task, separati da virgola"),
+    db: Session = Depends(get_db)
+):
+    """Clienti dell'albero a pagine (cursore sul nome), espandibili con gli endpoint figli.
+
+    depth 0: solo clienti (con tickets_count e has_commessa), 1: + commessa,
+    2: + opportunità, 3: + ticket, 4: + task
+    """
+    name = customer_name_expr()
+    query = db.query(
+        name.label("name"),
+        func.count(Ticket.id).label("tickets_count"),
+        func.max(case((Ticket.ticket_code.like(f"{I24_PREFIX}%"), 1), else_=0)).label("has_commessa"),
+    ).outerjoin(Company, Ticket.company_id == Company.id)
+    if cursor:
+        query = query.filter(name > decode_cursor(cursor))
+    rows = query.group_by(name).order_by(name).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [{
+        "name": row.name,
+        "tickets_count": row.tickets_count,
+        "has_commessa": bool(row.has_commessa),
+    } for row in rows]
+
+    if depth >= 1:
+        commesse = build_commessa_nodes(db, [i["name"] for i in items if i["has_commessa"]], depth - 1,
+                                        parse_fields(fields))
+        for item in items:
+            item["commessa"] = commesse.get(item["name"])
+
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(rows[-1].name) if has_more else None,
+        "limit": limit,
+    }
+
+
+@router.get("/commessa")
+def get_company_commessa(
+    customer: str,
+    depth: int = Query(1, ge=0, le=3),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Commessa I24 di un cliente (nome come in /companies/page)"""
+    commessa = build_commessa_nodes(db, [customer], depth, parse_fields(fields)).get(customer)
+    if not commessa:
+        raise HTTPException(status_code=404, detail="Commessa non trovata")
+    return commessa
+
+
+@router.get("/opportunities/{opportunity_id}/tickets")
+def get_opportunity_tickets(
+    opportunity_id: int,
+    depth: int = Query(0, ge=0, le=1),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Ticket di un'opportunità ordinati per milestone; depth=1 include i task"""
+    task_order_map = load_task_order_map(db) if depth >= 1 else {}
+    nodes = build_opportunity_ticket_nodes(db, [opportunity_id], depth, task_order_map, parse_fields(fields))
+    return nodes.get(str(opportunity_id), [])
+
+
+@router.get("/tickets/{ticket_id}/tasks")
+def get_ticket_tasks(ticket_id: int, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """Task di un ticket, ordinati come nei template di fase"""
+    if not db.query(Ticket.id).filter(Ticket.id == ticket_id).first():
+        raise HTTPException(status_code=404, detail="Ticket non trovato")
+    tasks = db.query(Task).filter(Task.ticket_id == ticket_id).all()
+    selected = parse_fields(fields)
+    return [pick_fields(t, selected) for t in sort_tree_tasks(tasks, load_task_order_map(db))]
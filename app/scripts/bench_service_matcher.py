@@ -0,0 +1,119 @@
+"""Micro-benchmark: matcher compilato vs cicli di ricerca per frase.
+
+Uso: python -m app.scripts.bench_service_matcher [descrizioni] [ripetizioni]
+
+Confronta, sulle stesse descrizioni di attività, i vecchi cicli (una regex
+per chiave di PROCESS_CODE_MAP, `in` per ogni voce del catalogo) con
+PhraseMatcher, e verifica che i risultati coincidano. service_detection
+resta con il ciclo semplice: con le poche KEYWORDS il matcher non guadagna.
+Se process_code_map non è importabile usa un campione di chiavi realistico.
+"""
+import random
+import re
+import sys
+import time
+
+from app.services.service_catalogue import SERVICE_SYNONYMS, FALLBACK_SERVICES, build_entries
+from app.services.service_matcher import PhraseMatcher
+from app.utils.service_detection import KEYWORDS
+
+try:
+    from process_code_map import PROCESS_CODE_MAP
+except ImportError:
+    PROCESS_CODE_MAP = {
+        "incarico 24 mesi": "I24", "formazione 4.0": "F40", "transizione 5.0": "T50",
+        "know how": "KHW", "patent box": "PBX", "bandi": "BND", "finanziamenti": "FND",
+        "cashback": "CBK", "credito d'imposta": "CDI", "industria 4.0": "I40",
+        "nuova sabatini": "SAB", "simest": "SIM", "ricerca e sviluppo": "RSV",
+        "consulenza": "CON", "check up": "CHK", "rating di legalità": "RDL",
+        "certificazione iso": "ISO", "welfare": "WLF", "fondimpresa": "FIM", "brevetti": "BRV",
+    }
+
+CATALOGUE = build_entries(FALLBACK_SERVICES + [
+    ("CBK", "Cashback"), ("I40", "Industria 4.0"), ("SAB", "Nuova Sabatini"),
+    ("SIM", "Simest"), ("RSV", "Ricerca e Sviluppo"), ("WLF", "Welfare"),
+])
+
+FILLER = (
+    "chiamata con il cliente per fare il punto sulla documentazione, inviata mail di riepilogo "
+    "al referente amministrativo, da ricontattare la prossima settimana per fissare appuntamento "
+    "in sede, il titolare chiede informazioni su tempi e costi e sulla possibilità di avviare "
+    "il progetto entro fine anno, verificare visura e bilanci degli ultimi tre esercizi"
+).split(", ")
+
+
+def make_descriptions(count: int):
+    rnd = random.Random(42)
+    phrases = list(PROCESS_CODE_MAP) + [p for e in CATALOGUE for p in e.phrases] + \
+        [kw for kws in KEYWORDS.values() for kw in kws]
+    descriptions = []
+    for _ in range(count):
+        parts = rnd.sample(FILLER, 3) + rnd.sample(phrases, rnd.randint(0, 3))
+        rnd.shuffle(parts)
+        descriptions.append(", ".join(parts).capitalize() + ".")
+    return descriptions
+
+
+# --- Implementazioni precedenti (per confronto) ---
+
+def old_project_codes(description):
+    description_lower = description.lower()
+    matches = []
+    for key, code in PROCESS_CODE_MAP.items():
+        pattern = r'\b' + re.escape(key.lower()) + r'\b'
+        if re.search(pattern, description_lower):
+            matches.append(code)
+    return matches
+
+
+def old_catalogue_codes(description, mapping):
+    description = description.lower()
+    return {code for phrase, code in mapping.items() if phrase in description}
+
+
+# --- Implementazioni con matcher compilato ---
+
+PROCESS_MATCHER = PhraseMatcher(PROCESS_CODE_MAP.keys(), whole_words=True)
+CATALOGUE_MATCHER = PhraseMatcher(p for e in CATALOGUE for p in e.phrases)
+
+
+def new_project_codes(description):
+    found = PROCESS_MATCHER.find(description)
+    return [code for key, code in PROCESS_CODE_MAP.items() if key.lower() in found]
+
+
+def new_catalogue_codes(description, mapping):
+    return {mapping[p] for p in CATALOGUE_MATCHER.find(description)}
+
+
+def bench(label, fn, descriptions, repeat, *args):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for description in descriptions:
+            fn(description, *args)
+    elapsed = time.perf_counter() - started
+    per_call = elapsed / (repeat * len(descriptions)) * 1e6
+    print(f"   {label:<10} {per_call:8.1f} µs/descrizione")
+    return per_call
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    descriptions = make_descriptions(count)
+    mapping = {p: e.code for e in CATALOGUE for p in e.phrases}
+
+    cases = [
+        ("PROCESS_CODE_MAP (ticket_generator)", old_project_codes, new_project_codes, ()),
+        ("Catalogo servizi (crm_parser)", old_catalogue_codes, new_catalogue_codes, (mapping,)),
+    ]
+    ok = True
+    print(f"📏 {count} descrizioni x {repeat} ripetizioni, sinonimi sample: {len(SERVICE_SYNONYMS)}")
+    for title, old, new, args in cases:
+        mismatches = sum(1 for d in descriptions if old(d, *args) != new(d, *args))
+        ok = ok and mismatches == 0
+        print(f"\n🧪 {title}: {'✅ risultati identici' if not mismatches else f'❌ {mismatches} differenze'}")
+        before = bench("cicli", old, descriptions, repeat, *args)
+        after = bench("matcher", new, descriptions, repeat, *args)
+        print(f"   ⚡ {before / after:.1f}x")
+    sys.exit(0 if ok else 1)
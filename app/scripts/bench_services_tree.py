@@ -0,0 +1,120 @@
+"""Benchmark query dell'alberatura servizi (GET /api/services-tree/).
+
+Uso: python -m app.scripts.bench_services_tree [servizi ...]
+
+Popola un database SQLite in memoria con N servizi (ognuno con utenti,
+commesse, milestones e task template), conta le query eseguite dalla
+vecchia versione con cicli annidati e da build_services_tree, e verifica
+che il JSON prodotto sia identico.
+"""
+import sys
+import time
+from collections import defaultdict
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models.milestone import Milestone
+from app.models.phase_template import PhaseTemplate
+from app.models.service_user_association import ServiceUserAssociation
+from app.models.sub_type import SubType
+from app.models.user import User
+from app.routes.services_tree import build_services_tree, serialize_task_template
+
+MILESTONES_PER_SERVICE = 3
+TEMPLATES_PER_MILESTONE = 4
+USERS_PER_SERVICE = 2
+
+
+def legacy_services_tree(db):
+    """Versione precedente: query per servizio, per associazione e per milestone"""
+    result = []
+    for service in db.query(SubType).all():
+        assigned_users = []
+        for assignment in db.query(ServiceUserAssociation).filter(ServiceUserAssociation.service_id == service.id).all():
+            user = db.query(User).filter(User.id == assignment.user_id).first()
+            if user:
+                assigned_users.append({"user_id": assignment.user_id, "email": user.email,
+                                       "display_name": f"{user.name} {user.surname}".strip(), "role": assignment.role})
+        commesse_associate = []
+        if not service.is_commessa:
+            mappings = db.execute(text("""
+                SELECT c.id, c.name, c.code FROM service_commessa_mapping scm
+                JOIN sub_types c ON scm.commessa_id = c.id
+                WHERE scm.service_id = :service_id ORDER BY c.name
+            """), {"service_id": service.id}).fetchall()
+            commesse_associate = [{"id": r.id, "name": r.name, "code": r.code} for r in mappings]
+        milestones_data = []
+        for milestone in db.query(Milestone).filter(Milestone.project_type == service.code).order_by(Milestone.order).all():
+            templates = db.query(PhaseTemplate).filter(PhaseTemplate.milestone_id == milestone.id).order_by(PhaseTemplate.order).all()
+            milestones_data.append({"id": milestone.id, "name": milestone.name, "order": milestone.order,
+                                    "project_type": milestone.project_type, "sla_days": 5, "warning_days": 2,
+                                    "escalation_days": 3, "task_templates": [serialize_task_template(t) for t in templates]})
+        result.append({"id": service.id, "name": service.name, "code": service.code,
+                       "description": getattr(service, 'description', ''), "active": getattr(service, 'active', True),
+                       "is_commessa": getattr(service, "is_commessa", False),
+                       "commessa_associata": getattr(service, "commessa_associata", ""),
+                       "commesse_associate": commesse_associate, "assigned_users": assigned_users,
+                       "milestones": milestones_data})
+    return result
+
+
+def make_session(services: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[t.__table__ for t in (SubType, User, ServiceUserAssociation, Milestone, PhaseTemplate)])
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE service_commessa_mapping (service_id INTEGER, commessa_id INTEGER)"))
+
+    db = sessionmaker(bind=engine)()
+    commesse = [SubType(name=f"Commessa {i}", code=f"C{i:03d}", is_commessa=True) for i in range(5)]
+    db.add_all(commesse)
+    db.add_all(User(id=f"u{i}", name=f"Nome{i}", surname=f"Cognome{i}", email=f"u{i}@example.com") for i in range(20))
+    db.flush()
+    for n in range(services):
+        service = SubType(name=f"Servizio {n}", code=f"S{n:04d}", is_commessa=False)
+        db.add(service)
+        db.flush()
+        for k in range(USERS_PER_SERVICE):
+            db.add(ServiceUserAssociation(service_id=service.id, user_id=f"u{(n + k) % 20}", role="responsible"))
+        db.execute(text("INSERT INTO service_commessa_mapping VALUES (:s, :c)"),
+                   {"s": service.id, "c": commesse[n % len(commesse)].id})
+        for m in range(MILESTONES_PER_SERVICE):
+            milestone = Milestone(name=f"Fase {m}", project_type=service.code, order=m)
+            db.add(milestone)
+            db.flush()
+            for t in range(TEMPLATES_PER_MILESTONE):
+                db.add(PhaseTemplate(code=f"T{t}", type="task", description=f"Task {t}", order=t, milestone_id=milestone.id))
+    db.commit()
+    return engine, db
+
+
+def count_queries(engine, db, builder):
+    counter = {"queries": 0}
+
+    def on_execute(*args):
+        counter["queries"] += 1
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    db.expire_all()
+    started = time.perf_counter()
+    tree = builder(db)
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "before_cursor_execute", on_execute)
+    return tree, counter["queries"], elapsed
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 50, 200]
+    ok = True
+    print(f"{'servizi':>8} {'query prima':>12} {'query dopo':>11} {'ms prima':>9} {'ms dopo':>8}  JSON")
+    for size in sizes:
+        engine, db = make_session(size)
+        old_tree, old_queries, old_elapsed = count_queries(engine, db, legacy_services_tree)
+        new_tree, new_queries, new_elapsed = count_queries(engine, db, build_services_tree)
+        same = old_tree == new_tree
+        ok = ok and same
+        print(f"{size:>8} {old_queries:>12} {new_queries:>11} {old_elapsed * 1000:>9.1f} {new_elapsed * 1000:>8.1f}  "
+              f"{'✅ identico' if same else '❌ diverso'}")
+        db.close()
+    sys.exit(0 if ok else 1)
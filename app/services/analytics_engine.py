@@ -8,6 +8,7 @@ import plotly.graph_objects as go
 import plotly.express as px
 from sqlalchemy.orm import Session
 from app.core.database import SessionLocal
+from app.services.kpi_snapshots import get_kpi_snapshots
 
 class AnalyticsEngine:
     def __init__(self):
@@ -184,15 +185,12 @@ class AnalyticsEngine:
         Dashboard KPI business critical
         """
         kpis = {}
+        # Conteggi dallo snapshot KPI (app/services/kpi_snapshots.py)
+        activities = get_kpi_snapshots(self.session)["activities"]
         
         # KPI 1: Attività questo mese vs mese scorso
-        sql_current = "SELECT COUNT(*) FROM activities WHERE creation_date >= DATE_TRUNC('month', NOW())"
-        sql_previous = """SELECT COUNT(*) FROM activities 
-                         WHERE creation_date >= DATE_TRUNC('month', NOW() - INTERVAL '1 month')
-                         AND creation_date < DATE_TRUNC('month', NOW())"""
-        
-        current_month = self.session.execute(sql_current).scalar()
-        previous_month = self.session.execute(sql_previous).scalar()
+        current_month = activities["current_month"]
+        previous_month = activities["previous_month"]
         growth_rate = ((current_month - previous_month) / previous_month * 100) if previous_month > 0 else 0
         
         kpis['attivita_mensili'] = {
@@ -202,14 +200,9 @@ class AnalyticsEngine:
             'trend': '📈' if growth_rate > 0 else '📉'
         }
         
-        # KPI 2: Tasso completamento
-        sql_completion = """
-        SELECT 
-            COUNT(CASE WHEN status = 'completed' THEN 1 END) * 100.0 / COUNT(*) as completion_rate
-        FROM activities 
-        WHERE creation_date >= NOW() - INTERVAL '30 days'
-        """
-        completion_rate = self.session.execute(sql_completion).scalar() or 0
+        # KPI 2: Tasso completamento (ultimi 30 giorni)
+        last_30_days = activities["last_30_days"]
+        completion_rate = activities["completed_30_days"] * 100.0 / last_30_days if last_30_days else 0
         
         kpis['completion_rate'] = {
             'valore': round(completion_rate, 1),
@@ -217,19 +210,8 @@ class AnalyticsEngine:
             'status': '✅' if completion_rate >= 85 else '⚠️'
         }
         
-        # KPI 3: Distribuzione servizi
-        sql_services = """
-        SELECT 
-            jsonb_array_elements_text(detected_services) as servizio,
-            COUNT(*) as count
-        FROM activities 
-        WHERE detected_services IS NOT NULL 
-        AND creation_date >= NOW() - INTERVAL '30 days'
-        GROUP BY servizio
-        ORDER BY count DESC
-        LIMIT 5
-        """
-        services_result = self.session.execute(sql_services).fetchall()
+        # KPI 3: Distribuzione servizi (top 5, ultimi 30 giorni)
+        services_result = [(row["servizio"], row["count"]) for row in activities["services_30_days"]]
         services_df = pd.DataFrame(services_result, columns=['servizio', 'count'])
         
         # Grafico a torta servizi
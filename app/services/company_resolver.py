@@ -0,0 +1,170 @@
+# app/services/company_resolver.py
+
+import math
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+# Soglie storiche di get_company_id_by_name. Il punteggio è un Jaccard sui trigrammi
+# come pg_trgm.similarity, ma calcolato senza accenti né forma societaria: sugli
+# stessi nomi non coincide con la query SQL originale (vedi trigrams()).
+COMPANY_MATCH_CANDIDATE = 0.3
+COMPANY_MATCH_ACCEPT = 0.4
+# Rilettura periodica: copre le scritture fatte da altri processi (script di sync)
+COMPANY_RESOLVER_TTL = int(os.getenv("COMPANY_RESOLVER_TTL", "600"))
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+# Forme societarie: presenti in quasi tutti i nomi, non aiutano a distinguere le aziende
+_LEGAL_FORMS = re.compile(r"\b(s r l s|s r l|s p a|s a s|s n c|s a p a|srls|srl|spa|sas|snc|sapa|scarl|soc coop)\b")
+
+
+def normalize_company_name(name: str) -> str:
+    """Minuscolo, senza accenti né punteggiatura, spazi singoli"""
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    ascii_name = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", ascii_name.lower()).strip()
+
+
+def trigrams(name: str, strip_legal_form: bool = True) -> Set[str]:
+    """Trigrammi delle parole del nome, padding come pg_trgm (due spazi davanti e uno dietro).
+
+    A differenza di pg_trgm il nome è prima normalizzato (accenti rimossi) e
+    privato della forma societaria: "Rossi S.r.l." e "Rossi SPA" hanno gli
+    stessi trigrammi, e la parte distintiva del nome pesa di più. Con
+    strip_legal_form=False la forma resta, compattata ("s r l" -> "srl"):
+    serve a separare i pareggi in best_match().
+    """
+    normalized = normalize_company_name(name)
+    if strip_legal_form:
+        words = _LEGAL_FORMS.sub(" ", normalized).split() or normalized.split()
+    else:
+        words = _LEGAL_FORMS.sub(lambda m: m.group().replace(" ", ""), normalized).split()
+    grams = set()
+    for word in words:
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    """Trigrammi comuni / unione, come pg_trgm similarity()"""
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+class CompanyResolver:
+    """Indice in memoria di companies.nome per match esatti e fuzzy.
+
+    Match esatto su nome normalizzato (dict) e fuzzy con indice invertito
+    trigramma -> aziende. Il punteggio fuzzy ha la forma di pg_trgm
+    similarity() (trigrammi comuni / unione) ma sui trigrammi di trigrams(),
+    senza accenti né forma societaria: i valori, e quindi l'effetto delle
+    soglie 0.3/0.4, differiscono dalla query SQL originale.
+
+    I candidati arrivano solo dai trigrammi più rari della richiesta (prefix
+    filtering: per superare la soglia un nome deve condividerne almeno uno),
+    così i trigrammi comuni non fanno scorrere mezza tabella. L'indice si
+    costruisce alla prima richiesta e si ricostruisce dopo invalidate()
+    (chiamato dal sync aziende) o alla scadenza del TTL.
+    """
+
+    def __init__(self, ttl: int = COMPANY_RESOLVER_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._exact: Dict[str, str] = {}
+        self._names: List[Tuple[str, str, FrozenSet[str]]] = []  # (id, nome, trigrammi)
+        self._postings: Dict[str, List[int]] = {}
+        self.builds = 0
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _build(self, db):
+        rows = db.execute(text("SELECT id, nome FROM companies WHERE nome IS NOT NULL AND nome <> ''")).fetchall()
+        exact, names, postings = {}, [], defaultdict(list)
+        for company_id, nome in rows:
+            exact.setdefault(normalize_company_name(nome), company_id)
+            grams = frozenset(trigrams(nome))
+            for gram in grams:
+                postings[gram].append(len(names))
+            names.append((company_id, nome, grams))
+        self._exact, self._names, self._postings = exact, names, dict(postings)
+        self._loaded_at = time.monotonic()
+        self.builds += 1
+        print(f"[FUZZY] 📚 Indice aziende costruito: {len(names)} nomi, {len(postings)} trigrammi")
+
+    def ensure_loaded(self, db):
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self._build(db)
+
+    def exact(self, name: str) -> Optional[str]:
+        return self._exact.get(normalize_company_name(name))
+
+    def best_match(self, name: str) -> Optional[Tuple[str, str, float]]:
+        """(id, nome, similarità) del miglior candidato sopra la soglia, o None.
+
+        A pari punteggio decide la similarità sul nome completo, forma
+        societaria compresa ("Rossi SRL" contro "Rossi SPA"); se restano
+        alla pari nomi diversi il match è ambiguo e non si sceglie: None.
+        """
+        query = trigrams(name)
+        if not query:
+            return None
+        # similarità = comuni / unione <= comuni / |query|: servono almeno ceil(soglia * |query|) trigrammi comuni
+        min_common = max(1, math.ceil(COMPANY_MATCH_CANDIDATE * len(query)))
+        by_rarity = sorted(query, key=lambda gram: len(self._postings.get(gram, ())))
+        candidates = set()
+        for gram in by_rarity[:len(query) - min_common + 1]:
+            candidates.update(self._postings.get(gram, ()))
+
+        top, top_score = [], 0.0
+        for index in candidates:
+            score = _similarity(query, self._names[index][2])
+            if score <= COMPANY_MATCH_CANDIDATE or score < top_score:
+                continue
+            if score > top_score:
+                top, top_score = [], score
+            top.append(index)
+        if not top:
+            return None
+
+        best = top[0] if len(top) == 1 else self._break_tie(name, top)
+        if best is None:
+            return None
+        company_id, nome, _ = self._names[best]
+        return company_id, nome, top_score
+
+    def _break_tie(self, name: str, tied: List[int]) -> Optional[int]:
+        full_query = trigrams(name, strip_legal_form=False)
+        scores = {index: _similarity(full_query, trigrams(self._names[index][1], strip_legal_form=False))
+                  for index in tied}
+        # A parità anche qui vince il primo caricato, come per il match esatto
+        ranked = sorted(tied, key=lambda index: (-scores[index], index))
+        best, runner_up = ranked[0], ranked[1]
+        if scores[best] == scores[runner_up] and \
+                normalize_company_name(self._names[best][1]) != normalize_company_name(self._names[runner_up][1]):
+            return None
+        return best
+
+    def stats(self) -> dict:
+        return {
+            "companies": len(self._names),
+            "trigrams": len(self._postings),
+            "builds": self.builds,
+            "loaded": self._loaded_at is not None,
+        }
+
+
+company_resolver = CompanyResolver()
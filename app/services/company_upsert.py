@@ -0,0 +1,99 @@
+import logging
+from typing import Iterable, List
+
+from psycopg2.extras import execute_values
+
+from app.core.database import engine
+from app.services.company_resolver import company_resolver
+
+logger = logging.getLogger(__name__)
+
+COMPANY_COLUMNS = ("id", "nome", "partita_iva", "address", "sector")
+
+# Aggiorna solo se qualcosa è cambiato; xmax = 0 distingue le righe inserite da quelle aggiornate.
+# Le righe invariate non vengono toccate né restituite (updated_at compreso).
+# I timestamp sono espliciti: l'INSERT diretto non passa dai default dell'ORM.
+UPSERT_COMPANIES_SQL = """
+    INSERT INTO companies (id, nome, partita_iva, address, sector, created_at, updated_at)
+    VALUES %s
+    ON CONFLICT (id) DO UPDATE SET
+        nome = EXCLUDED.nome,
+        partita_iva = EXCLUDED.partita_iva,
+        address = EXCLUDED.address,
+        sector = EXCLUDED.sector,
+        updated_at = NOW()
+    WHERE (companies.nome, companies.partita_iva, companies.address, companies.sector)
+          IS DISTINCT FROM (EXCLUDED.nome, EXCLUDED.partita_iva, EXCLUDED.address, EXCLUDED.sector)
+    RETURNING (xmax = 0) AS inserted
+"""
+UPSERT_COMPANIES_TEMPLATE = "(%s, %s, %s, %s, %s, NOW(), NOW())"
+
+
+def company_row(crm_company_id, detail: dict) -> dict:
+    """Mappa il dettaglio /Company del CRM sulle colonne di companies"""
+    return {
+        "id": str(crm_company_id),
+        "nome": detail.get("companyName") or "",
+        "partita_iva": detail.get("taxIdentificationNumber") or detail.get("vatId") or "",
+        "address": detail.get("address") or "",
+        "sector": detail.get("description") or "",
+    }
+
+
+def upsert_companies_batch(rows: List[dict], db_engine=None) -> dict:
+    """Upsert di un blocco di aziende con un solo INSERT ... ON CONFLICT.
+
+    Usa il connection pool dell'engine SQLAlchemy dell'app (psycopg2 sotto)
+    e una transazione per blocco.
+    Ritorna i conteggi inserted / updated / unchanged del blocco.
+    """
+    # Una riga per id: ON CONFLICT non può aggiornare la stessa riga due volte nello stesso comando
+    unique_rows = list({row["id"]: row for row in rows}.values())
+    if not unique_rows:
+        return {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+
+    values = [tuple(row[col] for col in COMPANY_COLUMNS) for row in unique_rows]
+    raw = (db_engine or engine).raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            results = execute_values(cursor, UPSERT_COMPANIES_SQL, values, template=UPSERT_COMPANIES_TEMPLATE,
+                                     page_size=len(values), fetch=True)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    inserted = sum(1 for (was_inserted,) in results if was_inserted)
+    updated = len(results) - inserted
+    if results:
+        # Nomi nuovi o cambiati: l'indice del resolver va ricostruito
+        company_resolver.invalidate()
+    return {
+        "rows": len(unique_rows),
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": len(unique_rows) - inserted - updated,
+    }
+
+
+def upsert_companies(rows: Iterable[dict], batch_size: int = 500, db_engine=None) -> dict:
+    """Upsert a blocchi di un iterabile di righe, con report per blocco"""
+    totals = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "batches": []}
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _add_batch(totals, upsert_companies_batch(batch, db_engine))
+            batch = []
+    if batch:
+        _add_batch(totals, upsert_companies_batch(batch, db_engine))
+    return totals
+
+
+def _add_batch(totals: dict, stats: dict):
+    for key in ("rows", "inserted", "updated", "unchanged"):
+        totals[key] += stats[key]
+    totals["batches"].append(stats)
+    logger.info(f"Companies batch: {stats}")
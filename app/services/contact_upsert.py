@@ -0,0 +1,103 @@
+import logging
+from typing import List
+
+from psycopg2.extras import execute_values
+
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+CONTACT_COLUMNS = ("crm_id", "company_id", "nome", "cognome", "posizione", "email",
+                   "telefono", "cellulare", "indirizzo", "citta", "cap", "paese")
+
+# Il collegamento all'azienda passa per companies: se l'azienda CRM non è (ancora)
+# sincronizzata company_id resta NULL e il contatto viene comunque salvato.
+# created_at/updated_at espliciti: i default dell'ORM non valgono per l'INSERT diretto.
+UPSERT_CONTACTS_SQL = """
+    INSERT INTO contacts (crm_id, company_id, azienda, nome, cognome, posizione, email,
+                          telefono, cellulare, indirizzo, citta, cap, paese, created_by, created_at, updated_at)
+    SELECT v.crm_id::integer, c.id, c.nome, COALESCE(v.nome, ''), COALESCE(v.cognome, ''), v.posizione, v.email,
+           v.telefono, v.cellulare, v.indirizzo, v.citta, v.cap, v.paese, 'crm_sync', NOW(), NOW()
+    FROM (VALUES %s) AS v(crm_id, company_id, nome, cognome, posizione, email,
+                          telefono, cellulare, indirizzo, citta, cap, paese)
+    LEFT JOIN companies c ON c.id = v.company_id
+    ON CONFLICT (crm_id) DO UPDATE SET
+        company_id = EXCLUDED.company_id,
+        azienda = EXCLUDED.azienda,
+        nome = EXCLUDED.nome,
+        cognome = EXCLUDED.cognome,
+        posizione = EXCLUDED.posizione,
+        email = EXCLUDED.email,
+        telefono = EXCLUDED.telefono,
+        cellulare = EXCLUDED.cellulare,
+        indirizzo = EXCLUDED.indirizzo,
+        citta = EXCLUDED.citta,
+        cap = EXCLUDED.cap,
+        paese = EXCLUDED.paese,
+        updated_at = NOW()
+    WHERE (contacts.company_id, contacts.nome, contacts.cognome, contacts.posizione, contacts.email,
+           contacts.telefono, contacts.cellulare, contacts.indirizzo, contacts.citta, contacts.cap, contacts.paese)
+          IS DISTINCT FROM
+          (EXCLUDED.company_id, EXCLUDED.nome, EXCLUDED.cognome, EXCLUDED.posizione, EXCLUDED.email,
+           EXCLUDED.telefono, EXCLUDED.cellulare, EXCLUDED.indirizzo, EXCLUDED.citta, EXCLUDED.cap, EXCLUDED.paese)
+    RETURNING (xmax = 0) AS inserted, company_id IS NOT NULL AS linked
+"""
+
+
+def _first(detail: dict, *keys):
+    for key in keys:
+        if detail.get(key):
+            return detail[key]
+    return None
+
+
+def contact_row(detail: dict) -> dict:
+    """Mappa un contatto CRM sulle colonne di contacts"""
+    company_id = _first(detail, "companyId", "companyID")
+    return {
+        "crm_id": int(detail["id"]),
+        "company_id": str(company_id) if company_id else None,
+        "nome": _first(detail, "name", "firstName"),
+        "cognome": _first(detail, "surname", "lastName"),
+        "posizione": _first(detail, "jobDescription", "role", "title"),
+        "email": _first(detail, "emailAddress", "email"),
+        "telefono": _first(detail, "phone", "phoneNumber"),
+        "cellulare": _first(detail, "mobilePhone", "cellPhone"),
+        "indirizzo": _first(detail, "address"),
+        "citta": _first(detail, "city"),
+        "cap": _first(detail, "zipCode", "postalCode"),
+        "paese": _first(detail, "country", "state"),
+    }
+
+
+def upsert_contacts_batch(rows: List[dict], db_engine=None) -> dict:
+    """Upsert di un blocco di contatti con un solo INSERT ... ON CONFLICT (crm_id).
+
+    Ritorna inserted / updated / unchanged e quanti contatti scritti sono
+    collegati a un'azienda presente in companies.
+    """
+    unique_rows = list({row["crm_id"]: row for row in rows}.values())
+    if not unique_rows:
+        return {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "linked": 0}
+
+    values = [tuple(row[col] for col in CONTACT_COLUMNS) for row in unique_rows]
+    raw = (db_engine or engine).raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            results = execute_values(cursor, UPSERT_CONTACTS_SQL, values, page_size=len(values), fetch=True)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    inserted = sum(1 for was_inserted, _ in results if was_inserted)
+    updated = len(results) - inserted
+    return {
+        "rows": len(unique_rows),
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": len(unique_rows) - inserted - updated,
+        "linked": sum(1 for _, linked in results if linked),
+    }
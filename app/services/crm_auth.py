@@ -2,8 +2,8 @@
 
 import os
 import time
+import threading
 import logging
-import requests
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -11,37 +11,85 @@ logger.setLevel(logging.INFO)
 CRM_API_KEY = os.getenv("CRM_API_KEY")
 CRM_USERNAME = os.getenv("CRM_USERNAME")
 CRM_PASSWORD = os.getenv("CRM_PASSWORD")
-CRM_BASE_URL = "https://api.crmincloud.it/api/v1"
+CRM_BASE_URL = os.getenv("CRM_BASE_URL", "https://api.crmincloud.it/api/v1")
+
+# Durata usata se il login non restituisce expires_in, e margine di rinnovo anticipato
+CRM_TOKEN_DEFAULT_TTL = int(os.getenv("CRM_TOKEN_DEFAULT_TTL", "1200"))
+CRM_TOKEN_REFRESH_MARGIN = int(os.getenv("CRM_TOKEN_REFRESH_MARGIN", "60"))
+
+
+def _login() -> dict:
+    """Esegue /Auth/Login e ritorna il JSON di risposta.
+
+    Rate limit, 429 e retry con backoff sono gestiti dal client CRM condiviso.
+    """
+    from app.services.crm_client import crm_client
 
-def get_crm_token(max_retries=5, base_delay=5):
-    url = f"{CRM_BASE_URL}/Auth/Login"
     payload = {
         "grant_type": "password",
         "userName": CRM_USERNAME,
         "password": CRM_PASSWORD
     }
+    headers = {"Content-Type": "application/json"}
+
+    response = crm_client.post("/Auth/Login", auth=False, idempotent=True, json=payload, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+
+class CRMTokenManager:
+    """Token CRM condiviso dal processo, rinnovato poco prima della scadenza.
+
+    Thread-safe: un solo thread alla volta esegue il login, gli altri
+    attendono e riusano il token appena ottenuto.
+    """
+
+    def __init__(self, default_ttl: int = CRM_TOKEN_DEFAULT_TTL, refresh_margin: int = CRM_TOKEN_REFRESH_MARGIN):
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.logins = 0
+
+    def _valid(self) -> bool:
+        return self._token is not None and time.monotonic() < self._expires_at - self.refresh_margin
+
+    def get_token(self) -> str:
+        if self._valid():
+            return self._token
+        with self._lock:
+            # Un altro thread potrebbe averlo già rinnovato mentre attendevamo il lock
+            if not self._valid():
+                data = _login()
+                ttl = int(data.get("expires_in") or self.default_ttl)
+                self._token = data["access_token"]
+                self._expires_at = time.monotonic() + ttl
+                self.logins += 1
+                logger.info(f"🔑 Token CRM rinnovato (valido {ttl}s)")
+            return self._token
+
+    def invalidate(self, token: str = None):
+        """Scarta il token (es. dopo un 401); con token indicato solo se è ancora quello in uso"""
+        with self._lock:
+            if token is None or token == self._token:
+                self._token = None
+                self._expires_at = 0.0
+
+
+crm_token_manager = CRMTokenManager()
+
+
+def get_crm_token() -> str:
+    return crm_token_manager.get_token()
+
+
+def get_crm_headers(content_type: bool = True) -> dict:
+    """Header standard per le chiamate CRM con il token condiviso"""
     headers = {
-        "WebApiKey": CRM_API_KEY,
-        "Content-Type": "application/json"
+        "Authorization": f"Bearer {get_crm_token()}",
+        "WebApiKey": CRM_API_KEY
     }
-
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(url, json=payload, headers=headers)
-            if response.status_code == 429:
-                wait_time = base_delay * (2 ** attempt)
-                logger.warning(f"⚠️ CRM rate limit (429). Retry tra {wait_time}s...")
-                time.sleep(wait_time)
-                continue
-            response.raise_for_status()
-            return response.json()["access_token"]
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"❌ Errore HTTP nel tentativo {attempt+1}: {e}")
-            if attempt == max_retries - 1:
-                raise
-            time.sleep(base_delay * (2 ** attempt))
-        except Exception as e:
-            logger.error(f"❌ Errore generico nel tentativo {attempt+1}: {e}")
-            if attempt == max_retries - 1:
-                raise
-            time.sleep(base_delay * (2 ** attempt))
+    if content_type:
+        headers["Content-Type"] = "application/json"
+    return headers
@@ -0,0 +1,138 @@
+# app/services/crm_client.py
+
+import os
+import time
+import logging
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from app.services.crm_auth import CRM_API_KEY, CRM_BASE_URL, crm_token_manager
+from app.services.crm_rate_limiter import crm_rate_limiter, retry_after_seconds, backoff_delay
+
+logger = logging.getLogger(__name__)
+
+CRM_POOL_SIZE = int(os.getenv("CRM_POOL_SIZE", "10"))
+CRM_CONNECT_TIMEOUT = float(os.getenv("CRM_CONNECT_TIMEOUT", "5"))
+CRM_READ_TIMEOUT = float(os.getenv("CRM_READ_TIMEOUT", "30"))
+CRM_MAX_RETRIES = int(os.getenv("CRM_MAX_RETRIES", "5"))
+
+RETRYABLE_STATUS = {429, 502, 503, 504}
+# Status per cui il server dichiara di non aver eseguito la richiesta, se c'è Retry-After
+RETRY_AFTER_STATUS = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+def is_connect_error(error: Exception) -> bool:
+    """True se la connessione non è mai stata aperta (la richiesta non è partita)"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class CRMClient:
+    """Client HTTP unico per CRM InCloud.
+
+    Usa una requests.Session con pool di connessioni keep-alive (niente
+    handshake TCP+TLS per ogni chiamata), timeout di connessione/lettura
+    condivisi e il token del CRMTokenManager; su 401 il token viene
+    rinnovato e la richiesta ripetuta una volta.
+
+    Ogni richiesta prende un token dal rate limiter condiviso; 429 e errori
+    transitori vengono ripetuti rispettando Retry-After oppure con backoff
+    esponenziale con jitter, fino a max_retries.
+
+    Solo i metodi idempotenti (GET/HEAD/OPTIONS/PUT/DELETE) si ripetono su
+    timeout, connessione persa e 502/503/504: un POST scaduto può essere
+    già stato eseguito dal CRM e ripeterlo creerebbe un duplicato. Un POST
+    si ripete solo se la connessione non è mai stata aperta o su 429/503
+    con Retry-After; i POST di sola lettura (login, ricerche) passano
+    idempotent=True.
+    """
+
+    def __init__(self, base_url: str = CRM_BASE_URL, pool_size: int = CRM_POOL_SIZE,
+                 connect_timeout: float = CRM_CONNECT_TIMEOUT, read_timeout: float = CRM_READ_TIMEOUT,
+                 rate_limiter=crm_rate_limiter, max_retries: int = CRM_MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.rate_limited_responses = 0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, auth: bool = True, idempotent: Optional[bool] = None,
+                **kwargs) -> requests.Response:
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+        extra_headers = kwargs.pop("headers", None) or {}
+        url = self.url(path)
+
+        token_refreshed = False
+        attempt = 0
+        while True:
+            headers = {"WebApiKey": CRM_API_KEY}
+            token = None
+            if auth:
+                token = crm_token_manager.get_token()
+                headers["Authorization"] = f"Bearer {token}"
+            headers.update(extra_headers)
+
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries or not (idempotent or is_connect_error(e)):
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"⚠️ CRM {method} {url}: {e}. Retry tra {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if response.status_code == 401 and auth and not token_refreshed:
+                logger.warning("🔑 CRM 401: token rinnovato, nuovo tentativo")
+                crm_token_manager.invalidate(token)
+                token_refreshed = True
+                continue
+
+            delay = retry_after_seconds(response.headers.get("Retry-After"))
+            retryable = (response.status_code in RETRYABLE_STATUS if idempotent
+                         else response.status_code in RETRY_AFTER_STATUS and delay is not None)
+            if retryable and attempt < self.max_retries:
+                if response.status_code == 429:
+                    self.rate_limited_responses += 1
+                    # Il 429 vale per tutti i chiamanti: sospende l'intero bucket
+                    delay = delay if delay is not None else backoff_delay(attempt)
+                    self.rate_limiter.pause(delay)
+                    logger.warning(f"⏳ CRM rate limit (429): pausa di {delay:.1f}s")
+                else:
+                    delay = delay if delay is not None else backoff_delay(attempt)
+                    logger.warning(f"⚠️ CRM {response.status_code} su {url}. Retry tra {delay:.1f}s")
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            return response
+
+    def stats(self) -> dict:
+        return {**self.rate_limiter.stats(), "rate_limited_responses": self.rate_limited_responses}
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, idempotent: bool = False, **kwargs) -> requests.Response:
+        return self.request("POST", path, idempotent=idempotent, **kwargs)
+
+
+crm_client = CRMClient()
@@ -1,68 +1,21 @@
 def extract_opportunities_from_description(description: str, services: list[str] = None):
     """
     Estrae codici opportunità dalla descrizione e/o lista servizi.
-    Ora usa il database dinamicamente invece del mapping hardcoded.
+    Usa il catalogo servizi in cache (sub_types), invalidato dalle route che lo modificano.
     """
-    from app.core.database import SessionLocal
-    from app.models.sub_type import SubType
+    from app.services.service_catalogue import service_catalogue
     
-    # Get dynamic mapping from database
-    db = SessionLocal()
-    try:
-        # Recupera tutti i servizi con codice dal database
-        db_services = db.query(SubType).filter(
-            SubType.code.isnot(None),
-            SubType.code != '',
-            SubType.code.notin_(['I24', 'TICKET_INT'])  # Escludi servizi interni
-        ).all()
-        
-        # Crea mapping dinamico: nome_servizio_lowercase -> codice
-        mapping = {}
-        for service in db_services:
-            if service.name and service.code:
-                # Aggiungi il nome esatto
-                mapping[service.name.lower().strip()] = service.code
-                
-                # Aggiungi varianti comuni per compatibilità
-                name_lower = service.name.lower().strip()
-                if name_lower == "formazione 4.0":
-                    mapping["formazione quattro punto zero"] = service.code
-                    mapping["formazioni 4.0"] = service.code
-                elif name_lower == "patent box":
-                    mapping["patentbox"] = service.code
-                elif name_lower == "know how":
-                    mapping["knowhow"] = service.code
-                elif name_lower == "bandi":
-                    mapping["bando"] = service.code
-                    mapping["incentivi"] = service.code
-                elif name_lower == "finanziamenti":
-                    mapping["finanziamento"] = service.code
-        
-        print(f"[DEBUG] Dynamic mapping generato: {mapping}")
-        
-    except Exception as e:
-        print(f"[ERROR] Errore lettura mapping da DB: {e}")
-        # Fallback al mapping hardcoded solo in caso di errore
-        mapping = {
-            "formazione 4.0": "F40",
-            "transizione 5.0": "T50", 
-            "know how": "KHW",
-            "patent box": "PBX",
-            "bandi": "BND",
-            "finanziamenti": "FND"
-        }
-    finally:
-        db.close()
+    # Mapping dal catalogo servizi in memoria (nessuna query per chiamata)
+    mapping = service_catalogue.code_mapping()
     
     found = set()
     
-    # Cerca nella descrizione
+    # Cerca nella descrizione: una sola scansione con il matcher compilato
     if description:
-        description = description.lower()
-        for phrase, code in mapping.items():
-            if phrase in description:
-                found.add(code)
-                print(f"[DEBUG] Trovato '{phrase}' -> {code} in descrizione")
+        for phrase in service_catalogue.matcher().find(description):
+            if phrase in mapping:
+                found.add(mapping[phrase])
+                print(f"[DEBUG] Trovato '{phrase}' -> {mapping[phrase]} in descrizione")
     
     # Cerca nei servizi forniti
     if services:
@@ -93,45 +46,17 @@ def extract_opportunities_from_description(description: str, services: list[str]
 def extract_services_from_description(description: str) -> list[str]:
     """
     Ritorna un elenco di etichette di servizi riconosciute a partire dalla descrizione.
-    Ora usa il database dinamicamente.
+    Usa il catalogo servizi in cache.
     """
-    from app.core.database import SessionLocal
-    from app.models.sub_type import SubType
+    from app.services.service_catalogue import service_catalogue
     
-    # Get dynamic mapping from database
-    db = SessionLocal()
-    try:
-        db_services = db.query(SubType).filter(
-            SubType.code.isnot(None),
-            SubType.code != '',
-            SubType.code.notin_(['I24', 'TICKET_INT'])
-        ).all()
-        
-        # Crea mapping: nome_lowercase -> nome_originale
-        mapping = {}
-        for service in db_services:
-            if service.name:
-                mapping[service.name.lower().strip()] = service.name
-                
-    except Exception as e:
-        print(f"[ERROR] Errore lettura servizi da DB: {e}")
-        # Fallback
-        mapping = {
-            "formazione 4.0": "Formazione 4.0",
-            "transizione 5.0": "Transizione 5.0",
-            "know how": "Know How", 
-            "patent box": "Patent Box",
-            "bandi": "Bandi",
-            "finanziamenti": "Finanziamenti"
-        }
-    finally:
-        db.close()
+    # Mapping: nome_lowercase -> nome_originale
+    mapping = service_catalogue.name_mapping()
     
     found = set()
     if description:
-        description = description.lower()
-        for phrase, label in mapping.items():
-            if phrase in description:
-                found.add(label)
+        for phrase in service_catalogue.matcher().find(description):
+            if phrase in mapping:
+                found.add(mapping[phrase])
     
     return list(found)
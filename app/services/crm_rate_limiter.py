@@ -0,0 +1,105 @@
+# app/services/crm_rate_limiter.py
+
+import os
+import time
+import random
+import threading
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Budget CRM InCloud: 40 richieste/minuto, con un piccolo burst iniziale
+CRM_RATE_LIMIT_PER_MINUTE = float(os.getenv("CRM_RATE_LIMIT_PER_MINUTE", "40"))
+CRM_RATE_BURST = int(os.getenv("CRM_RATE_BURST", "10"))
+CRM_BACKOFF_BASE = float(os.getenv("CRM_BACKOFF_BASE", "1"))
+CRM_BACKOFF_MAX = float(os.getenv("CRM_BACKOFF_MAX", "60"))
+
+
+class TokenBucket:
+    """Token bucket thread-safe condiviso da tutti i chiamanti CRM.
+
+    acquire() blocca finché non è disponibile un token; pause() sospende
+    tutti i chiamanti (es. per il Retry-After di un 429) e svuota il bucket.
+    """
+
+    def __init__(self, rate_per_minute: float = CRM_RATE_LIMIT_PER_MINUTE, capacity: int = CRM_RATE_BURST):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+        self.pauses = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Prende un token; ritorna i secondi attesi"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.acquired += 1
+                        if waited:
+                            self.throttled += 1
+                            self.waited_seconds += waited
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = max(now, self._blocked_until)
+            self.pauses += 1
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_minute": round(self.rate * 60, 2),
+            "capacity": self.capacity,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited_seconds, 2),
+            "pauses": self.pauses,
+        }
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Interpreta l'header Retry-After (secondi o data HTTP)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = CRM_BACKOFF_BASE, cap: float = CRM_BACKOFF_MAX) -> float:
+    """Backoff esponenziale con jitter (±50%)"""
+    return min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+
+crm_rate_limiter = TokenBucket()
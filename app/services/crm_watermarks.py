@@ -0,0 +1,62 @@
+# app/services/crm_watermarks.py
+
+import logging
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Formato usato dal CRM nei filtri e nei campi lastModifiedDate
+CRM_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def parse_crm_datetime(value) -> Optional[datetime]:
+    """lastModifiedDate del CRM (ISO 8601, con o senza frazioni/zona) come datetime naive"""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        logger.warning(f"⚠️ lastModifiedDate non interpretabile: {value}")
+        return None
+
+
+def max_modified(details: Iterable[dict], current: Optional[datetime] = None) -> Optional[datetime]:
+    """Nuovo watermark: il lastModifiedDate più recente tra quelli visti (orologio del CRM)"""
+    for detail in details:
+        modified = parse_crm_datetime(detail.get("lastModifiedDate"))
+        if modified and (current is None or modified > current):
+            current = modified
+    return current
+
+
+def get_watermark(entity: str, db_engine=None) -> Optional[datetime]:
+    with (db_engine or engine).connect() as conn:
+        return conn.execute(
+            text("SELECT last_modified_at FROM crm_sync_state WHERE entity = :entity"),
+            {"entity": entity}
+        ).scalar()
+
+
+def save_watermark(entity: str, last_modified_at: Optional[datetime], db_engine=None):
+    """Salva il watermark; non lo fa mai arretrare"""
+    with (db_engine or engine).begin() as conn:
+        conn.execute(text("""
+            INSERT INTO crm_sync_state (entity, last_modified_at, last_run_at)
+            VALUES (:entity, :last_modified_at, NOW())
+            ON CONFLICT (entity) DO UPDATE SET
+                last_modified_at = GREATEST(crm_sync_state.last_modified_at, EXCLUDED.last_modified_at),
+                last_run_at = EXCLUDED.last_run_at
+        """), {"entity": entity, "last_modified_at": last_modified_at})
+    logger.info(f"🔖 Watermark CRM {entity}: {last_modified_at}")
+
+
+def changed_since_filter(since: datetime) -> str:
+    """Filtro CRM per gli oggetti modificati da `since` (ge: un secondo di sovrapposizione è innocuo, l'upsert è idempotente)"""
+    return f"lastModifiedDate ge '{since.strftime(CRM_DATETIME_FORMAT)}'"
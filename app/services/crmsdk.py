@@ -2,7 +2,7 @@ from typing import Optional
 from sqlalchemy.orm import Session
 import os
 import requests
-from integrations.crm_incloud.sync import get_crm_token
+from app.services.crm_client import crm_client
 from sqlalchemy import func
 from app.models.company import Company
 
@@ -14,13 +14,6 @@ def create_crm_activity(data: dict) -> int:
     """
     Crea un'attività Ulisse nel CRM e restituisce l'ID creato.
     """
-    token = get_crm_token()
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "WebApiKey": CRM_API_KEY,
-        "Content-Type": "application/json"
-    }
-
     # Costruzione payload con casting sicuro ai tipi corretti
     payload = {
         "subject": data.get("subject"),
@@ -37,9 +30,8 @@ def create_crm_activity(data: dict) -> int:
         "idCompanion": int(data.get("idCompanion"))
     }
 
-    url = f"{CRM_BASE_URL}/Activity/CreateOrUpdate"
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = crm_client.post("/Activity/CreateOrUpdate", json=payload)
         response.raise_for_status()
         response_data = response.json()
 
@@ -59,9 +51,10 @@ def create_crm_activity(data: dict) -> int:
 
 
 from sqlalchemy import text
+from app.services.company_resolver import company_resolver, COMPANY_MATCH_ACCEPT
 
 def get_company_id_by_name(company_name: str, db: Session) -> Optional[int]:
-    """Trova company_id con fuzzy search - ENHANCED VERSION"""
+    """Trova company_id con fuzzy search - indice trigrammi in memoria, fallback su pg_trgm"""
     if not company_name or not company_name.strip():
         print(f"[FUZZY] ❌ Empty company name")
         return None
@@ -70,44 +63,59 @@ def get_company_id_by_name(company_name: str, db: Session) -> Optional[int]:
     print(f"[FUZZY] 🔍 Searching for: '{company_name}'")
     
     try:
-        # Step 1: Exact match (case insensitive)
+        # SAVEPOINT: se la lettura dell'indice fallisce si annulla solo quella, non il lavoro del chiamante
+        with db.begin_nested():
+            company_resolver.ensure_loaded(db)
+
+        # Step 1: Exact match (nome normalizzato)
+        exact = company_resolver.exact(company_name)
+        if exact is not None:
+            print(f"[FUZZY] ✅ EXACT MATCH found: company_id={exact}")
+            return exact
+
+        # Step 2: Fuzzy match sui trigrammi in memoria
+        print(f"[FUZZY] 🔍 No exact match, trying fuzzy search...")
+        fuzzy = company_resolver.best_match(company_name)
+    except Exception as e:
+        print(f"[FUZZY] ⚠️ Indice in memoria non disponibile ({e}), uso il database")
+        fuzzy = _fuzzy_company_from_db(company_name, db)
+
+    if fuzzy:
+        company_id, matched_name, score = fuzzy
+        print(f"[FUZZY] 🎯 FUZZY MATCH: '{company_name}' → '{matched_name}' (score: {score:.3f})")
+
+        if score >= COMPANY_MATCH_ACCEPT:  # Accept threshold
+            print(f"[FUZZY] ✅ ACCEPTED (score >= {COMPANY_MATCH_ACCEPT})")
+            return company_id
+        else:
+            print(f"[FUZZY] ⚠️ REJECTED (score {score:.3f} < {COMPANY_MATCH_ACCEPT})")
+            return None
+
+    print(f"[FUZZY] ❌ NO MATCH found for: '{company_name}'")
+    return None
+
+
+def _fuzzy_company_from_db(company_name: str, db: Session):
+    """Fallback SQL: exact su LOWER(nome) e operatore % servito dall'indice GIN trigram"""
+    try:
         exact = db.execute(
             text("SELECT id FROM companies WHERE LOWER(nome) = LOWER(:name)"),
             {"name": company_name}
         ).fetchone()
-        
         if exact:
-            print(f"[FUZZY] ✅ EXACT MATCH found: company_id={exact[0]}")
-            return exact[0]
-        
-        # Step 2: Fuzzy search with pg_trgm
-        print(f"[FUZZY] 🔍 No exact match, trying fuzzy search...")
-        fuzzy = db.execute(
+            return exact[0], company_name, 1.0
+
+        return db.execute(
             text("""
                 SELECT id, nome, similarity(nome, :name) as score
                 FROM companies 
-                WHERE similarity(nome, :name) > 0.3
+                WHERE nome % :name
                 ORDER BY score DESC LIMIT 1
             """),
             {"name": company_name}
         ).fetchone()
-        
-        if fuzzy:
-            company_id, matched_name, score = fuzzy
-            print(f"[FUZZY] 🎯 FUZZY MATCH: '{company_name}' → '{matched_name}' (score: {score:.3f})")
-            
-            if score >= 0.4:  # Accept threshold
-                print(f"[FUZZY] ✅ ACCEPTED (score >= 0.4)")
-                return company_id
-            else:
-                print(f"[FUZZY] ⚠️ REJECTED (score {score:.3f} < 0.4)")
-                return None
-        
-        print(f"[FUZZY] ❌ NO MATCH found for: '{company_name}'")
-        return None
-        
     except Exception as e:
         print(f"[FUZZY] 💥 DATABASE ERROR: {e}")
         import traceback
         traceback.print_exc()
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,317 @@
+import asyncio
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import deque
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import List, Optional
+
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+
+def build_message(sender: str, recipients: List[str], subject: str, html_body: str,
+                  text_body: Optional[str] = None) -> MIMEMultipart:
+    """Costruisce il messaggio MIME (text + html) usato da tutti gli invii"""
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    message["From"] = f"Intelligence Platform <{sender}>"
+    # Con più destinatari l'invio è in un'unica transazione: gli indirizzi restano nell'envelope
+    message["To"] = recipients[0] if len(recipients) == 1 else "undisclosed-recipients:;"
+
+    if text_body:
+        message.attach(MIMEText(text_body, "plain", "utf-8"))
+    message.attach(MIMEText(html_body, "html", "utf-8"))
+    return message
+
+
+class EmailJob:
+    """Un messaggio in coda: uno o più destinatari nella stessa transazione SMTP"""
+
+    def __init__(self, recipients: List[str], subject: str, html_body: str, text_body: Optional[str] = None):
+        self.recipients = recipients
+        self.subject = subject
+        self.html_body = html_body
+        self.text_body = text_body
+        self.attempts = 0
+        self.enqueued_at = time.perf_counter()
+
+
+class SMTPConnectionPool:
+    """Pool di connessioni aiosmtplib già autenticate e riutilizzabili.
+
+    Le connessioni inattive da più di idle_timeout secondi vengono
+    verificate con NOOP prima del riuso e riaperte se il server le ha chiuse.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 use_tls: bool = True, size: int = 2, timeout: float = 30, idle_timeout: float = 60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._idle = deque()  # (connessione, ultimo utilizzo)
+        self._semaphore = None
+        self.connections_opened = 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(hostname=self.host, port=self.port, timeout=self.timeout, start_tls=self.use_tls)
+        await smtp.connect()
+        if self.username and self.password:
+            await smtp.login(self.username, self.password)
+        self.connections_opened += 1
+        return smtp
+
+    async def acquire(self) -> aiosmtplib.SMTP:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        await self._semaphore.acquire()
+        try:
+            while self._idle:
+                smtp, last_used = self._idle.popleft()
+                if not smtp.is_connected:
+                    continue
+                if time.monotonic() - last_used > self.idle_timeout:
+                    try:
+                        await smtp.noop()
+                    except aiosmtplib.SMTPException:
+                        await self._discard(smtp)
+                        continue
+                return smtp
+            return await self._connect()
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def release(self, smtp: aiosmtplib.SMTP, broken: bool = False):
+        if not broken and smtp.is_connected:
+            self._idle.append((smtp, time.monotonic()))
+        else:
+            asyncio.ensure_future(self._discard(smtp))
+        self._semaphore.release()
+
+    async def _discard(self, smtp: aiosmtplib.SMTP):
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    async def close(self):
+        while self._idle:
+            smtp, _ = self._idle.popleft()
+            await self._discard(smtp)
+
+
+class EmailDeliveryWorker:
+    """Coda di invio email servita da worker asyncio in un thread dedicato.
+
+    I chiamanti (anche sincroni, dentro le route) accodano con enqueue() e
+    ritornano subito; i worker prelevano fino a batch_size messaggi, li
+    inviano sulla stessa connessione del pool e rimettono in coda quelli
+    falliti con backoff esponenziale (con jitter) fino a max_retries.
+    """
+
+    def __init__(self, pool: SMTPConnectionPool, sender: str, workers: int = 2, batch_size: int = 20,
+                 max_retries: int = 3, backoff_seconds: float = 2.0):
+        self.pool = pool
+        self.sender = sender
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._tasks = []
+        self._lock = threading.Lock()
+        self._pending = 0  # in coda + in invio + in attesa di retry
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self._send_latencies = deque(maxlen=500)
+        self._delivery_latencies = deque(maxlen=500)
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name="email-delivery", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._tasks = [self._loop.create_task(self._worker()) for _ in range(self.workers)]
+        ready.set()
+        self._loop.run_forever()
+
+    def flush(self, timeout: float = 30) -> bool:
+        """Attende che la coda (retry compresi) sia vuota"""
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self._pending == 0
+
+    def stop(self, timeout: float = 10):
+        if not self._thread or not self._thread.is_alive():
+            return
+        self.flush(timeout)
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+    async def _shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.pool.close()
+
+    # ------------------------------------------------------------------ API
+
+    def enqueue(self, recipients: List[str], subject: str, html_body: str, text_body: Optional[str] = None) -> bool:
+        self.start()
+        job = EmailJob(recipients, subject, html_body, text_body)
+        with self._lock:
+            self._pending += 1
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job)
+        return True
+
+    def send_now(self, recipients: List[str], subject: str, html_body: str, text_body: Optional[str] = None) -> bool:
+        """Invio sincrono sul pool (senza coda né retry).
+
+        Nessun timeout sull'attesa: un invio abbandonato potrebbe comunque
+        arrivare a destinazione e il chiamante, leggendo False, lo ripeterebbe.
+        Connessione e comandi SMTP sono già limitati dal timeout del pool.
+        """
+        self.start()
+        job = EmailJob(recipients, subject, html_body, text_body)
+        future = asyncio.run_coroutine_threadsafe(self._send_batch([job], retry=False), self._loop)
+        return future.result() == 1
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "pending": self._pending,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "connections_opened": self.pool.connections_opened,
+            "send_latency_ms": _latency_summary(self._send_latencies),
+            "delivery_latency_ms": _latency_summary(self._delivery_latencies),
+        }
+
+    # ------------------------------------------------------------------ worker
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._send_batch(batch)
+
+    async def _send_batch(self, batch: List[EmailJob], retry: bool = True) -> int:
+        delivered = 0
+        try:
+            smtp = await self.pool.acquire()
+        except Exception as e:
+            logger.error(f"SMTP connection failed: {e}")
+            for job in batch:
+                self._fail(job, e, retry)
+            return 0
+
+        broken = False
+        for job in batch:
+            if broken:
+                self._fail(job, None, retry)
+                continue
+            started = time.perf_counter()
+            try:
+                message = build_message(self.sender, job.recipients, job.subject, job.html_body, job.text_body)
+                await smtp.send_message(message, sender=self.sender, recipients=job.recipients)
+            except Exception as e:
+                broken = isinstance(e, (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError,
+                                        aiosmtplib.SMTPTimeoutError))
+                self._fail(job, e, retry)
+                continue
+            now = time.perf_counter()
+            self._send_latencies.append((now - started) * 1000)
+            self._delivery_latencies.append((now - job.enqueued_at) * 1000)
+            self.sent += 1
+            delivered += 1
+            if retry:
+                self._done()
+            logger.info(f"Email sent successfully to {', '.join(job.recipients)}")
+        self.pool.release(smtp, broken=broken)
+        return delivered
+
+    def _fail(self, job: EmailJob, error: Optional[Exception], retry: bool):
+        job.attempts += 1
+        if retry and job.attempts < self.max_retries:
+            delay = self.backoff_seconds * (2 ** (job.attempts - 1)) * (1 + random.random() / 2)
+            self.retries += 1
+            logger.warning(f"Email to {', '.join(job.recipients)} failed ({error}), retry {job.attempts} in {delay:.1f}s")
+            self._loop.call_later(delay, self._queue.put_nowait, job)
+            return
+        self.failed += 1
+        if retry:
+            self._done()
+        logger.error(f"Failed to send email to {', '.join(job.recipients)}: {error}")
+
+    def _done(self):
+        with self._lock:
+            self._pending -= 1
+
+
+def _latency_summary(samples) -> dict:
+    if not samples:
+        return {"avg": None, "p95": None, "samples": 0}
+    ordered = sorted(samples)
+    return {
+        "avg": round(sum(ordered) / len(ordered), 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "samples": len(ordered),
+    }
+
+
+def create_default_worker() -> EmailDeliveryWorker:
+    """Worker configurato da app.core.config, fermato (con drain della coda) all'uscita"""
+    from app.core.config import (
+        SMTP_SERVER, SMTP_PORT, SMTP_PASSWORD, SMTP_USE_TLS, SMTP_TIMEOUT, SMTP_POOL_SIZE,
+        SMTP_IDLE_TIMEOUT, DEFAULT_FROM_EMAIL, EMAIL_BATCH_SIZE, EMAIL_MAX_RETRIES, EMAIL_RETRY_BACKOFF_SECONDS
+    )
+    pool = SMTPConnectionPool(
+        host=SMTP_SERVER,
+        port=SMTP_PORT,
+        username=DEFAULT_FROM_EMAIL,
+        password=SMTP_PASSWORD,
+        use_tls=SMTP_USE_TLS,
+        size=SMTP_POOL_SIZE,
+        timeout=SMTP_TIMEOUT,
+        idle_timeout=SMTP_IDLE_TIMEOUT,
+    )
+    worker = EmailDeliveryWorker(
+        pool,
+        sender=DEFAULT_FROM_EMAIL,
+        workers=SMTP_POOL_SIZE,
+        batch_size=EMAIL_BATCH_SIZE,
+        max_retries=EMAIL_MAX_RETRIES,
+        backoff_seconds=EMAIL_RETRY_BACKOFF_SECONDS,
+    )
+    atexit.register(worker.stop)
+    return worker
@@ -1,10 +1,7 @@
-import smtplib
-import ssl
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from typing import Optional
+from typing import List, Optional
 import logging
-from app.core.config import SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, DEFAULT_FROM_EMAIL, ESCALATION_EMAIL
+import threading
+from app.core.config import SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, DEFAULT_FROM_EMAIL, ESCALATION_EMAIL, EMAIL_ASYNC_DELIVERY
 
 logger = logging.getLogger(__name__)
 
@@ -15,36 +12,55 @@ class EmailService:
         self.sender_email = DEFAULT_FROM_EMAIL
         self.sender_password = SMTP_PASSWORD
         self.escalation_email = ESCALATION_EMAIL
-        
-    def send_email(self, to_email: str, subject: str, html_body: str, text_body: Optional[str] = None) -> bool:
+        self.async_delivery = EMAIL_ASYNC_DELIVERY
+        self._delivery = None
+        self._delivery_lock = threading.Lock()
+
+    @property
+    def delivery(self):
+        """Worker di consegna (pool SMTP + coda), creato al primo invio"""
+        if self._delivery is None:
+            with self._delivery_lock:
+                # Due primi invii concorrenti non devono avviare due worker
+                if self._delivery is None:
+                    from app.services.email_delivery import create_default_worker
+                    self._delivery = create_default_worker()
+        return self._delivery
+
+    def send_email(self, to_email: str, subject: str, html_body: str, text_body: Optional[str] = None,
+                   wait: bool = False) -> bool:
+        """Invia (o accoda) una email.
+
+        Con EMAIL_ASYNC_DELIVERY attivo il messaggio viene accodato e il
+        valore di ritorno indica solo l'accodamento; wait=True forza l'invio
+        sincrono sul pool di connessioni e ritorna l'esito della consegna
+        (da usare quando il chiamante registra l'invio, es. ledger SLA).
+        """
+        return self.send_bulk_email([to_email], subject, html_body, text_body, wait=wait)
+
+    def send_bulk_email(self, to_emails: List[str], subject: str, html_body: str, text_body: Optional[str] = None,
+                        wait: bool = False) -> bool:
+        """Stesso messaggio a più destinatari in un'unica transazione SMTP"""
         if not self.sender_password:
             logger.warning("SMTP password not configured")
             return False
-            
+
+        recipients = [e for e in dict.fromkeys(to_emails) if e]
+        if not recipients:
+            return False
+
         try:
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = f"Intelligence Platform <{self.sender_email}>"
-            message["To"] = to_email
-            
-            if text_body:
-                text_part = MIMEText(text_body, "plain", "utf-8")
-                message.attach(text_part)
-            
-            html_part = MIMEText(html_body, "html", "utf-8")
-            message.attach(html_part)
-            
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.sender_email, self.sender_password)
-                server.sendmail(self.sender_email, [to_email], message.as_string())
-            
-            logger.info(f"Email sent successfully to {to_email}")
-            return True
-            
+            if self.async_delivery and not wait:
+                return self.delivery.enqueue(recipients, subject, html_body, text_body)
+            return self.delivery.send_now(recipients, subject, html_body, text_body)
         except Exception as e:
-            logger.error(f"Failed to send email to {to_email}: {str(e)}")
+            logger.error(f"Failed to send email to {', '.join(recipients)}: {str(e)}")
             return False
 
+    def delivery_stats(self) -> dict:
+        """Metriche del worker: profondità coda, inviati/falliti, latenze"""
+        if self._delivery is None:
+            return {"queue_depth": 0, "pending": 0, "sent": 0, "failed": 0, "retries": 0, "started": False}
+        return {**self._delivery.stats(), "started": True}
+
 email_service = EmailService()
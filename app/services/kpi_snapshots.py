@@ -0,0 +1,436 @@
+# app/services/kpi_snapshots.py
+"""Snapshot dei KPI (tabella kpi_snapshots).
+
+I contatori di task, ticket, aziende, attività e commesse I24 vengono
+calcolati in blocco e salvati come JSONB, una riga per chiave. Le
+dashboard leggono la tabella con una sola query invece di rifare i
+COUNT sull'intero database a ogni richiesta.
+
+Aggiornamento:
+- thread in background ogni KPI_SNAPSHOT_INTERVAL secondi (avviato alla prima lettura);
+- anticipato dal thread se in lettura lo snapshot manca o è più vecchio di
+  KPI_SNAPSHOT_MAX_AGE (la richiesta non aspetta il ricalcolo);
+- da cron: python -m app.services.kpi_snapshots
+
+Con più processi il ricalcolo è serializzato da un advisory lock PostgreSQL.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+KPI_SNAPSHOT_INTERVAL = int(os.getenv("KPI_SNAPSHOT_INTERVAL", "300"))
+KPI_SNAPSHOT_MAX_AGE = int(os.getenv("KPI_SNAPSHOT_MAX_AGE", "900"))
+KPI_REFRESH_LOCK_ID = 727001
+# Memoria del payload della KPI dashboard (polling del frontend)
+KPI_DASHBOARD_TTL = int(os.getenv("KPI_DASHBOARD_TTL", "15"))
+
+SNAPSHOT_KEYS = ("tasks", "tickets", "companies", "activities", "incarichi_24")
+
+# Componenti di KPI_SNAPSHOTS_SQL: ognuna diventa un array JSON di righe
+
+# Un solo passaggio su tickets: GROUPING SETS per stato/priorità/owner,
+# il set vuoto () dà totale e semafori (scadenza nulla = rosso)
+TICKET_STATS_SQL = """
+    SELECT status, priority, owner,
+           GROUPING(status) AS g_status, GROUPING(priority) AS g_priority, GROUPING(owner) AS g_owner,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE raw_status = 0) AS open,
+           COUNT(*) FILTER (WHERE due IS NULL OR due < :today) AS red,
+           COUNT(*) FILTER (WHERE due >= :today AND due <= :green_threshold) AS yellow,
+           COUNT(*) FILTER (WHERE due > :green_threshold) AS green,
+           COUNT(*) FILTER (WHERE COALESCE(cardinality(detected_services), 0) = 0) AS without_services
+    FROM (
+        SELECT status AS raw_status,
+               COALESCE(status, 0) AS status,
+               COALESCE(priority, 0) AS priority,
+               COALESCE(NULLIF(owner, ''), 'Sconosciuto') AS owner,
+               CAST(due_date AS DATE) AS due,
+               detected_services
+        FROM tickets
+    ) t
+    GROUP BY GROUPING SETS ((status), (priority), (owner), ())
+"""
+
+# Nome normalizzato come service.strip().lower(): spazi ASCII (anche \f e \v) ai bordi
+TICKET_SERVICES_SQL = """
+    SELECT LOWER(BTRIM(service, E' \\t\\n\\r\\f\\013')) AS service, COUNT(*) AS total
+    FROM tickets, unnest(detected_services) AS service
+    GROUP BY 1
+"""
+
+TASK_STATS_SQL = """
+    SELECT status, priority, owner,
+           GROUPING(status) AS g_status, GROUPING(priority) AS g_priority, GROUPING(owner) AS g_owner,
+           COUNT(*) AS total,
+           COUNT(DISTINCT raw_owner) FILTER (WHERE raw_status <> 'chiuso') AS active_owners
+    FROM (
+        SELECT status AS raw_status,
+               owner AS raw_owner,
+               COALESCE(NULLIF(status, ''), 'sconosciuto') AS status,
+               COALESCE(NULLIF(priority, ''), 'sconosciuto') AS priority,
+               COALESCE(NULLIF(owner, ''), 'Sconosciuto') AS owner
+        FROM tasks
+    ) t
+    GROUP BY GROUPING SETS ((status), (priority), (owner), ())
+"""
+
+# Stati così come sono (NULL e '' compresi), per taskStatusBreakdown della KPI dashboard
+TASK_STATUS_BREAKDOWN_SQL = """
+    SELECT status, COUNT(*) AS total FROM tasks GROUP BY status
+"""
+
+INCARICHI_24_SQL = """
+    SELECT COUNT(DISTINCT t.id) AS totale,
+           COUNT(ta.id) AS fasi_totali,
+           COUNT(ta.id) FILTER (WHERE ta.status = 'chiuso') AS fasi_concluse
+    FROM tickets t
+    JOIN tasks ta ON ta.ticket_id = t.id
+    WHERE t.ticket_code LIKE 'TCK-I24%'
+"""
+
+# activities.detected_services è testo "Servizio A, Servizio B" (PATCH /activities/{id}/services)
+ACTIVITY_STATS_SQL = """
+    SELECT COUNT(*) FILTER (WHERE created >= DATE_TRUNC('month', NOW())) AS current_month,
+           COUNT(*) FILTER (WHERE created >= DATE_TRUNC('month', NOW() - INTERVAL '1 month')
+                              AND created < DATE_TRUNC('month', NOW())) AS previous_month,
+           COUNT(*) FILTER (WHERE created >= NOW() - INTERVAL '30 days') AS last_30_days,
+           COUNT(*) FILTER (WHERE created >= NOW() - INTERVAL '30 days' AND status = 'completed') AS completed_30_days
+    FROM (SELECT creation_date::timestamp AS created, status FROM activities) a
+"""
+
+ACTIVITY_SERVICES_SQL = """
+    SELECT service, COUNT(*) AS total
+    FROM (
+        SELECT BTRIM(regexp_split_to_table(detected_services, ',')) AS service
+        FROM activities
+        WHERE detected_services IS NOT NULL
+          AND creation_date::timestamp >= NOW() - INTERVAL '30 days'
+    ) s
+    WHERE service <> ''
+    GROUP BY service
+    ORDER BY total DESC, service
+    LIMIT 5
+"""
+
+KPI_COMPONENTS = {
+    "ticket_stats": TICKET_STATS_SQL,
+    "ticket_services": TICKET_SERVICES_SQL,
+    "task_stats": TASK_STATS_SQL,
+    "task_status_breakdown": TASK_STATUS_BREAKDOWN_SQL,
+    "incarichi_24": INCARICHI_24_SQL,
+    "activity_stats": ACTIVITY_STATS_SQL,
+    "activity_services": ACTIVITY_SERVICES_SQL,
+    "companies": "SELECT COUNT(*) AS total FROM companies",
+}
+
+# Tutti gli snapshot in un solo round trip: ogni componente è un array JSON delle sue righe
+KPI_SNAPSHOTS_SQL = text("SELECT " + ",\n       ".join(
+    f"(SELECT COALESCE(jsonb_agg(to_jsonb(q) - 'ord' ORDER BY q.ord), CAST('[]' AS JSONB)) "
+    f"FROM (SELECT c.*, ROW_NUMBER() OVER () AS ord FROM ({sql}) c) q) AS {name}"
+    for name, sql in KPI_COMPONENTS.items()
+))
+
+# Contatori della KPI dashboard in un solo round trip, se lo snapshot non è pronto
+KPI_DASHBOARD_SQL = text("""
+    SELECT t.total, t.active_owners, b.status_breakdown, k.open_tickets, k.total_tickets, c.companies,
+           current_database() AS database_name
+    FROM (SELECT COUNT(*) AS total,
+                 COUNT(DISTINCT owner) FILTER (WHERE status <> 'chiuso') AS active_owners
+          FROM tasks) t,
+         (SELECT COALESCE(jsonb_agg(to_jsonb(s)), CAST('[]' AS JSONB)) AS status_breakdown
+          FROM (""" + TASK_STATUS_BREAKDOWN_SQL + """) s) b,
+         (SELECT COUNT(*) FILTER (WHERE status = 0) AS open_tickets, COUNT(*) AS total_tickets
+          FROM tickets) k,
+         (SELECT COUNT(*) AS companies FROM companies) c
+""")
+
+UPSERT_SNAPSHOT_SQL = text("""
+    INSERT INTO kpi_snapshots (key, data, refreshed_at)
+    VALUES (:key, CAST(:data AS JSONB), :refreshed_at)
+    ON CONFLICT (key) DO UPDATE SET data = EXCLUDED.data, refreshed_at = EXCLUDED.refreshed_at
+""")
+
+
+def split_grouping_sets(rows):
+    """Righe GROUPING SETS -> (riga totale, per stato, per priorità, per owner)"""
+    totals = None
+    by_status, by_priority, by_owner = {}, {}, {}
+    for row in rows:
+        if not row["g_status"]:
+            by_status[row["status"]] = row["total"]
+        elif not row["g_priority"]:
+            by_priority[row["priority"]] = row["total"]
+        elif not row["g_owner"]:
+            by_owner[row["owner"]] = row["total"]
+        else:
+            totals = row
+    return totals, by_status, by_priority, by_owner
+
+
+def compute_kpi_snapshots(conn) -> Dict[str, dict]:
+    """Calcola tutti gli snapshot con KPI_SNAPSHOTS_SQL (un round trip, solo conteggi dal DB)"""
+    today = datetime.utcnow().date()
+    green_threshold = today + timedelta(days=3)
+    row = conn.execute(KPI_SNAPSHOTS_SQL, {"today": today, "green_threshold": green_threshold}).fetchone()
+
+    totals, by_status, by_priority, by_owner = split_grouping_sets(row.ticket_stats)
+    tickets = {
+        "total": totals["total"],
+        "open": totals["open"],
+        "by_status": by_status,
+        "by_priority": by_priority,
+        "by_owner": by_owner,
+        "semafori": {"green": totals["green"], "yellow": totals["yellow"], "red": totals["red"]},
+        "services": {item["service"]: item["total"] for item in row.ticket_services},
+        "without_services": totals["without_services"],
+    }
+
+    totals, by_status, by_priority, by_owner = split_grouping_sets(row.task_stats)
+    tasks = {
+        "total": totals["total"],
+        "active_owners": totals["active_owners"],
+        "by_status": by_status,
+        "by_priority": by_priority,
+        "by_owner": by_owner,
+        "status_breakdown": row.task_status_breakdown,
+    }
+
+    incarichi = row.incarichi_24[0]
+    activities = row.activity_stats[0]
+
+    return {
+        "tasks": tasks,
+        "tickets": tickets,
+        "companies": {"total": row.companies[0]["total"]},
+        "activities": {
+            "current_month": activities["current_month"],
+            "previous_month": activities["previous_month"],
+            "last_30_days": activities["last_30_days"],
+            "completed_30_days": activities["completed_30_days"],
+            "services_30_days": [
+                {"servizio": item["service"], "count": item["total"]}
+                for item in row.activity_services
+            ],
+        },
+        "incarichi_24": {
+            "totale": incarichi["totale"],
+            "fasi_totali": incarichi["fasi_totali"],
+            "fasi_concluse": incarichi["fasi_concluse"],
+        },
+    }
+
+
+def refresh_kpi_snapshots(if_older_than: Optional[int] = None, db_engine=None) -> Optional[Dict[str, dict]]:
+    """Ricalcola e salva gli snapshot.
+
+    Restituisce None se un altro processo sta già aggiornando o se gli
+    snapshot sono più recenti di if_older_than secondi.
+    """
+    started = datetime.utcnow()
+    with (db_engine or engine).begin() as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:lock_id)"), {"lock_id": KPI_REFRESH_LOCK_ID}).scalar():
+            logger.info("⏭️ Snapshot KPI già in aggiornamento in un altro processo")
+            return None
+        if if_older_than is not None:
+            oldest = conn.execute(text("SELECT MIN(refreshed_at) FROM kpi_snapshots")).scalar()
+            if oldest and started - oldest < timedelta(seconds=if_older_than):
+                return None
+
+        snapshots = compute_kpi_snapshots(conn)
+        conn.execute(UPSERT_SNAPSHOT_SQL, [
+            {"key": key, "data": json.dumps(data), "refreshed_at": started}
+            for key, data in snapshots.items()
+        ])
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    logger.info(f"📸 Snapshot KPI aggiornati in {elapsed:.2f}s")
+    return snapshots
+
+
+def load_kpi_snapshots(db) -> Dict[str, dict]:
+    """Tutti gli snapshot in una query; aggiunge 'refreshed_at' (il più vecchio)"""
+    rows = db.execute(text("SELECT key, data, refreshed_at, current_database() AS database_name FROM kpi_snapshots")).fetchall()
+    snapshots = {row.key: row.data for row in rows}
+    snapshots["refreshed_at"] = min((row.refreshed_at for row in rows), default=None)
+    snapshots["database_name"] = rows[0].database_name if rows else None
+    return snapshots
+
+
+def snapshots_complete(snapshots: Dict[str, dict]) -> bool:
+    return all(key in snapshots for key in SNAPSHOT_KEYS)
+
+
+def snapshots_fresh(snapshots: Dict[str, dict]) -> bool:
+    refreshed_at = snapshots["refreshed_at"]
+    return (snapshots_complete(snapshots) and refreshed_at is not None
+            and datetime.utcnow() - refreshed_at <= timedelta(seconds=KPI_SNAPSHOT_MAX_AGE))
+
+
+def get_kpi_snapshots(db) -> Dict[str, dict]:
+    """Snapshot per le dashboard, senza mai ricalcolarli nella richiesta.
+
+    Se sono vecchi si servono comunque e si anticipa il giro del thread;
+    se mancano (primo avvio) si calcolano con KPI_SNAPSHOTS_SQL senza salvarli.
+    """
+    kpi_refresher.ensure_started()
+    snapshots = load_kpi_snapshots(db)
+    if snapshots_fresh(snapshots):
+        return snapshots
+    kpi_refresher.request_refresh()
+    if snapshots_complete(snapshots):
+        return snapshots
+
+    live = compute_kpi_snapshots(db)
+    live["refreshed_at"] = datetime.utcnow()
+    live["database_name"] = db.execute(text("SELECT current_database()")).scalar()
+    return live
+
+
+def live_kpi_dashboard(db) -> Dict[str, dict]:
+    """Contatori della KPI dashboard con KPI_DASHBOARD_SQL, nella forma degli snapshot"""
+    row = db.execute(KPI_DASHBOARD_SQL).fetchone()
+    return {
+        "tasks": {"total": row.total, "active_owners": row.active_owners, "status_breakdown": row.status_breakdown},
+        "tickets": {"total": row.total_tickets, "open": row.open_tickets},
+        "companies": {"total": row.companies},
+        "refreshed_at": datetime.utcnow(),
+        "database_name": row.database_name,
+    }
+
+
+def kpi_dashboard_payload(snapshots: Dict[str, dict]) -> dict:
+    """Risposta di /api/intellichat/kpi_dashboard dagli snapshot"""
+    tasks = snapshots["tasks"]
+    tickets = snapshots["tickets"]
+    total = tasks["total"]
+    # Stati grezzi come GROUP BY status (NULL e '' restano chiavi distinte);
+    # gli snapshot salvati prima di status_breakdown hanno solo by_status
+    breakdown = ({item["status"]: item["total"] for item in tasks["status_breakdown"]}
+                 if "status_breakdown" in tasks else tasks["by_status"])
+    completed = breakdown.get("chiuso", 0)
+    refreshed_at = snapshots.get("refreshed_at")
+    return {
+        "totalTasks": total,
+        "completedTasks": completed,
+        "openTasks": breakdown.get("aperto", 0),
+        "activeUsers": tasks["active_owners"],
+        "openTickets": tickets["open"],
+        "totalTickets": tickets["total"],
+        "companiesCount": snapshots["companies"]["total"],
+        "completionRate": round((completed / total * 100), 1) if total > 0 else 0,
+        "taskStatusBreakdown": breakdown,
+        "databaseName": snapshots.get("database_name"),
+        "lastUpdate": refreshed_at.isoformat() if refreshed_at else None
+    }
+
+
+class KPIDashboard:
+    """Payload di /api/intellichat/kpi_dashboard memorizzato per KPI_DASHBOARD_TTL secondi.
+
+    Ogni ricalcolo è un solo round trip: lettura degli snapshot o, se non
+    sono pronti, KPI_DASHBOARD_SQL (e il thread aggiorna gli snapshot).
+    """
+
+    def __init__(self, ttl: int = KPI_DASHBOARD_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._payload: Optional[dict] = None
+        self._loaded_at = 0.0
+
+    def get(self, db) -> dict:
+        # Il lock evita che più richieste simultanee ricalcolino insieme
+        with self._lock:
+            if self._payload is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._payload = kpi_dashboard_payload(self._load(db))
+                self._loaded_at = time.monotonic()
+            return self._payload
+
+    def _load(self, db) -> Dict[str, dict]:
+        kpi_refresher.ensure_started()
+        snapshots = load_kpi_snapshots(db)
+        if snapshots_fresh(snapshots):
+            return snapshots
+        kpi_refresher.request_refresh()
+        return live_kpi_dashboard(db)
+
+    def invalidate(self):
+        with self._lock:
+            self._payload = None
+
+
+class KPISnapshotRefresher:
+    """Thread che aggiorna gli snapshot a intervalli regolari (uno per processo)"""
+
+    def __init__(self, interval: int = KPI_SNAPSHOT_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_refresh: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def ensure_started(self):
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="kpi-snapshots", daemon=True)
+            self._thread.start()
+
+    def request_refresh(self):
+        """Anticipa il prossimo giro (snapshot trovati vecchi in lettura)"""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                # Se un altro processo ha appena aggiornato, questo giro si salta
+                if refresh_kpi_snapshots(if_older_than=self.interval // 2) is not None:
+                    self.last_refresh = datetime.utcnow()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"❌ Aggiornamento snapshot KPI fallito: {e}")
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "last_refresh": self.last_refresh.isoformat() if self.last_refresh else None,
+            "last_error": self.last_error,
+        }
+
+
+kpi_refresher = KPISnapshotRefresher()
+kpi_dashboard = KPIDashboard()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    result = refresh_kpi_snapshots()
+    print("✅ Snapshot KPI aggiornati" if result is not None else "⏭️ Aggiornamento già in corso")
+    sys.exit(0)
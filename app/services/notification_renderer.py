@@ -0,0 +1,80 @@
+import os
+import logging
+from typing import Iterable, List
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "email")
+DASHBOARD_URL = os.getenv("DASHBOARD_URL", "https://intelligence.enduser-digital.com/dashboard")
+
+# Notifiche disponibili: oggetto (template inline) + corpo html/testo su file
+NOTIFICATIONS = {
+    "ticket_created": "🧠 Intelligence - Nuovo Ticket {{ service.label }}: {{ ticket.title }}",
+    "sla_escalation": "🚨 ESCALATION - Task Scaduto: {{ task.title }}",
+    "sla_warning": "⚠️ WARNING - Task in Scadenza: {{ task.title }}",
+    "sla_digest": "📋 Riepilogo SLA - {{ escalations | length }} task scaduti, {{ warnings | length }} in scadenza",
+}
+
+
+def _datefmt(value, fmt: str = "%d/%m/%Y %H:%M", default: str = "N/A") -> str:
+    return value.strftime(fmt) if value else default
+
+
+def _create_environment() -> Environment:
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=select_autoescape(["html"], default_for_string=False),
+        undefined=StrictUndefined,
+        auto_reload=False,   # i template non cambiano a runtime: niente stat() per render
+        cache_size=-1,
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+    env.filters["datefmt"] = _datefmt
+    env.globals["dashboard_url"] = DASHBOARD_URL
+    return env
+
+
+class NotificationRenderer:
+    """Rendering delle email di notifica da template Jinja2 precompilati.
+
+    Tutti i template vengono compilati una volta sola alla creazione; i
+    render successivi (anche in batch) riusano i template già compilati.
+    """
+
+    def __init__(self):
+        self.env = _create_environment()
+        self._compiled = {
+            name: (
+                self.env.from_string(subject),
+                self.env.get_template(f"{name}.html"),
+                self.env.get_template(f"{name}.txt"),
+            )
+            for name, subject in NOTIFICATIONS.items()
+        }
+
+    def render(self, name: str, **context) -> dict:
+        """Ritorna {subject, html_body, text_body} pronto per email_service"""
+        subject, html, text = self._compiled[name]
+        return {
+            "subject": subject.render(context).strip(),
+            "html_body": html.render(context),
+            "text_body": text.render(context).strip(),
+        }
+
+    def render_batch(self, name: str, contexts: Iterable[dict]) -> List[dict]:
+        """Render di molte notifiche dello stesso tipo in una sola chiamata"""
+        subject, html, text = self._compiled[name]
+        return [
+            {
+                "subject": subject.render(context).strip(),
+                "html_body": html.render(context),
+                "text_body": text.render(context).strip(),
+            }
+            for context in contexts
+        ]
+
+
+notification_renderer = NotificationRenderer()
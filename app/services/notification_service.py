@@ -1,51 +1,76 @@
 from app.services.email_service import email_service
-from app.services.opportunity_creator import get_service_owner
+from app.services.notification_renderer import notification_renderer
 from app.models.user import User
 from sqlalchemy.orm import Session
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Personalizzazione email per tipo servizio (codice nel ticket_code)
+DEFAULT_SERVICE_STYLE = {"label": "Servizio", "color": "#667eea"}
+SERVICE_STYLES = {
+    "I24": {"label": "I24", "color": "#28a745", "heading": "Nuovo Incarico 24 Mesi",
+            "intro": "È stato creato un nuovo Incarico 24 mesi:", "cta": "Visualizza Incarico I24",
+            "noun": "incarico I24", "show_priority": False},
+    "KHW": {"label": "Know How", "color": "#28a745"},
+    "PBX": {"label": "Patent Box", "color": "#17a2b8"},
+    "F40": {"label": "Formazione 4.0", "color": "#ffc107"},
+    "T50": {"label": "Transizione 5.0", "color": "#6f42c1"},
+    "BND": {"label": "Bandi", "color": "#fd7e14"},
+}
+
+
+def ticket_service_style(ticket_code: str) -> dict:
+    """Stile (etichetta, colore, testi) della notifica in base al codice ticket"""
+    style = DEFAULT_SERVICE_STYLE
+    for code, candidate in SERVICE_STYLES.items():
+        if ticket_code and code in ticket_code:
+            style = candidate
+            break
+    label = style["label"]
+    return {
+        "heading": f"Nuovo Ticket {label}",
+        "intro": f"Ti è stato assegnato un nuovo ticket {label}:",
+        "cta": f"Visualizza Ticket {label}",
+        "noun": f"ticket {label}",
+        "show_priority": True,
+        **style,
+    }
+
+
 def send_ticket_notification(ticket_id: int, db: Session) -> bool:
-    """Invia notifica creazione ticket"""
+    """Invia notifica creazione ticket al responsabile (owner_id del ticket)"""
     try:
         # Importa qui per evitare circular import
         from app.models.ticket import Ticket
-        
+
         ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
         if not ticket:
+            logger.error(f"Ticket {ticket_id} not found for notification")
             return False
-        
-        # Determina owner
-        owner_id = None
-        if ticket.opportunity_code:
-            owner_id = get_service_owner(ticket.opportunity_code, db)
-        
-        if not owner_id:
-            owner_id = ticket.owner
-            
+
+        owner_id = ticket.owner_id
         if not owner_id:
+            logger.error(f"No owner found for ticket {ticket_id}")
             return False
-            
+
         # Get user email
-        owner = db.query(User).filter(User.id == owner_id).first()
+        owner = db.query(User).filter(User.id == str(owner_id)).first()
         if not owner or not owner.email:
+            logger.error(f"Owner {owner_id} not found or no email for ticket {ticket_id}")
             return False
-            
-        # Send email
-        return email_service.send_email(
-            to_email=owner.email,
-            subject=f"Nuovo Ticket - {ticket.title}",
-            html_body=f"""
-            <h2>Intelligence Platform - Nuovo Ticket</h2>
-            <p><strong>Titolo:</strong> {ticket.title}</p>
-            <p><strong>Codice:</strong> {ticket.code}</p>
-            <p><strong>Cliente:</strong> {ticket.customer_name or 'N/A'}</p>
-            <p><a href="https://intelligence.enduser-digital.com/dashboard/">Vai alla Dashboard</a></p>
-            """,
-            text_body=f"Nuovo ticket: {ticket.title} ({ticket.code}) - Cliente: {ticket.customer_name or 'N/A'}"
-        )
-        
+
+        service = ticket_service_style(ticket.ticket_code)
+        email = notification_renderer.render("ticket_created", ticket=ticket, owner=owner, service=service)
+        success = email_service.send_email(to_email=owner.email, **email)
+
+        if success:
+            logger.info(f"Email notification sent successfully for {service['label']} ticket {ticket_id}")
+        else:
+            logger.warning(f"Email notification failed for {service['label']} ticket {ticket_id}")
+
+        return success
+
     except Exception as e:
         logger.error(f"Error sending ticket notification: {e}")
         return False
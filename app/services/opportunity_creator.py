@@ -17,6 +17,7 @@ from app.models.milestone import Milestone
 from app.models.phase_template import PhaseTemplate
 from app.models.service_user_association import ServiceUserAssociation
 from app.models.task import Task
+from app.services.notification_service import send_ticket_notification
 from app.core.database import SessionLocal
 
 DEFAULT_ACTIVITY_SUBTYPE = 63705
@@ -43,115 +44,6 @@ def get_service_owner(service_code: str, db_session):
         print(f"❌ Errore ricerca owner per {service_code}: {e}")
         return None
 
-def send_ticket_notification(ticket_id: int, db_session) -> bool:
-    """Invia notifica creazione ticket"""
-    try:
-        from app.services.email_service import email_service
-        from app.models.user import User
-        
-        ticket = db_session.query(Ticket).filter(Ticket.id == ticket_id).first()
-        if not ticket:
-            logger.error(f"Ticket {ticket_id} not found for notification")
-            return False
-        
-        # Determina owner dal ticket
-        owner_id = ticket.owner_id
-        if not owner_id:
-            logger.error(f"No owner found for ticket {ticket_id}")
-            return False
-            
-        # Get user email
-        owner = db_session.query(User).filter(User.id == str(owner_id)).first()
-        if not owner or not owner.email:
-            logger.error(f"Owner {owner_id} not found or no email for ticket {ticket_id}")
-            return False
-        
-        # Determina tipo servizio dal ticket code per personalizzare email
-        service_type = "Servizio"
-        service_color = "#667eea"  # Default blue
-        if ticket.ticket_code and "KHW" in ticket.ticket_code:
-            service_type = "Know How"
-            service_color = "#28a745"  # Green
-        elif ticket.ticket_code and "PBX" in ticket.ticket_code:
-            service_type = "Patent Box"
-            service_color = "#17a2b8"  # Cyan
-        elif ticket.ticket_code and "F40" in ticket.ticket_code:
-            service_type = "Formazione 4.0"
-            service_color = "#ffc107"  # Yellow
-        elif ticket.ticket_code and "T50" in ticket.ticket_code:
-            service_type = "Transizione 5.0"
-            service_color = "#6f42c1"  # Purple
-        elif ticket.ticket_code and "BND" in ticket.ticket_code:
-            service_type = "Bandi"
-            service_color = "#fd7e14"  # Orange
-            
-        # Send email
-        success = email_service.send_email(
-            to_email=owner.email,
-            subject=f"🧠 Intelligence - Nuovo Ticket {service_type}: {ticket.title}",
-            html_body=f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <div style="background: linear-gradient(135deg, {service_color} 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 8px 8px 0 0;">
-                    <h1 style="margin: 0;">🧠 Intelligence Platform</h1>
-                    <h2 style="margin: 10px 0 0 0;">Nuovo Ticket {service_type}</h2>
-                </div>
-                
-                <div style="background: #f8f9fa; padding: 30px; border-radius: 0 0 8px 8px;">
-                    <p>Ciao <strong>{owner.name}</strong>,</p>
-                    <p>Ti è stato assegnato un nuovo ticket {service_type}:</p>
-                    
-                    <div style="background: white; border-radius: 8px; padding: 20px; margin: 20px 0; border-left: 4px solid {service_color};">
-                        <h3 style="margin-top: 0; color: #333;">{ticket.title}</h3>
-                        <p><strong>Codice:</strong> {ticket.ticket_code}</p>
-                        <p><strong>Cliente:</strong> {ticket.customer_name or 'N/A'}</p>
-                        <p><strong>Account:</strong> {ticket.account or 'N/A'}</p>
-                        <p><strong>Priorità:</strong> {ticket.priority or 'Media'}</p>
-                        <p><strong>Scadenza:</strong> {ticket.due_date.strftime('%d/%m/%Y') if ticket.due_date else 'Non specificata'}</p>
-                    </div>
-                    
-                    <p style="text-align: center; margin: 30px 0;">
-                        <a href="https://intelligence.enduser-digital.com/dashboard/ticket/{ticket.id}" 
-                           style="background: {service_color}; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; display: inline-block;">
-                            Visualizza Ticket {service_type}
-                        </a>
-                    </p>
-                    
-                    <hr style="margin: 30px 0; border: none; border-top: 1px solid #eee;">
-                    <p style="font-size: 12px; color: #666;">
-                        Ricevi questa email perché sei il responsabile di questo ticket {service_type}.
-                    </p>
-                </div>
-            </div>
-            """,
-            text_body=f"""
-            Intelligence Platform - Nuovo Ticket {service_type}
-            
-            Ciao {owner.name},
-            
-            Ti è stato assegnato un nuovo ticket {service_type}:
-            
-            Titolo: {ticket.title}
-            Codice: {ticket.ticket_code}
-            Cliente: {ticket.customer_name or 'N/A'}
-            Account: {ticket.account or 'N/A'}
-            Priorità: {ticket.priority or 'Media'}
-            Scadenza: {ticket.due_date.strftime('%d/%m/%Y') if ticket.due_date else 'Non specificata'}
-            
-            Visualizza: https://intelligence.enduser-digital.com/dashboard/ticket/{ticket.id}
-            """
-        )
-        
-        if success:
-            logger.info(f"Email notification sent successfully for {service_type} ticket {ticket_id}")
-        else:
-            logger.warning(f"Email notification failed for {service_type} ticket {ticket_id}")
-            
-        return success
-        
-    except Exception as e:
-        logger.error(f"Error sending ticket notification: {e}")
-        return False
-
 def create_and_sync_opportunities(ticket: Ticket, db_session=None):
     if db_session is None:
         db_session = SessionLocal()
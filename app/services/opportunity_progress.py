@@ -0,0 +1,154 @@
+# app/services/opportunity_progress.py
+"""Avanzamento di ticket e servizi per le dashboard.
+
+Le fasi (task) dei ticket si caricano con due query a colonne (ticket
+e task, senza oggetti ORM) e si raggruppano in memoria per ticket; le
+viste per servizio partono da lì senza altre query per ticket o per
+opportunità. Le viste per servizio riconosciuto non caricano i ticket
+TCK-I24 né quelli senza fasi (include_i24=False).
+
+Usato da /dashboard/opportunities/progress_v2 e /by_service
+(app/routes/dashboard_api.py) e da get_opportunities_progress_data
+(app/services/dashboard_data.py).
+"""
+
+from collections import defaultdict
+from typing import Dict, List
+
+from sqlalchemy import exists
+from sqlalchemy.orm import Session
+
+from app.models.opportunity import Opportunity
+from app.models.task import Task
+from app.models.ticket import Ticket
+
+I24_PREFIX = "TCK-I24"
+
+# Prefisso del codice opportunità -> servizio
+SERVICE_LABELS = {
+    "F40": "Formazione 4.0",
+    "KHW": "Know How",
+    "T50": "Transizione 5.0",
+    "PBX": "Patent Box",
+    "CBK": "Cashback",
+    "FND": "Finanziamenti",
+    "BND": "Bandi",
+    "CLB": "Collaborazione",
+    "GEN": "Generico",
+    "ALT": "Altro",
+}
+
+
+def load_ticket_progress(db: Session, include_i24: bool = True) -> List[dict]:
+    """Ticket con le loro fasi, in ordine di id.
+
+    Con include_i24=False carica solo i ticket delle viste per servizio
+    riconosciuto (tickets_by_detected_service): codice non NULL (anche
+    vuoto, come il vecchio NOT LIKE) e non TCK-I24, almeno una fase. Il
+    filtro è in SQL, anche per i task.
+    """
+    task_query = db.query(Task.ticket_id, Task.title, Task.status)
+    ticket_query = db.query(Ticket.id, Ticket.ticket_code, Ticket.customer_name, Ticket.detected_services)
+    if not include_i24:
+        # NOT LIKE su NULL non è vero: i ticket senza codice restano fuori
+        service_ticket = Ticket.ticket_code.notlike(f"{I24_PREFIX}%")
+        task_query = task_query.join(Ticket, Ticket.id == Task.ticket_id).filter(service_ticket)
+        ticket_query = ticket_query.filter(service_ticket, exists().where(Task.ticket_id == Ticket.id))
+
+    phases = defaultdict(list)
+    for ticket_id, title, status in task_query.order_by(Task.ticket_id, Task.id):
+        phases[ticket_id].append({"title": title, "status": status})
+
+    tickets = []
+    for ticket_id, ticket_code, customer_name, detected_services in ticket_query.order_by(Ticket.id):
+        fasi = phases.get(ticket_id, [])
+        tickets.append({
+            "id": ticket_id,
+            "ticket_code": ticket_code,
+            "customer_name": customer_name,
+            "detected_services": detected_services,
+            "fasi": fasi,
+            "fasi_totali": len(fasi),
+            "fasi_concluse": sum(1 for fase in fasi if fase["status"] == "chiuso"),
+        })
+    return tickets
+
+
+def ticket_detail(ticket: dict) -> dict:
+    return {
+        "ticket": ticket["ticket_code"],
+        "fasi_totali": ticket["fasi_totali"],
+        "fasi_concluse": ticket["fasi_concluse"],
+        "fasi": ticket["fasi"],
+    }
+
+
+def is_i24(ticket: dict) -> bool:
+    return bool(ticket["ticket_code"]) and ticket["ticket_code"].startswith(I24_PREFIX)
+
+
+def incarichi_summary(tickets: List[dict]) -> dict:
+    """Totali delle commesse 24 mesi (ticket TCK-I24)"""
+    incarichi = [t for t in tickets if is_i24(t)]
+    return {
+        "totale": len(incarichi),
+        "fasi_totali": sum(t["fasi_totali"] for t in incarichi),
+        "fasi_concluse": sum(t["fasi_concluse"] for t in incarichi),
+    }
+
+
+def tickets_by_detected_service(tickets: List[dict]) -> Dict[str, List[dict]]:
+    """Ticket non I24 con almeno una fase, raggruppati per servizio riconosciuto.
+
+    Come ticket_code NOT LIKE 'TCK-I24%': esclusi i codici NULL, non quelli vuoti.
+    """
+    service_map = {}
+    for ticket in tickets:
+        if ticket["ticket_code"] is None or is_i24(ticket) or not ticket["fasi"]:
+            continue
+        for service in ticket["detected_services"] or []:
+            service_map.setdefault(service, []).append(ticket)
+    return service_map
+
+
+def progress_by_detected_service(tickets: List[dict]) -> List[dict]:
+    return [
+        {
+            "servizio": service,
+            "ticket_count": len(service_tickets),
+            "dettagli": [ticket_detail(t) for t in service_tickets],
+        }
+        for service, service_tickets in tickets_by_detected_service(tickets).items()
+    ]
+
+
+def status_counts_by_detected_service(tickets: List[dict]) -> Dict[str, dict]:
+    service_counts = {}
+    for service, service_tickets in tickets_by_detected_service(tickets).items():
+        counts = service_counts.setdefault(service, {"aperto": 0, "in_corso": 0, "chiuso": 0})
+        for ticket in service_tickets:
+            for fase in ticket["fasi"]:
+                counts[fase["status"]] = counts.get(fase["status"], 0) + 1
+    return service_counts
+
+
+def progress_by_opportunity_service(db: Session, tickets: List[dict]) -> List[dict]:
+    """Per servizio (prefisso del codice opportunità): ticket TCK-<prefisso> dello stesso cliente"""
+    # Come il filtro ORM customer_name == cliente: cliente None abbina i ticket senza cliente (IS NULL)
+    tickets_by_customer = defaultdict(list)
+    for ticket in tickets:
+        if ticket["ticket_code"]:
+            tickets_by_customer[ticket["customer_name"]].append(ticket)
+
+    service_map = {}
+    for codice, cliente in db.query(Opportunity.codice, Opportunity.cliente).order_by(Opportunity.id):
+        if not codice:
+            continue
+        prefix = codice[:3]
+        label = SERVICE_LABELS.get(prefix, codice)
+        entry = service_map.setdefault(label, {"servizio": label, "ticket_count": 0, "dettagli": []})
+
+        matched = [t for t in tickets_by_customer.get(cliente, []) if t["ticket_code"].startswith(f"TCK-{prefix}")]
+        entry["ticket_count"] += len(matched)
+        entry["dettagli"].extend(ticket_detail(t) for t in matched)
+    return list(service_map.values())
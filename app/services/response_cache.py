@@ -0,0 +1,100 @@
+# app/services/response_cache.py
+
+import json
+import hashlib
+import threading
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+def read_cache_version(db: Session, name: str) -> Optional[int]:
+    """Versione condivisa in cache_versions, None se la tabella non è disponibile (migrazione non applicata)"""
+    try:
+        return db.execute(
+            text("SELECT version FROM cache_versions WHERE name = :name"), {"name": name}
+        ).scalar() or 0
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"⚠️ Versione cache {name} non leggibile ({e})")
+        return None
+
+
+class VersionedResponseCache:
+    """Cache di risposte JSON legata a un contatore di versione nel database.
+
+    La versione sta in cache_versions ed è incrementata dai trigger sulle
+    tabelle sorgente (migrazione 0007) nella stessa transazione di ogni
+    scrittura: vale per tutti i worker e per qualunque scrittore (route,
+    script, SQL a mano). Ogni richiesta legge la versione con una query per
+    chiave primaria; se è cambiata la risposta viene ricostruita. Ogni
+    risposta ha un ETag (versione + hash del contenuto): se il client manda
+    If-None-Match uguale, risponde 304 senza ricostruire nulla.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._entries: Dict[str, Tuple[int, str, bytes]] = {}  # key -> (versione, etag, body)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.uncached = 0
+
+    def current_version(self, db: Session) -> Optional[int]:
+        """Versione condivisa, None (risposta senza cache) se non leggibile"""
+        return read_cache_version(db, self.name)
+
+    def _build(self, key: str, version: int, builder: Callable[[], Any]):
+        body = json.dumps(jsonable_encoder(builder()), ensure_ascii=False).encode("utf-8")
+        etag = f'W/"{self.name}-{version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        entry = (version, etag, body)
+        with self._lock:
+            # Non sostituire una risposta già costruita su una versione più recente
+            current = self._entries.get(key)
+            if current is None or current[0] <= version:
+                self._entries[key] = entry
+        return entry
+
+    def respond(self, request: Request, db: Session, key: str, builder: Callable[[], Any]) -> Response:
+        """Risposta JSON dalla cache (o costruita con builder), con ETag e 304"""
+        version = self.current_version(db)
+        if version is None:
+            self.uncached += 1
+            return Response(content=json.dumps(jsonable_encoder(builder()), ensure_ascii=False).encode("utf-8"),
+                            media_type="application/json")
+
+        entry = self._entries.get(key)
+        if entry and entry[0] == version:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = self._build(key, version, builder)
+        _, etag, body = entry
+
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")]:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        return {
+            "versions": {key: entry[0] for key, entry in self._entries.items()},
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "uncached": self.uncached,
+        }
+
+
+# Servizi, commesse, milestones, template e associazioni servizio-utente
+catalogue_cache = VersionedResponseCache("catalogue")
@@ -0,0 +1,155 @@
+# app/services/service_catalogue.py
+
+import os
+import time
+import threading
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from app.services.service_matcher import PhraseMatcher
+
+logger = logging.getLogger(__name__)
+
+# Servizi interni esclusi dal riconoscimento
+INTERNAL_SERVICE_CODES = ("I24", "TICKET_INT")
+
+# Varianti di scrittura per nome servizio (minuscolo)
+SERVICE_SYNONYMS: Dict[str, List[str]] = {
+    "formazione 4.0": ["formazione quattro punto zero", "formazioni 4.0"],
+    "patent box": ["patentbox"],
+    "know how": ["knowhow"],
+    "bandi": ["bando", "incentivi"],
+    "finanziamenti": ["finanziamento"],
+}
+
+# Usato solo se il database non è raggiungibile
+FALLBACK_SERVICES: List[Tuple[str, str]] = [
+    ("F40", "Formazione 4.0"),
+    ("T50", "Transizione 5.0"),
+    ("KHW", "Know How"),
+    ("PBX", "Patent Box"),
+    ("BND", "Bandi"),
+    ("FND", "Finanziamenti"),
+]
+
+# Versione in cache_versions incrementata dai trigger su sub_types (migrazione 0007)
+CATALOGUE_CACHE_NAME = "catalogue"
+# Intervallo minimo tra due letture della versione (il parser gira per ogni attività)
+SERVICE_CATALOGUE_CHECK_SECONDS = float(os.getenv("SERVICE_CATALOGUE_CHECK_SECONDS", "1"))
+
+
+@dataclass(frozen=True)
+class ServiceEntry:
+    code: str
+    name: str
+    synonyms: Tuple[str, ...] = field(default_factory=tuple)
+
+    @property
+    def phrases(self) -> Tuple[str, ...]:
+        """Nome (minuscolo) seguito dai sinonimi"""
+        return (self.name.lower().strip(),) + self.synonyms
+
+
+def build_entries(rows) -> List[ServiceEntry]:
+    entries = []
+    for code, name in rows:
+        if not code or not name or code in INTERNAL_SERVICE_CODES:
+            continue
+        entries.append(ServiceEntry(code, name, tuple(SERVICE_SYNONYMS.get(name.lower().strip(), ()))))
+    return entries
+
+
+class ServiceCatalogue:
+    """Catalogo servizi (sub_types) in memoria per il parsing delle descrizioni.
+
+    Ogni scrittura su sub_types incrementa la versione condivisa in
+    cache_versions (trigger della migrazione 0007), come per
+    VersionedResponseCache: il catalogo si ricarica con una sola query
+    quando la versione letta è diversa da quella caricata, in qualunque
+    worker sia avvenuta la modifica. La versione si rilegge al massimo ogni
+    SERVICE_CATALOGUE_CHECK_SECONDS; invalidate() forza la rilettura al
+    prossimo uso. Il matcher compilato delle frasi viene ricostruito solo
+    quando il catalogo viene ricaricato.
+    """
+
+    def __init__(self, check_interval: float = SERVICE_CATALOGUE_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._loaded = False
+        self._loaded_version = None
+        self._checked_at = 0.0
+        self._entries: List[ServiceEntry] = []
+        self._matcher = None
+        self._matcher_entries = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+        logger.info("🔄 Catalogo servizi invalidato")
+
+    def _checked_recently(self) -> bool:
+        return self._loaded and time.monotonic() - self._checked_at < self.check_interval
+
+    def _refresh(self):
+        """Rilegge la versione e, se è cambiata (o non è leggibile), il catalogo"""
+        from app.core.database import SessionLocal
+        from app.models.sub_type import SubType
+        from app.services.response_cache import read_cache_version
+
+        db = SessionLocal()
+        try:
+            version = read_cache_version(db, CATALOGUE_CACHE_NAME)
+            if self._loaded and version is not None and version == self._loaded_version:
+                return
+            rows = db.query(SubType.code, SubType.name).order_by(SubType.id).all()
+        finally:
+            db.close()
+        self._entries = build_entries(rows)
+        self._loaded_version = version
+        self._loaded = True
+        self.loads += 1
+        logger.info(f"📚 Catalogo servizi caricato: {len(self._entries)} servizi (versione {version})")
+
+    def entries(self) -> List[ServiceEntry]:
+        if self._checked_recently():
+            return self._entries
+        with self._lock:
+            if not self._checked_recently():
+                try:
+                    self._refresh()
+                    self._checked_at = time.monotonic()
+                except Exception as e:
+                    logger.error(f"[ERROR] Errore lettura catalogo servizi da DB: {e}")
+                    # Niente cache del fallback: al prossimo uso si riprova il database
+                    if not self._loaded:
+                        return build_entries(FALLBACK_SERVICES)
+        return self._entries
+
+    def matcher(self) -> PhraseMatcher:
+        """Matcher (sottostringa) su nomi e sinonimi, ricompilato solo se il catalogo cambia"""
+        entries = self.entries()
+        if self._matcher_entries is not entries:
+            self._matcher = PhraseMatcher(phrase for entry in entries for phrase in entry.phrases)
+            self._matcher_entries = entries
+        return self._matcher
+
+    def code_mapping(self) -> Dict[str, str]:
+        """frase (nome o sinonimo, minuscolo) -> codice servizio"""
+        mapping = {}
+        for entry in self.entries():
+            for phrase in entry.phrases:
+                mapping[phrase] = entry.code
+        return mapping
+
+    def name_mapping(self) -> Dict[str, str]:
+        """nome minuscolo -> nome originale"""
+        return {entry.name.lower().strip(): entry.name for entry in self.entries()}
+
+
+service_catalogue = ServiceCatalogue()
+
+
+def invalidate_service_catalogue():
+    service_catalogue.invalidate()
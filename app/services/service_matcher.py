@@ -0,0 +1,92 @@
+# app/services/service_matcher.py
+
+import re
+from typing import Dict, Iterable, Set
+
+_WORD_CHAR = re.compile(r"\w")
+
+# Sotto questa soglia (ricerca per sottostringa) i test `in` in C battono la regex:
+# misurato con app/scripts/bench_service_matcher.py
+SUBSTRING_SCAN_LIMIT = 120
+
+
+def _is_word(ch: str) -> bool:
+    return bool(_WORD_CHAR.match(ch))
+
+
+def _trie_pattern(phrases: Iterable[str]) -> str:
+    """Regex ad albero dei prefissi comuni: il motore non riprova ogni frase da capo.
+
+    A parità di posizione preferisce la frase più lunga (gruppi opzionali greedy).
+    """
+    trie: dict = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if terminal else body
+
+    return build(trie)
+
+
+class PhraseMatcher:
+    """Ricerca di molte frasi in un testo con una sola regex compilata.
+
+    Equivale a controllare ogni frase con `frase in testo` (o con
+    `\\bfrase\\b` se whole_words=True), ma con una sola scansione: le
+    frasi sono compilate in una regex ad albero dei prefissi e la ricerca
+    riparte dal carattere dopo ogni inizio di occorrenza, così trova anche
+    quelle sovrapposte; per ogni frase trovata si aggiungono le frasi più
+    corte che ne sono prefisso e che quindi combaciano nella stessa posizione.
+
+    Per la ricerca per sottostringa con poche frasi (< SUBSTRING_SCAN_LIMIT)
+    la scansione con `in` è più veloce della regex e viene usata quella:
+    il risultato non cambia.
+    """
+
+    def __init__(self, phrases: Iterable[str], whole_words: bool = False):
+        self.whole_words = whole_words
+        self.phrases = sorted({p.lower() for p in phrases if p}, key=len, reverse=True)
+        self._prefixes: Dict[str, Set[str]] = {p: {p} for p in self.phrases}
+        for phrase in self.phrases:
+            for other in self.phrases:
+                if len(other) < len(phrase) and phrase.startswith(other) and self._ends_cleanly(other, phrase):
+                    self._prefixes[phrase].add(other)
+
+        self._scan = not whole_words and len(self.phrases) < SUBSTRING_SCAN_LIMIT
+        if not self.phrases or self._scan:
+            self._regex = None
+        elif whole_words:
+            self._regex = re.compile(rf"\b(?:{_trie_pattern(self.phrases)})\b")
+        else:
+            self._regex = re.compile(_trie_pattern(self.phrases))
+
+    def _ends_cleanly(self, prefix: str, phrase: str) -> bool:
+        """Con whole_words il prefisso deve chiudersi su un confine di parola dentro phrase"""
+        if not self.whole_words:
+            return True
+        return _is_word(prefix[-1]) != _is_word(phrase[len(prefix)])
+
+    def find(self, text: str) -> Set[str]:
+        """Frasi presenti nel testo (confronto case-insensitive)"""
+        if not text or not self.phrases:
+            return set()
+        text = text.lower()
+        if self._scan:
+            return {phrase for phrase in self.phrases if phrase in text}
+        search = self._regex.search
+        found = set()
+        match = search(text)
+        while match:
+            found |= self._prefixes[match.group()]
+            # Ripartenza dal carattere successivo: trova anche le occorrenze sovrapposte
+            match = search(text, match.start() + 1)
+        return found
@@ -0,0 +1,256 @@
+# app/services/service_reclassifier.py
+"""Riclassificazione in blocco di activities.detected_services.
+
+Legge le attività con un cursore lato server, esegue il riconoscimento
+servizi in un pool di processi e aggiorna detected_services con un UPDATE
+per blocco. Dopo ogni blocco salva un checkpoint (ultimo id elaborato e
+impronta del catalogo): un run interrotto riparte da lì, mentre un cambio
+di catalogo fa ripartire da capo.
+
+I valori scelti a mano (detected_services_source = 'manual') non vengono
+toccati e un'attività senza servizi riconosciuti mantiene il valore che
+ha. Vedi reclassified_services() per le righe con origine sconosciuta.
+
+Uso da riga di comando: python -m app.services.service_reclassifier [--dry-run] [--restart]
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+from sqlalchemy import text
+
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+RECLASSIFY_BATCH_SIZE = int(os.getenv("RECLASSIFY_BATCH_SIZE", "2000"))
+RECLASSIFY_WORKERS = int(os.getenv("RECLASSIFY_WORKERS", str(os.cpu_count() or 2)))
+RECLASSIFY_CHECKPOINT = os.getenv("RECLASSIFY_CHECKPOINT", "reclassify_services_checkpoint.json")
+
+SOURCE_MANUAL = "manual"
+SOURCE_AUTO = "auto"
+
+# Il filtro su 'manual' copre anche le modifiche a mano arrivate dopo la lettura del blocco
+UPDATE_SERVICES_SQL = """
+    UPDATE activities AS a
+    SET detected_services = v.services, detected_services_source = v.source
+    FROM (VALUES %s) AS v(id, services, source)
+    WHERE a.id = v.id
+      AND a.detected_services_source IS DISTINCT FROM 'manual'
+      AND (a.detected_services, a.detected_services_source) IS DISTINCT FROM (v.services, v.source)
+"""
+
+# ===== WORKER (processi del pool) =====
+_worker_matcher = None
+_worker_names: Dict[str, str] = {}
+
+
+def _init_worker(name_mapping: Dict[str, str]):
+    """Ogni processo compila il matcher una volta sola, dal catalogo passato dal padre (niente DB)"""
+    global _worker_matcher, _worker_names
+    from app.services.service_matcher import PhraseMatcher
+
+    _worker_names = name_mapping
+    _worker_matcher = PhraseMatcher(name_mapping.keys())
+
+
+def detect_services(description: str, matcher, names: Dict[str, str]) -> Optional[str]:
+    """Servizi riconosciuti, nel formato di PATCH /activities/{id}/services ("A, B") o None"""
+    found = sorted({names[phrase] for phrase in matcher.find(description or "") if phrase in names})
+    return ", ".join(found) if found else None
+
+
+def split_services(value: Optional[str]) -> List[str]:
+    return [service.strip() for service in (value or "").split(",") if service.strip()]
+
+
+def reclassified_services(current: Optional[str], source: Optional[str],
+                          detected: Optional[str]) -> Optional[Tuple[str, Optional[str]]]:
+    """Nuovi (detected_services, origine) di un'attività, o None se va lasciata com'è.
+
+    - 'manual' o nessun servizio riconosciuto: invariata
+    - 'auto' o valore vuoto: sostituita dai servizi riconosciuti
+    - valore con origine sconosciuta (precedente al flag, forse scelto a
+      mano): unione dei servizi presenti e riconosciuti, origine invariata
+    """
+    if source == SOURCE_MANUAL or detected is None:
+        return None
+    if source == SOURCE_AUTO or not split_services(current):
+        return detected, SOURCE_AUTO
+    merged = ", ".join(sorted(set(split_services(current)) | set(split_services(detected))))
+    return merged, source
+
+
+def _classify_batch(rows: List[tuple]) -> Tuple[int, int, List[Tuple[int, str, Optional[str]]]]:
+    """(righe lette, ultimo id del blocco, righe da aggiornare come (id, servizi, origine))"""
+    changes = []
+    for activity_id, description, current, source in rows:
+        new = reclassified_services(current, source, detect_services(description, _worker_matcher, _worker_names))
+        if new and new != (current, source):
+            changes.append((activity_id, *new))
+    return len(rows), rows[-1][0], changes
+
+
+# ===== CHECKPOINT =====
+def catalogue_fingerprint(name_mapping: Dict[str, str]) -> str:
+    return hashlib.sha1(json.dumps(sorted(name_mapping.items())).encode()).hexdigest()[:12]
+
+
+def load_checkpoint(fingerprint: str, path: str = RECLASSIFY_CHECKPOINT) -> int:
+    """Ultimo id elaborato con lo stesso catalogo, 0 altrimenti"""
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️ Checkpoint non leggibile ({e}), ripartenza da zero")
+        return 0
+    if data.get("catalogue") != fingerprint:
+        logger.info("🔄 Catalogo servizi cambiato dal checkpoint: ripartenza da zero")
+        return 0
+    return int(data.get("last_id", 0))
+
+
+def save_checkpoint(last_id: int, fingerprint: str, path: str = RECLASSIFY_CHECKPOINT):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_id": last_id, "catalogue": fingerprint, "updated_at": datetime.utcnow().isoformat()}, f)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(path: str = RECLASSIFY_CHECKPOINT):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# ===== JOB =====
+class ReclassificationJob:
+    """Stato del job (uno per processo), letto dall'endpoint di avanzamento"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+        self.progress: dict = {}
+
+    def update(self, **values):
+        with self._lock:
+            self.progress.update(values)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"running": self.running, **self.progress}
+
+    def start_background(self, **kwargs) -> bool:
+        """Avvia run() in un thread; False se un job è già in corso"""
+        with self._lock:
+            if self.running:
+                return False
+            self.running = True
+            self.progress = {"status": "starting"}
+        threading.Thread(target=self._run_safe, kwargs=kwargs, daemon=True).start()
+        return True
+
+    def _run_safe(self, **kwargs):
+        try:
+            self.run(**kwargs)
+        except Exception as e:
+            logger.error(f"❌ Riclassificazione servizi fallita: {e}")
+            self.update(status="error", error=str(e))
+        finally:
+            with self._lock:
+                self.running = False
+
+    def run(self, dry_run: bool = False, resume: bool = True, batch_size: int = RECLASSIFY_BATCH_SIZE,
+            workers: int = RECLASSIFY_WORKERS) -> dict:
+        from app.services.service_catalogue import service_catalogue
+
+        started = time.perf_counter()
+        name_mapping = service_catalogue.name_mapping()
+        fingerprint = catalogue_fingerprint(name_mapping)
+        start_id = load_checkpoint(fingerprint) if resume else 0
+
+        with engine.connect() as conn:
+            total = conn.execute(text("SELECT COUNT(*) FROM activities WHERE id > :start_id"),
+                                 {"start_id": start_id}).scalar()
+        self.update(status="running", total=total, processed=0, updated=0, resumed_from_id=start_id,
+                    dry_run=dry_run, catalogue=fingerprint)
+        logger.info(f"🔁 Riclassificazione servizi: {total} attività da id > {start_id} (workers: {workers})")
+
+        processed = updated = 0
+        last_id = start_id
+        read_conn = engine.connect().execution_options(stream_results=True, yield_per=batch_size)
+        write_conn = engine.raw_connection()
+        try:
+            # Cursore lato server: in memoria al massimo le righe dei blocchi in volo
+            result = read_conn.execute(
+                text("SELECT id, description, detected_services, detected_services_source FROM activities "
+                     "WHERE id > :start_id ORDER BY id"),
+                {"start_id": start_id}
+            )
+            batches = (list(map(tuple, chunk)) for chunk in iter(lambda: result.fetchmany(batch_size), []))
+
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(name_mapping,)) as pool:
+                in_flight = [pool.submit(_classify_batch, batch) for batch in islice(batches, workers * 2)]
+                while in_flight:
+                    batch_len, batch_last_id, changes = in_flight.pop(0).result()
+                    for batch in islice(batches, 1):
+                        in_flight.append(pool.submit(_classify_batch, batch))
+
+                    if changes and not dry_run:
+                        with write_conn.cursor() as cursor:
+                            execute_values(cursor, UPDATE_SERVICES_SQL, changes, page_size=len(changes))
+                            updated += cursor.rowcount
+                        write_conn.commit()
+                    elif dry_run:
+                        updated += len(changes)
+                    # I blocchi escono nell'ordine di id: il checkpoint non salta mai righe
+                    last_id = batch_last_id
+                    processed += batch_len
+                    if not dry_run:
+                        save_checkpoint(last_id, fingerprint)
+
+                    elapsed = time.perf_counter() - started
+                    rate = processed / elapsed if elapsed else 0
+                    eta = (total - processed) / rate if rate else None
+                    self.update(processed=processed, updated=updated, last_id=last_id,
+                                rows_per_second=round(rate, 1), eta_seconds=round(eta) if eta is not None else None)
+                    logger.info(f"💾 {processed}/{total} attività ({rate:.0f}/s), {updated} aggiornate, ultimo id {last_id}")
+        finally:
+            read_conn.close()
+            write_conn.close()
+
+        if not dry_run:
+            clear_checkpoint()
+        elapsed = time.perf_counter() - started
+        summary = {
+            "status": "completed",
+            "total": total,
+            "processed": processed,
+            "updated": updated,
+            "dry_run": dry_run,
+            "elapsed_seconds": round(elapsed, 2),
+            "rows_per_second": round(processed / elapsed, 1) if elapsed else None,
+        }
+        self.update(**summary)
+        return summary
+
+
+reclassification_job = ReclassificationJob()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    result = reclassification_job.run(dry_run="--dry-run" in sys.argv, resume="--restart" not in sys.argv)
+    print(result)
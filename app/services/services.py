@@ -1,15 +1,19 @@
 
 # app/routes/services.py
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.models.phase_template import PhaseTemplate
+from app.services.response_cache import catalogue_cache
 
 router = APIRouter(tags=["services"])
 
 @router.get("/services")
-def list_services(db: Session = Depends(get_db)):
-    results = db.query(PhaseTemplate.type).distinct().all()
-    return [r[0] for r in results if r[0]]
+def list_services(request: Request, db: Session = Depends(get_db)):
+    def load():
+        results = db.query(PhaseTemplate.type).distinct().all()
+        return [r[0] for r in results if r[0]]
+
+    return catalogue_cache.respond(request, db, "phase_template_types", load)
 
@@ -1,241 +1,440 @@
 from datetime import datetime, timedelta
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from app.models.task import Task
 from app.models.user import User
 from app.models.phase_template import PhaseTemplate
+from app.models.sla_ledger import SLAEscalationLedger, SLAScanState
 from app.core.database import SessionLocal
+from app.core.config import SLA_NOTIFICATION_MODE, SLA_FULL_SCAN_HOURS
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+DETAILS_SEPARATOR = " --- DETTAGLI:"
+DEFAULT_ESCALATION_DAYS = 3
+DEFAULT_WARNING_DAYS = 2
+
+LEVEL_ESCALATION = "escalation"
+LEVEL_WARNING = "warning"
+
+
+def _base_description(description: str) -> str:
+    """Estrae la description base del task (senza dettagli) per il match con il template"""
+    if not description:
+        return description
+    return description.split(DETAILS_SEPARATOR)[0]
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
 class SLAEscalationService:
-    
+
+    def _not_notified(self, level: str):
+        """Filtro: task senza riga nel ledger (inviata o in attesa) per questo livello e questa scadenza"""
+        return ~exists().where(and_(
+            SLAEscalationLedger.task_id == Task.id,
+            SLAEscalationLedger.level == level,
+            SLAEscalationLedger.due_date == Task.due_date
+        ))
+
+    def _pending_due(self, level: str, now: datetime):
+        """Filtro: task con una notifica in attesa nel ledger il cui momento di invio è arrivato"""
+        return exists().where(and_(
+            SLAEscalationLedger.task_id == Task.id,
+            SLAEscalationLedger.level == level,
+            SLAEscalationLedger.due_date == Task.due_date,
+            SLAEscalationLedger.sent_at.is_(None),
+            SLAEscalationLedger.notify_after <= now
+        ))
+
+    def _schedule(self, db: Session, level: str, scheduled: list):
+        """Registra nel ledger le notifiche in attesa [(task, notify_after)].
+
+        Non tocca una notifica già inviata per la stessa scadenza.
+        """
+        if not scheduled:
+            return
+        stmt = insert(SLAEscalationLedger).values([
+            {"task_id": task.id, "level": level, "due_date": task.due_date, "notify_after": notify_after,
+             "recipient": None, "sent_at": None}
+            for task, notify_after in scheduled
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            constraint="uq_sla_ledger_task_level",
+            set_={
+                "due_date": stmt.excluded.due_date,
+                "notify_after": stmt.excluded.notify_after,
+                "recipient": None,
+                "sent_at": None
+            },
+            where=or_(
+                SLAEscalationLedger.sent_at.is_(None),
+                SLAEscalationLedger.due_date.is_distinct_from(stmt.excluded.due_date)
+            )
+        ))
+
+    def _get_watermark(self, db: Session, scan_name: str):
+        state = db.query(SLAScanState).filter(SLAScanState.scan_name == scan_name).first()
+        return state.last_run_at if state else None
+
+    def _record_run(self, db: Session, scan_name: str, level: str, now: datetime, sent: list, full_scan: bool = False):
+        """Registra nel ledger le notifiche inviate e aggiorna il watermark del run"""
+        if sent:
+            stmt = insert(SLAEscalationLedger).values([
+                {
+                    "task_id": task.id,
+                    "level": level,
+                    "due_date": task.due_date,
+                    "recipient": owner.email,
+                    "sent_at": now
+                }
+                for task, owner in sent
+            ])
+            db.execute(stmt.on_conflict_do_update(
+                constraint="uq_sla_ledger_task_level",
+                set_={
+                    "due_date": stmt.excluded.due_date,
+                    "recipient": stmt.excluded.recipient,
+                    "sent_at": stmt.excluded.sent_at
+                }
+            ))
+        db.merge(SLAScanState(scan_name=scan_name, last_run_at=now))
+        if full_scan:
+            db.merge(SLAScanState(scan_name=f"{scan_name}_full", last_run_at=now))
+        db.commit()
+
+    def _load_candidates(self, db: Session, filters: list, timings: dict) -> list:
+        """Carica i task candidati e risolve template e owner in blocco.
+
+        Invece di una query PhaseTemplate e una query User per ogni task,
+        esegue una query per i task, una per tutti i template coinvolti e una
+        per tutti gli owner coinvolti. Restituisce tuple (task, template, owner).
+        """
+        started = time.perf_counter()
+        tasks = db.query(Task).filter(*filters).all()
+        timings["load_tasks_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        descriptions = {_base_description(t.description) for t in tasks if t.description}
+        templates_by_description = {}
+        if descriptions:
+            templates = db.query(PhaseTemplate).filter(
+                PhaseTemplate.description.in_(descriptions)
+            ).order_by(PhaseTemplate.id).all()
+            for template in templates:
+                # Stesso comportamento di .first(): vince il primo template trovato
+                templates_by_description.setdefault(template.description, template)
+        timings["resolve_templates_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        owner_ids = {str(t.owner) for t in tasks if t.owner is not None}
+        owners_by_id = {}
+        if owner_ids:
+            owners = db.query(User).filter(User.id.in_(owner_ids)).all()
+            owners_by_id = {str(u.id): u for u in owners}
+        timings["resolve_owners_ms"] = _elapsed_ms(started)
+
+        return [
+            (
+                task,
+                templates_by_description.get(_base_description(task.description)),
+                owners_by_id.get(str(task.owner)),
+            )
+            for task in tasks
+        ]
+
+    def _collect_overdue(self, db: Session, now: datetime, timings: dict) -> tuple:
+        """Task scaduti da notificare: ritorna (task controllati, [(task, owner, giorni)], ultimo run, scansione completa).
+
+        Scansione incrementale: si leggono i task scaduti dopo l'ultimo run
+        non ancora nel ledger, più quelli in attesa nel ledger il cui
+        momento di invio (scadenza + escalation_days) è arrivato. Ogni task
+        letto che non va ancora notificato, o che non verrà consegnato
+        (owner senza email, invio fallito), resta nel ledger in attesa:
+        così il costo del run dipende dai nuovi eventi e non dall'arretrato.
+        Ogni SLA_FULL_SCAN_HOURS si rileggono tutti i task scaduti, per
+        quelli non passati dalla finestra (creati già scaduti, riaperti).
+        """
+        last_run = self._get_watermark(db, "overdue")
+        last_full_scan = self._get_watermark(db, "overdue_full")
+        full_scan = (last_run is None or last_full_scan is None
+                     or now - last_full_scan >= timedelta(hours=SLA_FULL_SCAN_HOURS))
+
+        new_overdue = [self._not_notified(LEVEL_ESCALATION)]
+        if not full_scan:
+            new_overdue.append(Task.due_date > last_run)
+
+        # Task aperti scaduti nuovi o in attesa, con template e owner già risolti
+        candidates = self._load_candidates(db, [
+            Task.status != "chiuso",
+            Task.due_date < now,
+            or_(and_(*new_overdue), self._pending_due(LEVEL_ESCALATION, now))
+        ], timings)
+
+        to_notify, scheduled = [], []
+        for task, template, owner in candidates:
+            days_overdue = (now - task.due_date).days
+            escalation_days = getattr(template, 'escalation_days', DEFAULT_ESCALATION_DAYS) if template else DEFAULT_ESCALATION_DAYS
+
+            logger.info(f"Task {task.id}: {days_overdue} giorni di ritardo, escalation_days: {escalation_days}")
+
+            # In attesa finché non è consegnata; escalation se ritardo >= escalation_days
+            scheduled.append((task, task.due_date + timedelta(days=escalation_days)))
+            if days_overdue >= escalation_days:
+                to_notify.append((task, owner, days_overdue))
+
+        self._schedule(db, LEVEL_ESCALATION, scheduled)
+        return len(candidates), to_notify, last_run, full_scan
+
+    def _collect_warnings(self, db: Session, now: datetime, timings: dict) -> tuple:
+        """Task in scadenza da avvisare: ritorna (task controllati, [(task, owner, giorni)])"""
+        # Trova task che scadranno presto (prossimi 2 giorni)
+        candidates = self._load_candidates(db, [
+            Task.status != "chiuso",
+            Task.due_date > now,
+            Task.due_date <= now + timedelta(days=DEFAULT_WARNING_DAYS),
+            self._not_notified(LEVEL_WARNING)
+        ], timings)
+
+        to_notify = []
+        for task, template, owner in candidates:
+            days_until_due = (task.due_date - now).days
+            warning_days = getattr(template, 'warning_days', DEFAULT_WARNING_DAYS) if template else DEFAULT_WARNING_DAYS
+
+            # Warning se mancano <= warning_days alla scadenza
+            if days_until_due <= warning_days:
+                to_notify.append((task, owner, days_until_due))
+        return len(candidates), to_notify
+
+    def _notify(self, escalations: list, warnings: list) -> tuple:
+        """Invia le notifiche del run secondo SLA_NOTIFICATION_MODE.
+
+        In modalità 'digest' ogni owner riceve un solo messaggio con tutti i
+        suoi task scaduti e in scadenza; in 'per_task' un messaggio per task.
+        Ritorna (escalation inviate, warning inviati, email inviate).
+        """
+        if SLA_NOTIFICATION_MODE == "digest":
+            return self._send_digests(escalations, warnings)
+        sent_escalations = self._send_notifications("sla_escalation", escalations)
+        sent_warnings = self._send_notifications("sla_warning", warnings)
+        return sent_escalations, sent_warnings, len(sent_escalations) + len(sent_warnings)
+
     def check_overdue_tasks(self, db: Session = None) -> dict:
-        """Controlla task scaduti e invia escalation se necessario"""
+        """Controlla task scaduti e invia escalation se necessario.
+
+        Incrementale: legge solo i task scaduti dopo l'ultimo run e quelli in
+        attesa nel ledger (vedi _collect_overdue).
+        """
         if db is None:
             db = SessionLocal()
             
         try:
+            run_started = time.perf_counter()
             now = datetime.utcnow()
+            timings = {}
             
-            # Trova tutti i task aperti scaduti
-            overdue_tasks = db.query(Task).filter(
-                Task.status != "chiuso",
-                Task.due_date < now
-            ).all()
+            checked, escalations, last_run, full_scan = self._collect_overdue(db, now, timings)
             
-            escalations_sent = 0
-            warnings_sent = 0
+            started = time.perf_counter()
+            sent, _, emails_sent = self._notify(escalations, [])
+            timings["notify_ms"] = _elapsed_ms(started)
             
-            for task in overdue_tasks:
-                days_overdue = (now - task.due_date).days
-                
-                # Estrai description base per JOIN con template
-                base_description = task.description
-                if " --- DETTAGLI:" in task.description:
-                    base_description = task.description.split(" --- DETTAGLI:")[0]
-                
-                # Trova template per ottenere escalation_days
-                template = db.query(PhaseTemplate).filter(
-                    PhaseTemplate.description == base_description
-                ).first()
-                
-                escalation_days = getattr(template, 'escalation_days', 3) if template else 3
-                warning_days = getattr(template, 'warning_days', 2) if template else 2
-                
-                logger.info(f"Task {task.id}: {days_overdue} giorni di ritardo, escalation_days: {escalation_days}")
-                
-                # Escalation se ritardo >= escalation_days
-                if days_overdue >= escalation_days:
-                    if self._send_escalation_email(task, days_overdue, db):
-                        escalations_sent += 1
-                        logger.info(f"Escalation sent for task {task.id} - {days_overdue} days overdue")
+            started = time.perf_counter()
+            self._record_run(db, "overdue", LEVEL_ESCALATION, now, sent, full_scan)
+            timings["ledger_ms"] = _elapsed_ms(started)
+            timings["total_ms"] = _elapsed_ms(run_started)
             
             return {
-                "checked_tasks": len(overdue_tasks),
-                "escalations_sent": escalations_sent,
-                "timestamp": now.isoformat()
+                "checked_tasks": checked,
+                "escalations_sent": len(sent),
+                "emails_sent": emails_sent,
+                "last_run": last_run.isoformat() if last_run else None,
+                "full_scan": full_scan,
+                "timestamp": now.isoformat(),
+                "timings": timings
             }
             
         except Exception as e:
             logger.error(f"Error in escalation check: {e}")
+            db.rollback()
             return {"error": str(e)}
         finally:
             if db:
                 db.close()
     
     def check_warning_tasks(self, db: Session = None) -> dict:
-        """Controlla task prossimi alla scadenza per warning"""
+        """Controlla task prossimi alla scadenza per warning.
+
+        Esclude i task già avvisati nel ledger per la stessa scadenza.
+        """
         if db is None:
             db = SessionLocal()
             
         try:
+            run_started = time.perf_counter()
             now = datetime.utcnow()
+            timings = {}
             
-            # Trova task che scadranno presto (prossimi 2 giorni)
-            warning_tasks = db.query(Task).filter(
-                Task.status != "chiuso",
-                Task.due_date > now,
-                Task.due_date <= now + timedelta(days=2)
-            ).all()
+            checked, warnings = self._collect_warnings(db, now, timings)
             
-            warnings_sent = 0
+            started = time.perf_counter()
+            _, sent, emails_sent = self._notify([], warnings)
+            timings["notify_ms"] = _elapsed_ms(started)
             
-            for task in warning_tasks:
-                days_until_due = (task.due_date - now).days
-                
-                # Estrai description base
-                base_description = task.description
-                if " --- DETTAGLI:" in task.description:
-                    base_description = task.description.split(" --- DETTAGLI:")[0]
-                
-                # Trova template
-                template = db.query(PhaseTemplate).filter(
-                    PhaseTemplate.description == base_description
-                ).first()
-                
-                warning_days = getattr(template, 'warning_days', 2) if template else 2
-                
-                # Warning se mancano <= warning_days alla scadenza
-                if days_until_due <= warning_days:
-                    if self._send_warning_email(task, days_until_due, db):
-                        warnings_sent += 1
-                        logger.info(f"Warning sent for task {task.id} - {days_until_due} days until due")
+            started = time.perf_counter()
+            self._record_run(db, "warning", LEVEL_WARNING, now, sent)
+            timings["ledger_ms"] = _elapsed_ms(started)
+            timings["total_ms"] = _elapsed_ms(run_started)
             
             return {
-                "checked_tasks": len(warning_tasks),
-                "warnings_sent": warnings_sent,
-                "timestamp": now.isoformat()
+                "checked_tasks": checked,
+                "warnings_sent": len(sent),
+                "emails_sent": emails_sent,
+                "timestamp": now.isoformat(),
+                "timings": timings
             }
             
         except Exception as e:
             logger.error(f"Error in warning check: {e}")
+            db.rollback()
             return {"error": str(e)}
         finally:
             if db:
                 db.close()
-    
-    def _send_escalation_email(self, task: Task, days_overdue: int, db: Session) -> bool:
-        """Invia email di escalation per task scaduto"""
+
+    def run_escalation(self, db: Session = None) -> dict:
+        """Run completo (overdue + warning) con un'unica fase di invio.
+
+        In modalità digest un owner con task sia scaduti sia in scadenza
+        riceve un solo messaggio per run.
+        """
+        if db is None:
+            db = SessionLocal()
+
         try:
-            from app.services.email_service import email_service
-            
-            # Trova owner del task
-            owner = db.query(User).filter(User.id == str(task.owner)).first()
-            if not owner or not owner.email:
-                logger.warning(f"No owner or email for task {task.id}")
-                return False
-            
-            # Email escalation
-            subject = f"🚨 ESCALATION - Task Scaduto: {task.title}"
-            
-            html_body = f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <div style="background: linear-gradient(135deg, #dc3545 0%, #c82333 100%); color: white; padding: 20px; border-radius: 8px 8px 0 0;">
-                    <h1 style="margin: 0;">🚨 ESCALATION TASK</h1>
-                    <h2 style="margin: 10px 0 0 0;">Task Scaduto da {days_overdue} giorni</h2>
-                </div>
-                
-                <div style="background: #f8f9fa; padding: 30px; border-radius: 0 0 8px 8px;">
-                    <p>Ciao <strong>{owner.name}</strong>,</p>
-                    <p><strong>⚠️ ATTENZIONE:</strong> Il seguente task è scaduto da <strong>{days_overdue} giorni</strong> e richiede intervento immediato:</p>
-                    
-                    <div style="background: white; border-radius: 8px; padding: 20px; margin: 20px 0; border-left: 4px solid #dc3545;">
-                        <h3 style="margin-top: 0; color: #dc3545;">{task.title}</h3>
-                        <p><strong>Cliente:</strong> {task.customer_name or 'N/A'}</p>
-                        <p><strong>Scadenza originale:</strong> {task.due_date.strftime('%d/%m/%Y %H:%M') if task.due_date else 'N/A'}</p>
-                        <p><strong>Giorni di ritardo:</strong> <span style="color: #dc3545; font-weight: bold;">{days_overdue} giorni</span></p>
-                        <p><strong>Priorità:</strong> {task.priority or 'Media'}</p>
-                    </div>
-                    
-                    <p style="text-align: center; margin: 30px 0;">
-                        <a href="https://intelligence.enduser-digital.com/dashboard/task/{task.id}" 
-                           style="background: #dc3545; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; display: inline-block;">
-                            🚨 GESTISCI TASK ESCALATION
-                        </a>
-                    </p>
-                    
-                    <hr style="margin: 30px 0; border: none; border-top: 1px solid #eee;">
-                    <p style="font-size: 12px; color: #666;">
-                        Questa è un'email automatica di escalation per task scaduti. Contatta il team se necessario.
-                    </p>
-                </div>
-            </div>
-            """
-            
-            success = email_service.send_email(
-                to_email=owner.email,
-                subject=subject,
-                html_body=html_body,
-                text_body=f"ESCALATION - Task '{task.title}' scaduto da {days_overdue} giorni. Link: https://intelligence.enduser-digital.com/dashboard/task/{task.id}"
-            )
-            
-            return success
-            
+            run_started = time.perf_counter()
+            now = datetime.utcnow()
+            overdue_timings, warning_timings = {}, {}
+
+            checked_overdue, escalations, last_run, full_scan = self._collect_overdue(db, now, overdue_timings)
+            checked_warnings, warnings = self._collect_warnings(db, now, warning_timings)
+
+            started = time.perf_counter()
+            sent_escalations, sent_warnings, emails_sent = self._notify(escalations, warnings)
+            notify_ms = _elapsed_ms(started)
+
+            started = time.perf_counter()
+            self._record_run(db, "overdue", LEVEL_ESCALATION, now, sent_escalations, full_scan)
+            self._record_run(db, "warning", LEVEL_WARNING, now, sent_warnings)
+            ledger_ms = _elapsed_ms(started)
+
+            return {
+                "overdue": {
+                    "checked_tasks": checked_overdue,
+                    "escalations_sent": len(sent_escalations),
+                    "last_run": last_run.isoformat() if last_run else None,
+                    "full_scan": full_scan,
+                    "timestamp": now.isoformat(),
+                    "timings": overdue_timings
+                },
+                "warnings": {
+                    "checked_tasks": checked_warnings,
+                    "warnings_sent": len(sent_warnings),
+                    "timestamp": now.isoformat(),
+                    "timings": warning_timings
+                },
+                "total_escalations": len(sent_escalations),
+                "total_warnings": len(sent_warnings),
+                "emails_sent": emails_sent,
+                "mode": SLA_NOTIFICATION_MODE,
+                "timings": {"notify_ms": notify_ms, "ledger_ms": ledger_ms, "total_ms": _elapsed_ms(run_started)}
+            }
+
         except Exception as e:
-            logger.error(f"Error sending escalation email for task {task.id}: {e}")
-            return False
-    
-    def _send_warning_email(self, task: Task, days_until_due: int, db: Session) -> bool:
-        """Invia email di warning per task in scadenza"""
+            logger.error(f"Error in complete escalation: {e}")
+            db.rollback()
+            return {"error": str(e)}
+        finally:
+            if db:
+                db.close()
+
+    def _send_digests(self, escalations: list, warnings: list) -> tuple:
+        """Un messaggio per owner con tutte le sue escalation e i suoi warning"""
+        by_owner = {}
+        for kind, items in (("escalations", escalations), ("warnings", warnings)):
+            for task, owner, days in items:
+                if not owner or not owner.email:
+                    logger.warning(f"No owner or email for task {task.id}")
+                    continue
+                digest = by_owner.setdefault(owner.email, {"owner": owner, "escalations": [], "warnings": []})
+                digest[kind].append({"task": task, "days": days})
+
+        if not by_owner:
+            return [], [], 0
+
         try:
             from app.services.email_service import email_service
-            
-            # Trova owner del task
-            owner = db.query(User).filter(User.id == str(task.owner)).first()
+            from app.services.notification_renderer import notification_renderer
+
+            digests = list(by_owner.values())
+            emails = notification_renderer.render_batch("sla_digest", digests)
+        except Exception as e:
+            logger.error(f"Error rendering SLA digests: {e}")
+            return [], [], 0
+
+        sent_escalations, sent_warnings, emails_sent = [], [], 0
+        for digest, email in zip(digests, emails):
+            owner = digest["owner"]
+            try:
+                # wait=True: il ledger registra solo i digest effettivamente consegnati
+                if not email_service.send_email(to_email=owner.email, wait=True, **email):
+                    continue
+            except Exception as e:
+                logger.error(f"Error sending SLA digest to {owner.email}: {e}")
+                continue
+            emails_sent += 1
+            sent_escalations.extend((item["task"], owner) for item in digest["escalations"])
+            sent_warnings.extend((item["task"], owner) for item in digest["warnings"])
+            logger.info(f"SLA digest sent to {owner.email}: {len(digest['escalations'])} escalation, {len(digest['warnings'])} warning")
+        return sent_escalations, sent_warnings, emails_sent
+    
+    def _send_notifications(self, template: str, items: list) -> list:
+        """Renderizza in blocco le notifiche (task, owner, giorni) e le invia.
+
+        Ritorna le coppie (task, owner) effettivamente consegnate: l'invio è
+        sincrono perché il ledger non deve registrare email poi fallite.
+        """
+        deliverable = []
+        for task, owner, days in items:
             if not owner or not owner.email:
                 logger.warning(f"No owner or email for task {task.id}")
-                return False
-            
-            # Email warning
-            subject = f"⚠️ WARNING - Task in Scadenza: {task.title}"
-            
-            html_body = f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <div style="background: linear-gradient(135deg, #ffc107 0%, #e0a800 100%); color: white; padding: 20px; border-radius: 8px 8px 0 0;">
-                    <h1 style="margin: 0;">⚠️ WARNING TASK</h1>
-                    <h2 style="margin: 10px 0 0 0;">Task in Scadenza tra {days_until_due} giorni</h2>
-                </div>
-                
-                <div style="background: #f8f9fa; padding: 30px; border-radius: 0 0 8px 8px;">
-                    <p>Ciao <strong>{owner.name}</strong>,</p>
-                    <p><strong>⚠️ PROMEMORIA:</strong> Il seguente task scadrà tra <strong>{days_until_due} giorni</strong>:</p>
-                    
-                    <div style="background: white; border-radius: 8px; padding: 20px; margin: 20px 0; border-left: 4px solid #ffc107;">
-                        <h3 style="margin-top: 0; color: #e0a800;">{task.title}</h3>
-                        <p><strong>Cliente:</strong> {task.customer_name or 'N/A'}</p>
-                        <p><strong>Scadenza:</strong> {task.due_date.strftime('%d/%m/%Y %H:%M') if task.due_date else 'N/A'}</p>
-                        <p><strong>Giorni rimanenti:</strong> <span style="color: #e0a800; font-weight: bold;">{days_until_due} giorni</span></p>
-                        <p><strong>Priorità:</strong> {task.priority or 'Media'}</p>
-                    </div>
-                    
-                    <p style="text-align: center; margin: 30px 0;">
-                        <a href="https://intelligence.enduser-digital.com/dashboard/task/{task.id}" 
-                           style="background: #ffc107; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; display: inline-block;">
-                            ⚠️ GESTISCI TASK
-                        </a>
-                    </p>
-                    
-                    <hr style="margin: 30px 0; border: none; border-top: 1px solid #eee;">
-                    <p style="font-size: 12px; color: #666;">
-                        Questo è un promemoria automatico per task in scadenza.
-                    </p>
-                </div>
-            </div>
-            """
-            
-            success = email_service.send_email(
-                to_email=owner.email,
-                subject=subject,
-                html_body=html_body,
-                text_body=f"WARNING - Task '{task.title}' scade tra {days_until_due} giorni. Link: https://intelligence.enduser-digital.com/dashboard/task/{task.id}"
-            )
-            
-            return success
-            
+                continue
+            deliverable.append((task, owner, days))
+
+        try:
+            from app.services.email_service import email_service
+            from app.services.notification_renderer import notification_renderer
+
+            emails = notification_renderer.render_batch(template, [
+                {"task": task, "owner": owner, "days": days} for task, owner, days in deliverable
+            ])
         except Exception as e:
-            logger.error(f"Error sending warning email for task {task.id}: {e}")
-            return False
+            logger.error(f"Error rendering {template} notifications: {e}")
+            return []
+
+        sent = []
+        for (task, owner, days), email in zip(deliverable, emails):
+            try:
+                if email_service.send_email(to_email=owner.email, wait=True, **email):
+                    sent.append((task, owner))
+            except Exception as e:
+                logger.error(f"Error sending {template} email for task {task.id}: {e}")
+        return sent
 
 # Istanza singleton
 sla_escalation_service = SLAEscalationService()
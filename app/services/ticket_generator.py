@@ -8,7 +8,9 @@ from app.models.task import Task
 from app.models.activity import Activity
 from app.models.service_user_association import ServiceUserAssociation
 from app.models.sub_type import SubType
+from app.services.notification_service import send_ticket_notification
 from process_code_map import PROCESS_CODE_MAP
+from app.services.service_matcher import PhraseMatcher
 from integrations.crm_incloud.activity import create_crm_activity
 
 logger = logging.getLogger(__name__)
@@ -85,105 +87,22 @@ def get_service_owner(service_code: str, db_session):
         print(f"❌ Errore ricerca owner per {service_code}: {e}")
         return None
 
-def send_ticket_notification(ticket_id: int, db_session) -> bool:
-    """Invia notifica creazione ticket"""
-    try:
-        from app.services.email_service import email_service
-        from app.models.user import User
-        
-        ticket = db_session.query(Ticket).filter(Ticket.id == ticket_id).first()
-        if not ticket:
-            logger.error(f"Ticket {ticket_id} not found for notification")
-            return False
-        
-        # Determina owner
-        owner_id = ticket.owner_id
-        if not owner_id:
-            logger.error(f"No owner found for ticket {ticket_id}")
-            return False
-            
-        # Get user email
-        owner = db_session.query(User).filter(User.id == str(owner_id)).first()
-        if not owner or not owner.email:
-            logger.error(f"Owner {owner_id} not found or no email for ticket {ticket_id}")
-            return False
-            
-        # Send email
-        success = email_service.send_email(
-            to_email=owner.email,
-            subject=f"🧠 Intelligence - Nuovo Ticket I24: {ticket.title}",
-            html_body=f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 8px 8px 0 0;">
-                    <h1 style="margin: 0;">🧠 Intelligence Platform</h1>
-                    <h2 style="margin: 10px 0 0 0;">Nuovo Incarico 24 Mesi</h2>
-                </div>
-                
-                <div style="background: #f8f9fa; padding: 30px; border-radius: 0 0 8px 8px;">
-                    <p>Ciao <strong>{owner.name}</strong>,</p>
-                    <p>È stato creato un nuovo Incarico 24 mesi:</p>
-                    
-                    <div style="background: white; border-radius: 8px; padding: 20px; margin: 20px 0; border-left: 4px solid #28a745;">
-                        <h3 style="margin-top: 0; color: #333;">{ticket.title}</h3>
-                        <p><strong>Codice:</strong> {ticket.ticket_code}</p>
-                        <p><strong>Cliente:</strong> {ticket.customer_name or 'N/A'}</p>
-                        <p><strong>Account:</strong> {ticket.account or 'N/A'}</p>
-                        <p><strong>Scadenza:</strong> {ticket.due_date.strftime('%d/%m/%Y') if ticket.due_date else 'Non specificata'}</p>
-                    </div>
-                    
-                    <p style="text-align: center; margin: 30px 0;">
-                        <a href="https://intelligence.enduser-digital.com/dashboard/ticket/{ticket.id}" 
-                           style="background: #28a745; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; display: inline-block;">
-                            Visualizza Incarico I24
-                        </a>
-                    </p>
-                    
-                    <hr style="margin: 30px 0; border: none; border-top: 1px solid #eee;">
-                    <p style="font-size: 12px; color: #666;">
-                        Ricevi questa email perché sei il responsabile di questo incarico I24.
-                    </p>
-                </div>
-            </div>
-            """,
-            text_body=f"""
-            Intelligence Platform - Nuovo Incarico 24 Mesi
-            
-            Ciao {owner.name},
-            
-            È stato creato un nuovo Incarico 24 mesi:
-            
-            Titolo: {ticket.title}
-            Codice: {ticket.ticket_code}
-            Cliente: {ticket.customer_name or 'N/A'}
-            Account: {ticket.account or 'N/A'}
-            Scadenza: {ticket.due_date.strftime('%d/%m/%Y') if ticket.due_date else 'Non specificata'}
-            
-            Visualizza: https://intelligence.enduser-digital.com/dashboard/ticket/{ticket.id}
-            """
-        )
-        
-        if success:
-            logger.info(f"Email notification sent successfully for ticket {ticket_id}")
-        else:
-            logger.warning(f"Email notification failed for ticket {ticket_id}")
-            
-        return success
-        
-    except Exception as e:
-        logger.error(f"Error sending ticket notification: {e}")
-        return False
-
 def gtd_priority_to_int(priority: str) -> int:
     mapping = {"alta": 1, "media": 2, "bassa": 3}
     return mapping.get(priority.lower().strip(), 2) if isinstance(priority, str) else 2
 
+_process_code_matcher = None
+
+def get_process_code_matcher() -> PhraseMatcher:
+    """Chiavi di PROCESS_CODE_MAP compilate in un'unica regex (a parola intera)"""
+    global _process_code_matcher
+    if _process_code_matcher is None:
+        _process_code_matcher = PhraseMatcher(PROCESS_CODE_MAP.keys(), whole_words=True)
+    return _process_code_matcher
+
 def extract_project_codes_local(description: str) -> list[str]:
-    description_lower = description.lower()
-    matches = []
-    for key, code in PROCESS_CODE_MAP.items():
-        pattern = r'\b' + re.escape(key.lower()) + r'\b'
-        if re.search(pattern, description_lower):
-            matches.append(code)
+    found = get_process_code_matcher().find(description)
+    matches = [code for key, code in PROCESS_CODE_MAP.items() if key.lower() in found]
     print(f"[DEBUG] Progetti rilevati nella descrizione: {matches}")
     return matches
 
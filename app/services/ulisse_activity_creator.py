@@ -1,18 +1,10 @@
 import os
-import requests
-from integrations.crm_incloud.sync import get_crm_token
+from app.services.crm_client import crm_client
 
 CRM_API_KEY = os.getenv("CRM_API_KEY")
 CRM_BASE_URL = "https://app.crmincloud.it/api/v1"
 
 def create_ulisse_crm_activity(data: dict) -> int:
-    token = get_crm_token()
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "WebApiKey": CRM_API_KEY,
-        "Content-Type": "application/json"
-    }
-
     payload = {
         "customer_name": data["customer_name"],
         "description": data["description"],
@@ -24,6 +16,6 @@ def create_ulisse_crm_activity(data: dict) -> int:
         "priority": "bassa"
     }
 
-    res = requests.post(f"{CRM_BASE_URL}/activities", json=payload, headers=headers)
+    res = crm_client.post(f"{CRM_BASE_URL}/activities", json=payload)
     res.raise_for_status()
     return res.json()["id"]
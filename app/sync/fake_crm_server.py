@@ -0,0 +1,220 @@
+"""Finto server CRM InCloud per provare client, rate limit e sync in locale.
+
+Uso: python -m app.sync.fake_crm_server [richieste] [rate_per_minuto]
+
+Il server applica un proprio limite (token bucket) e risponde 429 con
+Retry-After quando viene superato: lo scenario 1 usa lo stesso budget del
+client (attesi zero 429), lo scenario 2 un client configurato al doppio del
+budget reale (i 429 devono essere assorbiti senza errori).
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FAKE_HOST = "127.0.0.1"
+FAKE_PORT = 8765
+
+
+class FakeCRMState:
+    def __init__(self, companies: int = 500, rate_per_minute: float = 600, burst: int = 10, contacts: int = 0):
+        self.companies = {
+            cid: {
+                "id": cid,
+                "companyName": f"Azienda Demo {cid} S.r.l.",
+                "taxIdentificationNumber": f"IT{cid:011d}",
+                "vatId": f"IT{cid:011d}",
+                "address": f"Via Roma {cid % 200}, Milano",
+                "description": "Manifattura",
+                "anagraphicIndustryId": cid % 7,
+                "lastModifiedDate": "2025-01-01T00:00:00",
+            }
+            for cid in range(1000, 1000 + companies)
+        }
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rejected = 0
+
+        self.contacts = [
+            {
+                "id": 50000 + n,
+                "name": f"Nome{n}",
+                "surname": f"Cognome{n}",
+                "companyId": 1000 + n % companies,
+                "emailAddress": f"contatto{n}@example.com",
+                "phone": f"02 {n:07d}",
+            }
+            for n in range(contacts)
+        ]
+
+    def touch(self, ids, modified: str):
+        """Simula modifiche lato CRM (per provare il delta sync)"""
+        for cid in ids:
+            self.companies[cid]["lastModifiedDate"] = modified
+
+    def admit(self) -> float:
+        """0 se la richiesta rientra nel budget, altrimenti i secondi di Retry-After"""
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            self.rejected += 1
+            return (1 - self._tokens) / self.rate
+
+
+def make_handler(state: FakeCRMState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, come il CRM reale
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body=None, headers: dict = None):
+            payload = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _route(self, method: str):
+            body = {}
+            if self.headers.get("Content-Length"):
+                raw = self.rfile.read(int(self.headers["Content-Length"]))
+                body = json.loads(raw) if raw else {}
+            retry_after = state.admit()
+            if retry_after:
+                return self._send(429, {"message": "Too Many Requests"}, {"Retry-After": f"{retry_after:.2f}"})
+
+            url = urlparse(self.path)
+            path = re.sub(r"^/api/v1", "", url.path).rstrip("/")
+            query = parse_qs(url.query)
+
+            if method == "POST" and path == "/Auth/Login":
+                return self._send(200, {"access_token": "fake-token", "expires_in": 3600})
+            if self.headers.get("Authorization") != "Bearer fake-token":
+                return self._send(401, {"message": "Unauthorized"})
+            if method == "GET" and path in ("/Company", "/Companies"):
+                ids = sorted(state.companies)
+                if "maxRecords" in query:
+                    ids = ids[:int(query["maxRecords"][0])]
+                return self._send(200, ids)
+            if method == "POST" and path == "/Contact/SearchAdvanced":
+                page, size = int(body.get("Page", 1)), int(body.get("PageSize", 100))
+                return self._send(200, {"Items": state.contacts[(page - 1) * size:page * size],
+                                        "TotalCount": len(state.contacts)})
+            if method == "GET" and path == "/Company/SearchIds":
+                # Supporta solo "lastModifiedDate ge|gt 'ISO'", quanto basta al delta sync
+                match = re.match(r"lastModifiedDate (ge|gt) '([^']+)'", query.get("filter", [""])[0])
+                if not match:
+                    return self._send(400, {"message": "Unsupported filter"})
+                op, since = match.groups()
+                ids = sorted(cid for cid, c in state.companies.items()
+                             if c["lastModifiedDate"] > since or (op == "ge" and c["lastModifiedDate"] == since))
+                return self._send(200, ids)
+            match = re.match(r"^/Company/(\d+)(/GetFull)?$", path)
+            if method == "GET" and match:
+                company = state.companies.get(int(match.group(1)))
+                return self._send(200, company) if company else self._send(404, {"message": "Not found"})
+            return self._send(404, {"message": f"Unknown endpoint {path}"})
+
+        def do_GET(self):
+            self._route("GET")
+
+        def do_POST(self):
+            self._route("POST")
+
+    return Handler
+
+
+def start_fake_crm(state: FakeCRMState, host: str = FAKE_HOST, port: int = FAKE_PORT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_scenario(title: str, base_url: str, state: FakeCRMState, client_rate: float, requests_count: int, burst: int):
+    from app.services.crm_client import CRMClient
+    from app.services.crm_rate_limiter import TokenBucket
+
+    bucket = TokenBucket(rate_per_minute=client_rate, capacity=burst)
+    client = CRMClient(base_url=base_url, rate_limiter=bucket, max_retries=10)
+    ids = sorted(state.companies)[:requests_count]
+    state.requests = state.rejected = 0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(lambda cid: client.get(f"/Company/{cid}").status_code, ids))
+    elapsed = time.perf_counter() - started
+
+    ok = statuses.count(200)
+    print(f"\n🧪 {title}")
+    print(f"   ✅ {ok}/{len(ids)} risposte 200 in {elapsed:.2f}s ({ok / elapsed * 60:.0f} req/min, budget server {state.rate * 60:.0f})")
+    print(f"   ⏳ 429 ricevuti: {client.rate_limited_responses} | richieste al server: {state.requests}")
+    print(f"   📊 Limiter: {client.stats()}")
+    return ok == len(ids)
+
+
+def run_delta_scenario(base_url: str, state: FakeCRMState):
+    """Dopo una modifica di 3 aziende il delta sync deve chiedere solo quelle"""
+    from datetime import datetime
+    from app.integrations.crm_incloud import companies_contacts_sync as sync
+
+    state.touch(sorted(state.companies)[:3], "2025-06-01T10:00:00")
+    state.requests = 0
+    changed = sync.fetch_changed_company_ids(datetime(2025, 5, 1))
+    details = list(sync.fetch_company_details(changed))
+    calls = state.requests
+
+    print(f"\n🧪 Delta sync")
+    print(f"   🔄 Modificate: {changed} | chiamate API: {calls} (su {len(state.companies)} aziende)")
+    return changed == sorted(state.companies)[:3] and calls == 1 + len(changed) and all(d for _, d in details)
+
+
+def run_contacts_scenario(state: FakeCRMState, page_size: int = 200):
+    """Sync contatti in dry run: tutte le pagine lette, memoria limitata a una pagina"""
+    import tracemalloc
+    from app.integrations.crm_incloud import companies_contacts_sync as sync
+
+    tracemalloc.start()
+    result = sync.sync_contacts_safe(limit=None, dry_run=True, page_size=page_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"\n🧪 Contacts sync (dry run)")
+    print(f"   👥 {result.get('contacts_processed')}/{len(state.contacts)} contatti in {result.get('pages')} pagine, "
+          f"{result.get('rows_per_second')} righe/s, picco memoria {peak / 1024:.0f} KiB")
+    return result.get("contacts_processed") == len(state.contacts)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 600
+    base_url = f"http://{FAKE_HOST}:{FAKE_PORT}/api/v1"
+    os.environ.setdefault("CRM_BASE_URL", base_url)
+
+    state = FakeCRMState(rate_per_minute=rate, burst=5, contacts=int(os.getenv("FAKE_CRM_CONTACTS", "2500")))
+    server = start_fake_crm(state)
+    try:
+        ok_same = run_scenario("Client con lo stesso budget del server", base_url, state, rate, count, 5)
+        ok_over = run_scenario("Client oltre il budget (2x): 429 + Retry-After", base_url, state, rate * 2, count, 5)
+        ok_delta = run_delta_scenario(base_url, state)
+        ok_contacts = run_contacts_scenario(state)
+    finally:
+        server.shutdown()
+    sys.exit(0 if ok_same and ok_over and ok_delta and ok_contacts else 1)
@@ -1,56 +1,27 @@
 import os
-import time
-import requests
+import sys
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from app.models.company import Company
+from sqlalchemy import text
+from app.core.database import engine, SessionLocal
+from app.services.company_upsert import company_row, upsert_companies
+from app.services.crm_client import crm_client
 
 # ========== CONFIG ==========
 load_dotenv(dotenv_path="/app/.env")
 
 CRM_BASE_URL = os.getenv("CRM_BASE_URL", "https://api.crmincloud.it/api/v1")
-CRM_USERNAME = os.getenv("CRM_USERNAME")
-CRM_PASSWORD = os.getenv("CRM_PASSWORD")
-CRM_API_KEY = os.getenv("CRM_API_KEY")
 
-DB_HOST = os.getenv("POSTGRES_HOST", "db")
-DB_URL = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{DB_HOST}:5432/{os.getenv('POSTGRES_DB')}"
-
-SLEEP_BETWEEN_CALLS = 2.1
+SYNC_BATCH_SIZE = int(os.getenv("CRM_SYNC_BATCH_SIZE", "50"))
 
 # ========== DB SETUP ==========
-engine = create_engine(DB_URL)
-Session = sessionmaker(bind=engine)
-session = Session()
-
-# ========== AUTENTICAZIONE ==========
-def get_crm_token():
-    url = f"{CRM_BASE_URL}/Auth/Login"
-    payload = {
-        "grant_type": "password",
-        "userName": CRM_USERNAME,
-        "password": CRM_PASSWORD
-    }
-    headers = {
-        "WebApiKey": CRM_API_KEY,
-        "Content-Type": "application/json"
-    }
-
-    res = requests.post(url, json=payload, headers=headers)
-    res.raise_for_status()
-    return res.json()["access_token"]
-
-def get_headers(token):
-    return {
-        "Authorization": f"Bearer {token}",
-        "WebApiKey": CRM_API_KEY
-    }
+# Stesso engine (e pool) dell'app, come il sync --delta
+session = SessionLocal()
 
 # ========== API CALLS ==========
-def get_all_crm_company_ids(headers):
+# Autenticazione, token condiviso e rate limit sono gestiti da crm_client
+def get_all_crm_company_ids():
     url = f"{CRM_BASE_URL}/Company"
-    response = requests.get(url, headers=headers)
+    response = crm_client.get(url)
     response.raise_for_status()
     data = response.json()
 
@@ -60,9 +31,9 @@ def get_all_crm_company_ids(headers):
 
     return [str(cid) for cid in data if isinstance(cid, int)]
 
-def get_crm_company_by_id(company_id, headers):
+def get_crm_company_by_id(company_id):
     url = f"{CRM_BASE_URL}/Company/{company_id}/GetFull"
-    response = requests.get(url, headers=headers)
+    response = crm_client.get(url)
     if response.status_code == 200:
         return response.json()
     return None
@@ -74,51 +45,46 @@ def get_all_db_company_ids():
     return {str(r[0]) for r in result.fetchall()}
 
 # ========== SYNC ==========
-def sync_crm_companies(db_session, crm_ids, headers, existing_ids):
-    inserted = 0
+def crm_company_rows(crm_ids, existing_ids):
     for index, crm_id in enumerate(crm_ids):
-        exists = db_session.execute(
-            text("SELECT 1 FROM companies WHERE id::text = :id LIMIT 1"),
-            {"id": str(crm_id)}
-        ).scalar()
-
-        if exists:
+        if crm_id in existing_ids:
             continue
 
-        data = get_crm_company_by_id(crm_id, headers)
+        data = get_crm_company_by_id(crm_id)
         if not data:
             print(f"⚠️ Azienda ID {crm_id} non trovata.")
             continue
 
-        new_company = Company(
-            id=crm_id,
-            nome=data.get("companyName") or "N/A",
-            partita_iva=data.get("vatId") or f"NO-PIVA-{crm_id}",
-            address=data.get("address") or "N/A",
-            sector=str(data.get("anagraphicIndustryId") or "")
-        )
-        db_session.merge(new_company)
-        db_session.commit()
-        inserted += 1
-
         print(f"⬇️ {index + 1}/{len(crm_ids)} azienda processata...")
-        time.sleep(SLEEP_BETWEEN_CALLS)
+        # Stessa mappatura del sync --delta: le colonne non dipendono da quale comando ha scritto la riga
+        yield company_row(crm_id, data)
 
-    print(f"\n🌟 Inserite {inserted} aziende mancanti nel DB.")
+def sync_crm_companies(crm_ids, existing_ids):
+    # Le aziende presenti sono già in existing_ids: nessuna SELECT per riga, upsert a blocchi
+    stats = upsert_companies(crm_company_rows(crm_ids, existing_ids),
+                             batch_size=SYNC_BATCH_SIZE, db_engine=engine)
+    for number, batch in enumerate(stats["batches"], start=1):
+        print(f"💾 Blocco {number}: {batch['inserted']} inserite, {batch['updated']} aggiornate, {batch['unchanged']} invariate")
+
+    print(f"\n🌟 Inserite {stats['inserted']} aziende mancanti nel DB.")
+    return stats
 
 # ========== MAIN ==========
 if __name__ == "__main__":
     print("🚀 Avvio sincronizzazione aziende CRM ↔ DB")
 
-    try:
-        token = get_crm_token()
-        headers = get_headers(token)
+    if "--delta" in sys.argv:
+        # Solo le aziende modificate dall'ultimo run (watermark in crm_sync_state)
+        from app.integrations.crm_incloud.companies_contacts_sync import sync_companies_safe
+        print(sync_companies_safe(limit=None, delta=True))
+        sys.exit(0)
 
-        crm_ids = get_all_crm_company_ids(headers)
+    try:
+        crm_ids = get_all_crm_company_ids()
         db_ids = get_all_db_company_ids()
 
         print("\n📍 Verifica aziende non presenti nel DB:")
-        sync_crm_companies(session, crm_ids, headers, db_ids)
+        sync_crm_companies(crm_ids, db_ids)
 
         print("\n📅 Sincronizzazione completata.")
 
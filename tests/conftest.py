@@ -0,0 +1,58 @@
+import os
+import uuid
+
+# I moduli dell'app creano l'engine all'import: nei test basta SQLite in memoria
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  registra tutti i modelli su Base
+
+
+@pytest.fixture
+def make_db():
+    """Sessione SQLite in memoria con le sole tabelle indicate (i modelli con ARRAY restano fuori)"""
+    engines = []
+    sessions = []
+
+    def factory(*models):
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        for model in models:
+            model.__table__.create(engine)
+        session = sessionmaker(bind=engine, autoflush=False)()
+        engines.append(engine)
+        sessions.append(session)
+        return session
+
+    yield factory
+
+    for session in sessions:
+        session.close()
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def pg_engine():
+    """Engine PostgreSQL per le query con sintassi solo Postgres, in uno schema usa e getta.
+
+    Richiede TEST_DATABASE_URL (es. postgresql://postgres@localhost/test); senza, il test è saltato.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL non impostato: test solo PostgreSQL")
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
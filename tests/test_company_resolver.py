@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import text
+
+from app.services import crmsdk
+from app.services.company_resolver import CompanyResolver
+
+
+@pytest.fixture
+def db(make_db):
+    session = make_db()
+    session.execute(text("CREATE TABLE companies (id INTEGER PRIMARY KEY, nome VARCHAR)"))
+    session.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY, body VARCHAR)"))
+    session.execute(text("INSERT INTO companies (id, nome) VALUES "
+                         "(1, 'Rossi SRL'), (2, 'Rossi SPA'), (3, 'Bianchi Impianti SNC'), "
+                         "(4, 'Verdi Costruzioni'), (5, 'Verdi Costruzioni')"))
+    session.commit()
+    return session
+
+
+@pytest.fixture
+def resolver(db):
+    resolver = CompanyResolver()
+    resolver.ensure_loaded(db)
+    return resolver
+
+
+def test_legal_form_breaks_ties_between_distinct_companies(resolver):
+    # Senza forma societaria "Rossi" pesa uguale: decide il nome completo
+    assert resolver.best_match("Rossi S.r.l.")[:2] == (1, "Rossi SRL")
+    assert resolver.best_match("ROSSI S.p.A.")[:2] == (2, "Rossi SPA")
+    assert resolver.best_match("Bianchi Impianti s.n.c.")[:2] == (3, "Bianchi Impianti SNC")
+
+
+def test_ambiguous_tie_returns_no_match(resolver):
+    # Stesso punteggio anche sul nome completo: non si sceglie a caso
+    assert resolver.best_match("Rossi") is None
+    assert resolver.best_match("Rossi SAS") is None
+
+
+def test_duplicate_names_resolve_to_the_first_company(resolver):
+    assert resolver.best_match("Verdi Costruzioni SRL")[:2] == (4, "Verdi Costruzioni")
+
+
+def test_index_failure_keeps_the_callers_pending_work(db, monkeypatch):
+    def broken_load(session):
+        session.execute(text("SELECT missing_column FROM companies"))
+
+    monkeypatch.setattr(crmsdk.company_resolver, "ensure_loaded", broken_load)
+    # Il fallback SQL usa pg_trgm: qui basta sapere che gira nella stessa transazione
+    monkeypatch.setattr(crmsdk, "_fuzzy_company_from_db", lambda name, session: (1, "Rossi SRL", 0.9))
+
+    db.execute(text("INSERT INTO notes (id, body) VALUES (1, 'non ancora salvata')"))
+    assert crmsdk.get_company_id_by_name("Rossi", db) == 1
+    db.commit()
+
+    assert db.execute(text("SELECT body FROM notes")).scalar() == "non ancora salvata"
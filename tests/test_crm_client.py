@@ -0,0 +1,106 @@
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from app.services import crm_client as client_module
+from app.services.crm_client import CRMClient
+
+
+class NoLimit:
+    def acquire(self):
+        return 0.0
+
+    def pause(self, seconds):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class FakeSession:
+    """Restituisce in ordine le risposte (o solleva le eccezioni) previste"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def response(status, retry_after=None):
+    resp = requests.Response()
+    resp.status_code = status
+    if retry_after is not None:
+        resp.headers["Retry-After"] = retry_after
+    return resp
+
+
+def connect_error():
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.ConnectionError(MaxRetryError(None, "/", reason=reason))
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    monkeypatch.setattr(client_module.time, "sleep", lambda seconds: None)
+
+    def factory(*outcomes):
+        client = CRMClient(base_url="http://crm.test", rate_limiter=NoLimit(), max_retries=3)
+        client.session = FakeSession(outcomes)
+        return client
+
+    return factory
+
+
+def test_get_retries_timeouts_and_gateway_errors(make_client):
+    client = make_client(requests.ReadTimeout("lento"), response(502), response(200))
+
+    assert client.get("/Company/1", auth=False).status_code == 200
+    assert client.session.calls == 3
+
+
+@pytest.mark.parametrize("outcome", [
+    requests.ReadTimeout("lento"),
+    requests.ConnectionError("Connection reset by peer"),
+])
+def test_post_is_not_resent_after_it_may_have_reached_the_server(make_client, outcome):
+    client = make_client(outcome, response(200))
+
+    with pytest.raises(type(outcome)):
+        client.post("/Activity/CreateOrUpdate", auth=False, json={})
+    assert client.session.calls == 1
+
+
+def test_post_gateway_error_is_returned_not_retried(make_client):
+    client = make_client(response(504), response(200))
+
+    assert client.post("/Activity/CreateOrUpdate", auth=False, json={}).status_code == 504
+    assert client.session.calls == 1
+
+
+def test_post_retried_when_the_request_never_left(make_client):
+    client = make_client(connect_error(), requests.ConnectTimeout("timeout di connessione"), response(200))
+
+    assert client.post("/Activity/CreateOrUpdate", auth=False, json={}).status_code == 200
+    assert client.session.calls == 3
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_post_retried_only_with_retry_after(make_client, status):
+    client = make_client(response(status, retry_after="0"), response(200))
+    assert client.post("/Activity/CreateOrUpdate", auth=False, json={}).status_code == 200
+
+    client = make_client(response(status), response(200))
+    assert client.post("/Activity/CreateOrUpdate", auth=False, json={}).status_code == status
+
+
+def test_idempotent_post_opts_in_to_retries(make_client):
+    client = make_client(requests.ReadTimeout("lento"), response(503), response(200))
+
+    assert client.post("/Contact/SearchAdvanced", auth=False, idempotent=True, json={}).status_code == 200
+    assert client.session.calls == 3
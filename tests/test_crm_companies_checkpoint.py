@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.integrations.crm_incloud import companies_contacts_sync as sync
+
+WATERMARK = datetime(2026, 2, 1, 8, 0)
+NOW = datetime(2026, 2, 10, 12, 0)
+
+
+@pytest.fixture
+def checkpoint(tmp_path, monkeypatch):
+    path = str(tmp_path / "checkpoint.json")
+    # I default sono valutati all'import: si sostituiscono le funzioni con il percorso di test
+    load, save, clear = sync.load_checkpoint, sync.save_checkpoint, sync.clear_checkpoint
+    monkeypatch.setattr(sync, "load_checkpoint", lambda run, **kw: load(run, path=path, **kw))
+    monkeypatch.setattr(sync, "save_checkpoint", lambda ids, run, started_at: save(ids, run, started_at, path=path))
+    monkeypatch.setattr(sync, "clear_checkpoint", lambda: clear(path=path))
+    return path
+
+
+@pytest.fixture
+def crm(monkeypatch):
+    """CRM, upsert e watermark finti: registra le aziende scaricate e i watermark salvati"""
+    state = {"ids": [1, 2, 3, 4], "fetched": [], "saved_watermarks": [], "watermark": WATERMARK, "fail_on": None}
+
+    def fetch_company_details(company_ids, max_workers):
+        for company_id in company_ids:
+            if company_id == state["fail_on"]:
+                raise RuntimeError("connessione persa")
+            state["fetched"].append(company_id)
+            yield company_id, {"id": company_id, "lastModifiedDate": f"2026-02-0{company_id + 1}T10:00:00"}
+
+    monkeypatch.setattr(sync, "get_crm_headers", lambda: {"Authorization": "Bearer test"})
+    monkeypatch.setattr(sync, "get_watermark", lambda entity: state["watermark"])
+    monkeypatch.setattr(sync, "save_watermark", lambda entity, value: state["saved_watermarks"].append(value))
+    monkeypatch.setattr(sync, "fetch_changed_company_ids", lambda since: list(state["ids"]))
+    monkeypatch.setattr(sync, "fetch_company_details", fetch_company_details)
+    monkeypatch.setattr(sync, "company_row", lambda company_id, detail: {"id": company_id, "nome": f"Azienda {company_id}"})
+    monkeypatch.setattr(sync, "upsert_companies_batch", lambda rows: {"inserted": len(rows), "updated": 0, "unchanged": 0})
+    return state
+
+
+def test_checkpoint_roundtrip_for_same_run(checkpoint):
+    run = sync.checkpoint_run(True, WATERMARK, None)
+    started_at = NOW - timedelta(hours=1)
+    sync.save_checkpoint({3, 1}, run, started_at)
+
+    assert sync.load_checkpoint(run, now=NOW) == ({1, 3}, started_at)
+
+
+@pytest.mark.parametrize("other_run", [
+    sync.checkpoint_run(False, None, None),
+    sync.checkpoint_run(True, WATERMARK + timedelta(days=1), None),
+    sync.checkpoint_run(False, None, 100),
+])
+def test_checkpoint_of_another_run_is_ignored(checkpoint, other_run):
+    sync.save_checkpoint({1, 2}, sync.checkpoint_run(True, WATERMARK, None), NOW - timedelta(hours=1))
+
+    assert sync.load_checkpoint(other_run, now=NOW) == (set(), None)
+
+
+def test_expired_checkpoint_is_ignored(checkpoint):
+    run = sync.checkpoint_run(True, WATERMARK, None)
+    sync.save_checkpoint({1, 2}, run, NOW - timedelta(hours=sync.CRM_SYNC_CHECKPOINT_MAX_AGE_HOURS + 1))
+
+    assert sync.load_checkpoint(run, now=NOW) == (set(), None)
+
+
+def test_unreadable_checkpoint_is_ignored(checkpoint):
+    with open(checkpoint, "w") as f:
+        f.write('{"completed_ids": [1, 2]}')
+
+    assert sync.load_checkpoint(sync.checkpoint_run(True, WATERMARK, None)) == (set(), None)
+
+
+def test_resumed_delta_skips_saved_companies_and_keeps_watermark(checkpoint, crm):
+    crm["fail_on"] = 3
+    result = sync.sync_companies_safe(limit=None, delta=True, batch_size=1)
+    assert "error" in result
+    assert crm["saved_watermarks"] == []
+
+    crm["fail_on"] = None
+    crm["fetched"].clear()
+    result = sync.sync_companies_safe(limit=None, delta=True, batch_size=1)
+
+    assert result["companies_skipped"] == 2
+    assert crm["fetched"] == [3, 4]
+    # Le aziende saltate potrebbero essere cambiate: il watermark non avanza
+    assert crm["saved_watermarks"] == []
+
+    crm["fetched"].clear()
+    sync.sync_companies_safe(limit=None, delta=True, batch_size=1)
+    assert crm["fetched"] == [1, 2, 3, 4]
+    assert crm["saved_watermarks"] == [datetime(2026, 2, 5, 10, 0)]
+
+
+def test_leftover_checkpoint_does_not_skip_a_later_run(checkpoint, crm):
+    sync.save_checkpoint({1, 2, 3, 4}, sync.checkpoint_run(False, None, None), datetime.utcnow())
+
+    result = sync.sync_companies_safe(limit=None, delta=True)
+
+    assert result["companies_skipped"] == 0
+    assert crm["fetched"] == [1, 2, 3, 4]
+    assert crm["saved_watermarks"] == [datetime(2026, 2, 5, 10, 0)]
@@ -0,0 +1,121 @@
+import socket
+
+import pytest
+
+from app.services.email_delivery import EmailDeliveryWorker, SMTPConnectionPool
+
+# Server SMTP locale solo per i test (pip install aiosmtpd)
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+HOST = "127.0.0.1"
+SENDER = "intellivoice@example.com"
+
+
+class RecordingHandler:
+    """Accetta i messaggi; temporary: destinatario -> numero di 451 prima di accettare, permanent: sempre 554"""
+
+    def __init__(self, temporary=None, permanent=()):
+        self.temporary = dict(temporary or {})
+        self.permanent = set(permanent)
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        for rcpt in envelope.rcpt_tos:
+            if rcpt in self.permanent:
+                return "554 Transaction failed"
+            if self.temporary.get(rcpt):
+                self.temporary[rcpt] -= 1
+                return "451 Requested action aborted: try again later"
+        self.messages.append(envelope.rcpt_tos)
+        return "250 Message accepted for delivery"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_stub():
+    started = []
+
+    def factory(handler):
+        controller = controller_module.Controller(handler, hostname=HOST, port=free_port())
+        controller.start()
+        started.append(controller)
+        return controller.port
+
+    yield factory
+
+    for controller in started:
+        controller.stop()
+
+
+@pytest.fixture
+def make_worker():
+    workers = []
+
+    def factory(port, **options):
+        pool = SMTPConnectionPool(HOST, port, use_tls=False, size=2)
+        worker = EmailDeliveryWorker(pool, sender=SENDER, workers=2, batch_size=20, backoff_seconds=0.01, **options)
+        workers.append(worker)
+        return worker
+
+    yield factory
+
+    for worker in workers:
+        worker.stop()
+
+
+def test_queue_delivers_on_pooled_connections(smtp_stub, make_worker):
+    handler = RecordingHandler()
+    worker = make_worker(smtp_stub(handler))
+
+    for i in range(100):
+        assert worker.enqueue([f"owner{i % 10}@example.com"], f"Test {i}", f"<p>Messaggio {i}</p>", f"Messaggio {i}")
+    worker.enqueue([f"owner{i}@example.com" for i in range(10)], "Bulk", "<p>Bulk</p>")
+    assert worker.flush(30)
+
+    assert len(handler.messages) == 101
+    # Un solo messaggio per il bulk, con tutti i destinatari nell'envelope
+    assert [f"owner{i}@example.com" for i in range(10)] in handler.messages
+
+    stats = worker.stats()
+    assert stats["sent"] == 101 and stats["failed"] == 0 and stats["pending"] == 0
+    # Connessioni riusate: al più una per worker
+    assert stats["connections_opened"] <= 2
+    assert stats["send_latency_ms"]["samples"] == 101
+    assert stats["delivery_latency_ms"]["p95"] >= stats["send_latency_ms"]["p95"]
+
+
+def test_temporary_failures_are_retried_until_max_retries(smtp_stub, make_worker):
+    handler = RecordingHandler(temporary={"slow@example.com": 2, "down@example.com": 99},
+                               permanent={"bounce@example.com"})
+    worker = make_worker(smtp_stub(handler), max_retries=3)
+
+    for rcpt in ("ok@example.com", "slow@example.com", "down@example.com", "bounce@example.com"):
+        worker.enqueue([rcpt], "SLA", "<p>SLA</p>")
+    assert worker.flush(30)
+
+    assert sorted(handler.messages) == [["ok@example.com"], ["slow@example.com"]]
+    stats = worker.stats()
+    assert stats["sent"] == 2
+    assert stats["failed"] == 2
+    # slow: 2 retry, poi consegnato; down e bounce: 2 retry ciascuno, poi falliti
+    assert stats["retries"] == 6
+    assert stats["pending"] == 0
+
+
+def test_send_now_returns_the_delivery_outcome_without_retrying(smtp_stub, make_worker):
+    handler = RecordingHandler(temporary={"slow@example.com": 1})
+    worker = make_worker(smtp_stub(handler))
+
+    assert worker.send_now(["ok@example.com"], "SLA", "<p>SLA</p>") is True
+    assert worker.send_now(["slow@example.com"], "SLA", "<p>SLA</p>") is False
+
+    assert handler.messages == [["ok@example.com"]]
+    stats = worker.stats()
+    assert stats["sent"] == 1 and stats["failed"] == 1 and stats["retries"] == 0
+    # Gli invii sincroni non passano dalla coda
+    assert stats["pending"] == 0 and stats["queue_depth"] == 0
@@ -0,0 +1,198 @@
+import importlib.util
+import json
+import pathlib
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.models.kpi_snapshot import KPISnapshot
+from app.services import kpi_snapshots
+
+# Caricato dal file: app/routes/__init__ importa tutti i router, alcuni con dipendenze (integrations) fuori dall'app
+STATISTICS_GLOBAL = pathlib.Path(__file__).resolve().parents[1] / "app" / "routes" / "statistics_global.py"
+spec = importlib.util.spec_from_file_location("statistics_global_routes", STATISTICS_GLOBAL)
+statistics_global = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(statistics_global)
+
+OWNERS = [None, "", "Mario Rossi", "Anna Bianchi"]
+TICKET_STATUSES = [None, 0, 1, 2]
+TASK_STATUSES = [None, "", "aperto", "in_corso", "chiuso"]
+SERVICES = [
+    None, [], ["Patent Box"], [" patent box ", "\tBandi\n"], ["Formazione 4.0", "Servizio ignoto"],
+    ["  Transizione 5.0\r\n", "ALTRO", "\fcashback\v"], ["Know How", "Know How"],
+]
+
+
+def json_roundtrip(value):
+    """Come esce dall'API: chiavi numeriche e None diventano stringhe"""
+    return json.loads(json.dumps(value, default=str))
+
+
+def legacy_global_statistics(db):
+    """Algoritmo precedente di /statistics/global (Counter in Python su tutte le righe)"""
+    SERVICE_MAPPING, VALID_SERVICES, SERVICE_LABELS = (
+        statistics_global.SERVICE_MAPPING, statistics_global.VALID_SERVICES, statistics_global.SERVICE_LABELS)
+    today = datetime.utcnow().date()
+    green_threshold = today + timedelta(days=3)
+
+    by_status, by_priority, by_owner, service_counter = Counter(), Counter(), Counter(), Counter()
+    semafori = {"green": 0, "yellow": 0, "red": 0}
+    tickets = db.execute(text("SELECT status, priority, owner, due_date, detected_services FROM tickets")).fetchall()
+    for t in tickets:
+        by_status[t.status or 0] += 1
+        by_priority[t.priority or 0] += 1
+        by_owner[t.owner or "Sconosciuto"] += 1
+        if t.due_date:
+            due = t.due_date.date()
+            if due < today:
+                semafori["red"] += 1
+            elif due <= green_threshold:
+                semafori["yellow"] += 1
+            else:
+                semafori["green"] += 1
+        else:
+            semafori["red"] += 1
+        if t.detected_services:
+            for service in t.detected_services:
+                code = SERVICE_MAPPING.get(service.strip().lower())
+                service_counter[code if code in VALID_SERVICES else "ZZZ"] += 1
+        else:
+            service_counter["ZZZ"] += 1
+
+    task_by_status, task_by_priority, task_by_owner = Counter(), Counter(), Counter()
+    tasks = db.execute(text("SELECT status, priority, owner FROM tasks")).fetchall()
+    for task in tasks:
+        task_by_status[task.status or "sconosciuto"] += 1
+        task_by_priority[task.priority or "sconosciuto"] += 1
+        task_by_owner[task.owner or "Sconosciuto"] += 1
+
+    return {
+        "tickets_stats": {
+            "total": len(tickets),
+            "by_status": dict(by_status),
+            "by_priority": dict(by_priority),
+            "semafori": semafori,
+            "by_owner": dict(by_owner),
+            "gtd_type_data": {
+                "labels": [SERVICE_LABELS.get(code, code) for code in service_counter.keys()],
+                "values": list(service_counter.values()),
+            },
+        },
+        "tasks_stats": {
+            "total": len(tasks),
+            "by_status": dict(task_by_status),
+            "by_priority": dict(task_by_priority),
+            "by_owner": dict(task_by_owner),
+        },
+    }
+
+
+def legacy_kpi_dashboard(db):
+    """Payload precedente di /api/intellichat/kpi_dashboard (otto query)"""
+    scalar = lambda sql: db.execute(text(sql)).scalar()
+    total = scalar("SELECT COUNT(*) FROM tasks")
+    completed = scalar("SELECT COUNT(*) FROM tasks WHERE status = 'chiuso'")
+    return {
+        "totalTasks": total,
+        "completedTasks": completed,
+        "openTasks": scalar("SELECT COUNT(*) FROM tasks WHERE status = 'aperto'"),
+        "activeUsers": scalar("SELECT COUNT(DISTINCT owner) FROM tasks WHERE status != 'chiuso'"),
+        "openTickets": scalar("SELECT COUNT(*) FROM tickets WHERE status = 0"),
+        "totalTickets": scalar("SELECT COUNT(*) FROM tickets"),
+        "companiesCount": scalar("SELECT COUNT(*) FROM companies"),
+        "completionRate": round((completed / total * 100), 1) if total > 0 else 0,
+        "taskStatusBreakdown": {row[0]: row[1] for row in db.execute(text("SELECT status, COUNT(*) FROM tasks GROUP BY status"))},
+        "databaseName": scalar("SELECT current_database()"),
+    }
+
+
+def comparable_global(result):
+    result = json_roundtrip({key: value for key, value in result.items() if key != "refreshed_at"})
+    # L'ordine delle etichette seguiva l'ordine di lettura delle righe: si confrontano i conteggi
+    gtd = result["tickets_stats"]["gtd_type_data"]
+    result["tickets_stats"]["gtd_type_data"] = dict(zip(gtd["labels"], gtd["values"]))
+    return result
+
+
+def comparable_dashboard(payload):
+    return json_roundtrip({key: value for key, value in payload.items() if key != "lastUpdate"})
+
+
+@pytest.fixture
+def db(pg_engine, monkeypatch):
+    monkeypatch.setattr(kpi_snapshots.kpi_refresher, "interval", 0)
+    monkeypatch.setattr(kpi_snapshots, "engine", pg_engine)
+    rng = random.Random(11)
+    today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    with pg_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE tickets (id INTEGER PRIMARY KEY, ticket_code VARCHAR, status INTEGER, "
+                          "priority INTEGER, owner VARCHAR, due_date TIMESTAMP, detected_services VARCHAR[])"))
+        conn.execute(text("CREATE TABLE tasks (id INTEGER PRIMARY KEY, ticket_id INTEGER, status VARCHAR, "
+                          "priority VARCHAR, owner VARCHAR)"))
+        conn.execute(text("CREATE TABLE companies (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("CREATE TABLE activities (id INTEGER PRIMARY KEY, creation_date VARCHAR, "
+                          "status VARCHAR, detected_services TEXT)"))
+        KPISnapshot.__table__.create(conn)
+
+        task_id = 0
+        for ticket_id in range(1, 61):
+            due_date = rng.choice([None, today + timedelta(days=rng.randint(-10, 10))])
+            conn.execute(text("INSERT INTO tickets VALUES (:id, :code, :status, :priority, :owner, :due, :services)"), {
+                "id": ticket_id, "code": rng.choice(["TCK-I24-1", "TCK-F40-2", None]),
+                "status": rng.choice(TICKET_STATUSES), "priority": rng.choice([None, 0, 1, 2, 3]),
+                "owner": rng.choice(OWNERS), "due": due_date, "services": rng.choice(SERVICES),
+            })
+            for _ in range(rng.randint(0, 3)):
+                task_id += 1
+                conn.execute(text("INSERT INTO tasks VALUES (:id, :ticket_id, :status, :priority, :owner)"), {
+                    "id": task_id, "ticket_id": ticket_id, "status": rng.choice(TASK_STATUSES),
+                    "priority": rng.choice([None, "", "alta", "bassa"]), "owner": rng.choice(OWNERS),
+                })
+        conn.execute(text("INSERT INTO companies SELECT generate_series(1, 7)"))
+    session = sessionmaker(bind=pg_engine)()
+    yield session
+    session.close()
+
+
+def test_global_statistics_match_legacy_counters(db, pg_engine):
+    expected = comparable_global(legacy_global_statistics(db))
+
+    # Senza snapshot: calcolo diretto con una sola query
+    assert comparable_global(statistics_global.global_statistics(db)) == expected
+
+    # Dallo snapshot salvato (JSONB)
+    assert kpi_snapshots.refresh_kpi_snapshots(db_engine=pg_engine) is not None
+    assert comparable_global(statistics_global.global_statistics(db)) == expected
+
+
+def test_kpi_dashboard_matches_legacy_queries(db, pg_engine):
+    expected = comparable_dashboard(legacy_kpi_dashboard(db))
+    assert "null" in expected["taskStatusBreakdown"] and "" in expected["taskStatusBreakdown"]
+
+    live = kpi_snapshots.live_kpi_dashboard(db)
+    assert comparable_dashboard(kpi_snapshots.kpi_dashboard_payload(live)) == expected
+
+    kpi_snapshots.refresh_kpi_snapshots(db_engine=pg_engine)
+    snapshots = kpi_snapshots.load_kpi_snapshots(db)
+    assert comparable_dashboard(kpi_snapshots.kpi_dashboard_payload(snapshots)) == expected
+
+
+def test_stale_snapshots_are_served_without_refreshing_in_the_request(db, pg_engine, monkeypatch):
+    kpi_snapshots.refresh_kpi_snapshots(db_engine=pg_engine)
+    db.execute(text("UPDATE kpi_snapshots SET refreshed_at = refreshed_at - INTERVAL '1 day'"))
+    db.commit()
+
+    requested = []
+    monkeypatch.setattr(kpi_snapshots.kpi_refresher, "request_refresh", lambda: requested.append(True))
+    monkeypatch.setattr(kpi_snapshots, "refresh_kpi_snapshots", lambda **kw: pytest.fail("ricalcolo nella richiesta"))
+    monkeypatch.setattr(kpi_snapshots, "compute_kpi_snapshots", lambda conn: pytest.fail("ricalcolo nella richiesta"))
+
+    snapshots = kpi_snapshots.get_kpi_snapshots(db)
+
+    assert requested == [True]
+    assert snapshots["refreshed_at"] < datetime.utcnow() - timedelta(hours=23)
+    assert snapshots["incarichi_24"]["totale"] >= 0
@@ -0,0 +1,84 @@
+import importlib.util
+import pathlib
+import random
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+# Caricato dal file: app/routes/__init__ importa tutti i router, alcuni con dipendenze (integrations) fuori dall'app
+STATISTICS = pathlib.Path(__file__).resolve().parents[1] / "app" / "routes" / "statistics.py"
+spec = importlib.util.spec_from_file_location("statistics_routes", STATISTICS)
+statistics = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(statistics)
+STATUS_MAP, opportunity_by_type = statistics.STATUS_MAP, statistics.opportunity_by_type
+
+CODES = ["F40-001", "F40-002", "PBX-7", "PBX", "", None, "I24-3-bis"]
+TITLES = ["Analisi", "Consegna", "", None]
+STATUSES = ["aperto", "in_corso", "chiuso", "0", "sospeso", None]
+
+
+def legacy_by_type(db):
+    """Algoritmo precedente (una query per opportunità, attività e ticket), per confronto"""
+    data = {}
+    for opp_id, codice in db.execute(text("SELECT id, codice FROM opportunities ORDER BY id")):
+        code = codice or "unknown"
+        type_code = code.split("-")[0] if "-" in code else code
+        data.setdefault(type_code, {"totali": 0, "fasi": {}})["totali"] += 1
+
+        activities = db.execute(text("SELECT id FROM activities WHERE opportunity_id::text = :opp_id"),
+                                {"opp_id": str(opp_id)}).scalars()
+        for activity_id in list(activities):
+            tickets = db.execute(text("SELECT id FROM tickets WHERE activity_id = :id"), {"id": activity_id}).scalars()
+            for ticket_id in list(tickets):
+                tasks = db.execute(text("SELECT title, status FROM tasks WHERE ticket_id = :id"), {"id": ticket_id})
+                for title, status in tasks:
+                    fase = title or "Senza titolo"
+                    stato = STATUS_MAP.get(status, "unknown")
+                    fasi = data[type_code]["fasi"]
+                    if fase not in fasi:
+                        fasi[fase] = {"aperto": 0, "in_corso": 0, "chiuso": 0}
+                    if stato in fasi[fase]:
+                        fasi[fase][stato] += 1
+    return data
+
+
+def seed(conn, rng):
+    for opp_id in range(1, 41):
+        conn.execute(text("INSERT INTO opportunities (id, codice) VALUES (:id, :codice)"),
+                     {"id": opp_id, "codice": rng.choice(CODES)})
+    ticket_id = task_id = 0
+    for activity_id in range(1, 61):
+        # Alcune attività senza opportunità o con un id inesistente
+        opp_id = rng.choice([None, 99] + list(range(1, 41)))
+        conn.execute(text("INSERT INTO activities (id, opportunity_id) VALUES (:id, :opp_id)"),
+                     {"id": activity_id, "opp_id": opp_id})
+        for _ in range(rng.randint(0, 3)):
+            ticket_id += 1
+            conn.execute(text("INSERT INTO tickets (id, activity_id) VALUES (:id, :activity_id)"),
+                         {"id": ticket_id, "activity_id": activity_id})
+            for _ in range(rng.randint(0, 4)):
+                task_id += 1
+                conn.execute(text("INSERT INTO tasks (id, ticket_id, title, status) VALUES (:id, :ticket_id, :title, :status)"),
+                             {"id": task_id, "ticket_id": ticket_id, "title": rng.choice(TITLES),
+                              "status": rng.choice(STATUSES)})
+
+
+# Il modello Activity dichiara opportunity_id sia String sia Integer: la query deve funzionare con entrambi
+@pytest.mark.parametrize("opportunity_id_type", ["VARCHAR", "INTEGER"])
+@pytest.mark.parametrize("data_seed", [1, 2, 3])
+def test_matches_legacy_algorithm(pg_engine, opportunity_id_type, data_seed):
+    with pg_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE opportunities (id INTEGER PRIMARY KEY, codice VARCHAR)"))
+        conn.execute(text(f"CREATE TABLE activities (id INTEGER PRIMARY KEY, opportunity_id {opportunity_id_type})"))
+        conn.execute(text("CREATE TABLE tickets (id INTEGER PRIMARY KEY, activity_id INTEGER)"))
+        conn.execute(text("CREATE TABLE tasks (id INTEGER PRIMARY KEY, ticket_id INTEGER, title VARCHAR, status VARCHAR)"))
+        seed(conn, random.Random(data_seed))
+
+    db = sessionmaker(bind=pg_engine)()
+    try:
+        expected = legacy_by_type(db)
+        assert opportunity_by_type(db) == expected
+        assert sum(group["totali"] for group in expected.values()) == 40
+    finally:
+        db.close()
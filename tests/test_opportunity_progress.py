@@ -0,0 +1,170 @@
+import importlib.util
+import pathlib
+import random
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.services import dashboard_data
+from app.services.opportunity_progress import (
+    SERVICE_LABELS, incarichi_summary, is_i24, load_ticket_progress, progress_by_detected_service,
+    status_counts_by_detected_service,
+)
+
+# Caricato dal file: app/routes/__init__ importa tutti i router, alcuni con dipendenze (integrations) fuori dall'app
+DASHBOARD_API = pathlib.Path(__file__).resolve().parents[1] / "app" / "routes" / "dashboard_api.py"
+spec = importlib.util.spec_from_file_location("dashboard_api_routes", DASHBOARD_API)
+dashboard_api = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dashboard_api)
+
+CODES = ["TCK-F40-001", "TCK-PBX-002", "TCK-I24-003", "TCK-I24", "TCK-XYZ-9", "", None]
+CUSTOMERS = [None, "", "Cliente A", "Cliente B"]
+SERVICES = [None, [], ["Patent Box"], ["Formazione 4.0", "Patent Box"]]
+STATUSES = ["aperto", "in_corso", "chiuso", "sospeso", None]
+OPPORTUNITIES = [("F40-001", "Cliente A"), ("F40-002", "Cliente A"), ("PBX-7", None), ("PBX-8", ""),
+                 ("I24-3", "Cliente B"), ("XYZ-1", "Cliente B"), ("", "Cliente A"), (None, "Cliente B")]
+
+
+def legacy_phases(db, ticket_id):
+    """ticket.tasks / query dei task del ticket: una query per ticket"""
+    return [{"title": title, "status": status} for title, status in db.execute(
+        text("SELECT title, status FROM tasks WHERE ticket_id = :id ORDER BY id"), {"id": ticket_id})]
+
+
+def legacy_detail(db, ticket_id, ticket_code):
+    fasi = legacy_phases(db, ticket_id)
+    return {
+        "ticket": ticket_code,
+        "fasi_totali": len(fasi),
+        "fasi_concluse": len([fase for fase in fasi if fase["status"] == "chiuso"]),
+        "fasi": fasi,
+    }
+
+
+def legacy_service_tickets(db):
+    """Filtro precedente: ticket_code NOT LIKE 'TCK-I24%' e Ticket.tasks.any()"""
+    service_map = {}
+    for ticket_id, ticket_code, detected_services in db.execute(text(
+        "SELECT id, ticket_code, detected_services FROM tickets t "
+        "WHERE ticket_code NOT LIKE 'TCK-I24%' AND EXISTS (SELECT 1 FROM tasks WHERE ticket_id = t.id) ORDER BY id"
+    )):
+        # Il fallback su ticket.opportunity non scattava mai: Ticket non ha quella relazione
+        for service in detected_services or []:
+            service_map.setdefault(service, []).append((ticket_id, ticket_code))
+    return service_map
+
+
+def legacy_progress_v2(db):
+    """Algoritmo precedente di /dashboard/opportunities/progress_v2 (opportunita)"""
+    return [
+        {
+            "servizio": service,
+            "ticket_count": len(tickets),
+            "dettagli": [legacy_detail(db, ticket_id, ticket_code) for ticket_id, ticket_code in tickets],
+        }
+        for service, tickets in legacy_service_tickets(db).items()
+    ]
+
+
+def legacy_by_service(db):
+    """Algoritmo precedente di /dashboard/opportunities/by_service"""
+    service_counts = {}
+    for service, tickets in legacy_service_tickets(db).items():
+        counts = service_counts.setdefault(service, {"aperto": 0, "in_corso": 0, "chiuso": 0})
+        for ticket_id, _ in tickets:
+            for fase in legacy_phases(db, ticket_id):
+                counts[fase["status"]] = counts.get(fase["status"], 0) + 1
+    return service_counts
+
+
+def legacy_dashboard_data(db):
+    """Algoritmo precedente di dashboard_data.get_opportunities_progress_data (query per opportunità e ticket)"""
+    incarichi = {"totale": 0, "fasi_totali": 0, "fasi_concluse": 0}
+    for ticket_id, ticket_code in db.execute(text("SELECT id, ticket_code FROM tickets WHERE ticket_code LIKE 'TCK-I24%'")):
+        detail = legacy_detail(db, ticket_id, ticket_code)
+        incarichi["totale"] += 1
+        incarichi["fasi_totali"] += detail["fasi_totali"]
+        incarichi["fasi_concluse"] += detail["fasi_concluse"]
+
+    servizio_map = {}
+    for codice, cliente in db.execute(text("SELECT codice, cliente FROM opportunities ORDER BY id")):
+        if not codice:
+            # codice[:3] su None sollevava TypeError: il nuovo codice salta le opportunità senza codice
+            continue
+        label = SERVICE_LABELS.get(codice[:3], codice)
+        entry = servizio_map.setdefault(label, {"servizio": label, "ticket_count": 0, "dettagli": []})
+        # Ticket.customer_name == None diventa IS NULL nell'ORM
+        tickets = db.execute(text(
+            "SELECT id, ticket_code FROM tickets WHERE ticket_code LIKE :prefix "
+            "AND customer_name IS NOT DISTINCT FROM :cliente ORDER BY id"
+        ), {"prefix": f"TCK-{codice[:3]}%", "cliente": cliente}).fetchall()
+        entry["ticket_count"] += len(tickets)
+        entry["dettagli"].extend(legacy_detail(db, ticket_id, ticket_code) for ticket_id, ticket_code in tickets)
+    return {"incarichi_24": incarichi, "opportunita": list(servizio_map.values())}
+
+
+@pytest.fixture
+def db(pg_engine):
+    # detected_services è ARRAY: solo PostgreSQL
+    rng = random.Random(7)
+    with pg_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE tickets (id INTEGER PRIMARY KEY, ticket_code VARCHAR, "
+                          "customer_name VARCHAR, detected_services VARCHAR[])"))
+        conn.execute(text("CREATE TABLE tasks (id INTEGER PRIMARY KEY, ticket_id INTEGER, title VARCHAR, status VARCHAR)"))
+        conn.execute(text("CREATE TABLE opportunities (id INTEGER PRIMARY KEY, codice VARCHAR, cliente VARCHAR)"))
+        for opp_id, (codice, cliente) in enumerate(OPPORTUNITIES, start=1):
+            conn.execute(text("INSERT INTO opportunities (id, codice, cliente) VALUES (:id, :codice, :cliente)"),
+                         {"id": opp_id, "codice": codice, "cliente": cliente})
+        task_id = 0
+        for ticket_id in range(1, 81):
+            conn.execute(text("INSERT INTO tickets (id, ticket_code, customer_name, detected_services) "
+                              "VALUES (:id, :code, :customer, :services)"),
+                         {"id": ticket_id, "code": rng.choice(CODES), "customer": rng.choice(CUSTOMERS),
+                          "services": rng.choice(SERVICES)})
+            for _ in range(rng.randint(0, 3)):
+                task_id += 1
+                conn.execute(text("INSERT INTO tasks (id, ticket_id, title, status) VALUES (:id, :ticket_id, :title, :status)"),
+                             {"id": task_id, "ticket_id": ticket_id, "title": f"Fase {task_id}", "status": rng.choice(STATUSES)})
+    session = sessionmaker(bind=pg_engine)()
+    yield session
+    session.close()
+
+
+def test_service_views_load_only_non_i24_tickets_with_phases(db):
+    everything = load_ticket_progress(db)
+    service_tickets = load_ticket_progress(db, include_i24=False)
+
+    expected = [t for t in everything if t["ticket_code"] is not None and not is_i24(t) and t["fasi"]]
+    assert service_tickets == expected
+    assert len(service_tickets) < len(everything)
+
+
+def test_service_views_unchanged_without_i24_tickets(db):
+    everything = load_ticket_progress(db)
+    service_tickets = load_ticket_progress(db, include_i24=False)
+
+    assert progress_by_detected_service(service_tickets) == progress_by_detected_service(everything)
+    assert status_counts_by_detected_service(service_tickets) == status_counts_by_detected_service(everything)
+
+
+def test_default_load_keeps_i24_tickets_for_incarichi(db):
+    summary = incarichi_summary(load_ticket_progress(db))
+
+    assert summary["totale"] > 0
+    assert incarichi_summary(load_ticket_progress(db, include_i24=False))["totale"] == 0
+
+
+def test_progress_v2_and_by_service_match_legacy_per_ticket_queries(db, monkeypatch):
+    # incarichi_24 arriva dallo snapshot KPI (coperto in test_kpi_snapshots)
+    monkeypatch.setattr(dashboard_api, "get_kpi_snapshots", lambda session: {"incarichi_24": None})
+
+    assert dashboard_api.get_opportunities_progress_data(db)["opportunita"] == legacy_progress_v2(db)
+    assert dashboard_api.get_opportunity_by_service_aggregated(db) == legacy_by_service(db)
+
+
+def test_dashboard_data_matches_legacy_per_opportunity_queries(db):
+    expected = legacy_dashboard_data(db)
+    assert expected["incarichi_24"]["totale"] > 0 and expected["opportunita"]
+
+    assert dashboard_data.get_opportunities_progress_data(db) == expected
@@ -0,0 +1,135 @@
+import importlib.util
+import pathlib
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app.models.cache_version import CacheVersion
+from app.services.response_cache import VersionedResponseCache
+
+MIGRATION = pathlib.Path(__file__).resolve().parents[1] / "alembic" / "versions" / "0007_cache_versions.py"
+
+
+def make_request(etag=None):
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+class Builder:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+@pytest.fixture
+def db(make_db):
+    session = make_db(CacheVersion)
+    session.add(CacheVersion(name="catalogue", version=0))
+    session.commit()
+    return session
+
+
+def bump(db):
+    db.execute(text("UPDATE cache_versions SET version = version + 1 WHERE name = 'catalogue'"))
+    db.commit()
+
+
+def test_serves_cached_body_and_304_until_version_changes(db):
+    cache = VersionedResponseCache("catalogue")
+    builder = Builder([{"id": 1, "name": "Patent Box"}])
+
+    first = cache.respond(make_request(), db, "services_tree", builder)
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+    assert cache.respond(make_request(), db, "services_tree", builder).body == first.body
+    assert cache.respond(make_request(etag), db, "services_tree", builder).status_code == 304
+    assert builder.calls == 1
+
+    builder.value = [{"id": 1, "name": "Patent Box 2026"}]
+    bump(db)
+    changed = cache.respond(make_request(etag), db, "services_tree", builder)
+
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert b"Patent Box 2026" in changed.body
+    assert builder.calls == 2
+
+
+def test_version_is_shared_between_workers(db):
+    # Due processi = due cache in memoria, una sola versione nel database
+    worker_a, worker_b = VersionedResponseCache("catalogue"), VersionedResponseCache("catalogue")
+    builder = Builder(["F40"])
+    etag = worker_a.respond(make_request(), db, "services", builder).headers["etag"]
+    assert worker_b.respond(make_request(etag), db, "services", builder).status_code == 304
+
+    bump(db)
+
+    assert worker_b.respond(make_request(etag), db, "services", builder).status_code == 200
+    assert worker_a.respond(make_request(etag), db, "services", builder).status_code == 200
+
+
+def test_without_version_table_responses_are_not_cached(make_db):
+    db = make_db()
+    cache = VersionedResponseCache("catalogue")
+    builder = Builder(["F40"])
+
+    for _ in range(2):
+        response = cache.respond(make_request(), db, "services", builder)
+        assert response.status_code == 200
+        assert "etag" not in response.headers
+    assert builder.calls == 2
+
+
+def run_migration(engine):
+    """Applica 0007 (tabella e trigger) con le Operations di alembic"""
+    pytest.importorskip("alembic.operations")
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    spec = importlib.util.spec_from_file_location("migration_0007", MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    with engine.begin() as conn:
+        with Operations.context(MigrationContext.configure(conn)):
+            migration.upgrade()
+    return migration
+
+
+def test_triggers_bump_version_on_catalogue_writes(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE sub_types (id SERIAL PRIMARY KEY, code VARCHAR, name VARCHAR)"))
+        conn.execute(text("CREATE TABLE service_commessa_mapping (service_id INTEGER, commessa_id INTEGER)"))
+        conn.execute(text("CREATE TABLE service_user_associations (id SERIAL PRIMARY KEY, service_id INTEGER, user_id VARCHAR)"))
+        conn.execute(text("CREATE TABLE users (id VARCHAR PRIMARY KEY, name VARCHAR, surname VARCHAR, email VARCHAR)"))
+        conn.execute(text('CREATE TABLE milestones (id SERIAL PRIMARY KEY, name VARCHAR, project_type VARCHAR, "order" INTEGER)'))
+        conn.execute(text("CREATE TABLE phase_templates (id SERIAL PRIMARY KEY, milestone_id INTEGER, description TEXT)"))
+    migration = run_migration(pg_engine)
+    db = sessionmaker(bind=pg_engine)()
+    cache = VersionedResponseCache("catalogue")
+    builder = Builder(["M1"])
+
+    try:
+        etag = cache.respond(make_request(), db, "services_tree", builder).headers["etag"]
+        db.commit()
+
+        # Scrittura fuori dall'app (come POST /milestones o uno script): nessuna chiamata esplicita
+        with pg_engine.begin() as conn:
+            conn.execute(text("""INSERT INTO milestones (name, project_type, "order") VALUES ('M2', 'F40', 2)"""))
+        assert cache.respond(make_request(etag), db, "services_tree", builder).status_code == 200
+        db.commit()
+
+        versions = []
+        for table in migration.CATALOGUE_TABLES:
+            with pg_engine.begin() as conn:
+                conn.execute(text(f"DELETE FROM {table}"))
+            versions.append(cache.current_version(db))
+            db.commit()
+        assert versions == list(range(2, 2 + len(migration.CATALOGUE_TABLES)))
+    finally:
+        db.close()
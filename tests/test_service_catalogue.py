@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+import app.core.database
+from app.models.cache_version import CacheVersion
+from app.models.sub_type import SubType
+from app.services.service_catalogue import ServiceCatalogue
+
+
+@pytest.fixture
+def db(make_db, monkeypatch):
+    session = make_db(CacheVersion, SubType)
+    session.add(CacheVersion(name="catalogue", version=0))
+    session.add(SubType(id=1, code="PBX", name="Patent Box"))
+    session.commit()
+    # Il catalogo apre le sue sessioni con SessionLocal: stesse tabelle del test
+    monkeypatch.setattr(app.core.database, "SessionLocal", sessionmaker(bind=session.get_bind()))
+    return session
+
+
+def write(db, sql):
+    """Scrittura di un altro worker: il trigger incrementa la versione nella stessa transazione"""
+    db.execute(text(sql))
+    db.execute(text("UPDATE cache_versions SET version = version + 1 WHERE name = 'catalogue'"))
+    db.commit()
+
+
+def codes(catalogue):
+    return [entry.code for entry in catalogue.entries()]
+
+
+def test_reloads_only_when_the_shared_version_changes(db):
+    catalogue = ServiceCatalogue(check_interval=0)
+
+    assert codes(catalogue) == ["PBX"]
+    assert codes(catalogue) == ["PBX"]
+    assert catalogue.loads == 1
+
+    write(db, "INSERT INTO sub_types (id, code, name) VALUES (2, 'F40', 'Formazione 4.0')")
+
+    assert codes(catalogue) == ["PBX", "F40"]
+    assert catalogue.loads == 2
+
+
+def test_change_in_one_worker_reaches_the_others(db):
+    worker_a, worker_b = ServiceCatalogue(check_interval=0), ServiceCatalogue(check_interval=0)
+    matcher = worker_b.matcher()
+    assert codes(worker_a) == codes(worker_b) == ["PBX"]
+
+    # Nessuna chiamata a invalidate() nel worker B
+    write(db, "UPDATE sub_types SET name = 'Patent Box 2026' WHERE id = 1")
+
+    assert worker_b.name_mapping() == {"patent box 2026": "Patent Box 2026"}
+    assert worker_b.matcher() is not matcher
+    assert worker_a.code_mapping() == {"patent box 2026": "PBX"}
+
+
+def test_version_is_checked_at_most_once_per_interval(db):
+    catalogue = ServiceCatalogue(check_interval=3600)
+    assert codes(catalogue) == ["PBX"]
+
+    write(db, "INSERT INTO sub_types (id, code, name) VALUES (2, 'F40', 'Formazione 4.0')")
+    assert codes(catalogue) == ["PBX"]
+
+    # invalidate() (route dello stesso worker) forza la rilettura della versione
+    catalogue.invalidate()
+    assert codes(catalogue) == ["PBX", "F40"]
+
+
+def test_falls_back_without_database(monkeypatch):
+    def broken_session():
+        raise RuntimeError("database non raggiungibile")
+
+    monkeypatch.setattr(app.core.database, "SessionLocal", broken_session)
+    catalogue = ServiceCatalogue(check_interval=0)
+
+    assert "PBX" in codes(catalogue)
+    assert catalogue.loads == 0
@@ -0,0 +1,109 @@
+import pytest
+from psycopg2.extras import execute_values
+from sqlalchemy import text
+
+from app.services import service_reclassifier as reclassifier
+from app.services.service_reclassifier import SOURCE_AUTO, SOURCE_MANUAL, UPDATE_SERVICES_SQL, reclassified_services
+
+ACTIVITIES_DDL = """
+    CREATE TABLE activities (
+        id INTEGER PRIMARY KEY,
+        description TEXT,
+        detected_services VARCHAR,
+        detected_services_source VARCHAR(10)
+    )
+"""
+
+CATALOGUE = {"patent box": "Patent Box", "formazione 4.0": "Formazione 4.0", "bandi": "Bandi"}
+
+
+@pytest.mark.parametrize("current, source, detected, expected", [
+    # Valori scelti a mano: mai toccati
+    ("Bandi", SOURCE_MANUAL, "Patent Box", None),
+    (None, SOURCE_MANUAL, "Patent Box", None),
+    # Nessun servizio riconosciuto: il valore resta
+    ("Bandi", SOURCE_AUTO, None, None),
+    ("Bandi", None, None, None),
+    # Valori automatici o vuoti: sostituiti
+    ("Bandi", SOURCE_AUTO, "Patent Box", ("Patent Box", SOURCE_AUTO)),
+    (None, None, "Patent Box", ("Patent Box", SOURCE_AUTO)),
+    ("", None, "Patent Box", ("Patent Box", SOURCE_AUTO)),
+    # Origine sconosciuta: unione, origine invariata
+    ("Bandi, Cashback", None, "Patent Box, Bandi", ("Bandi, Cashback, Patent Box", None)),
+])
+def test_reclassified_services(current, source, detected, expected):
+    assert reclassified_services(current, source, detected) == expected
+
+
+def seed(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(text(ACTIVITIES_DDL))
+        for row in rows:
+            conn.execute(text(
+                "INSERT INTO activities VALUES (:id, :description, :detected_services, :detected_services_source)"
+            ), row)
+
+
+def services_by_id(engine):
+    with engine.connect() as conn:
+        return {row[0]: tuple(row[1:]) for row in conn.execute(text(
+            "SELECT id, detected_services, detected_services_source FROM activities ORDER BY id"
+        ))}
+
+
+def test_update_sql_skips_manual_rows_and_unchanged_values(pg_engine):
+    seed(pg_engine, [
+        {"id": 1, "description": "", "detected_services": "Bandi", "detected_services_source": SOURCE_AUTO},
+        {"id": 2, "description": "", "detected_services": "Patent Box", "detected_services_source": SOURCE_AUTO},
+        # Diventata manuale dopo la lettura del blocco
+        {"id": 3, "description": "", "detected_services": "Bandi", "detected_services_source": SOURCE_MANUAL},
+        {"id": 4, "description": "", "detected_services": "Bandi", "detected_services_source": None},
+    ])
+    raw = pg_engine.raw_connection()
+    try:
+        with raw.cursor() as cursor:
+            execute_values(cursor, UPDATE_SERVICES_SQL, [
+                (1, "Patent Box", SOURCE_AUTO),
+                (2, "Patent Box", SOURCE_AUTO),
+                (3, "Patent Box", SOURCE_AUTO),
+                (4, "Bandi, Patent Box", None),
+            ])
+            updated = cursor.rowcount
+        raw.commit()
+    finally:
+        raw.close()
+
+    assert updated == 2
+    assert services_by_id(pg_engine) == {
+        1: ("Patent Box", SOURCE_AUTO),
+        2: ("Patent Box", SOURCE_AUTO),
+        3: ("Bandi", SOURCE_MANUAL),
+        4: ("Bandi, Patent Box", None),
+    }
+
+
+def test_run_preserves_manual_and_undetected_values(pg_engine, monkeypatch, tmp_path):
+    from app.services.service_catalogue import service_catalogue
+
+    seed(pg_engine, [
+        {"id": 1, "description": "Pratica patent box", "detected_services": None, "detected_services_source": None},
+        {"id": 2, "description": "Pratica patent box", "detected_services": "Bandi", "detected_services_source": SOURCE_MANUAL},
+        {"id": 3, "description": "Telefonata generica", "detected_services": "Bandi", "detected_services_source": None},
+        {"id": 4, "description": "Corso formazione 4.0", "detected_services": "Patent Box", "detected_services_source": SOURCE_AUTO},
+        {"id": 5, "description": "Bandi e patent box", "detected_services": "Cashback", "detected_services_source": None},
+    ])
+    monkeypatch.setattr(reclassifier, "engine", pg_engine)
+    monkeypatch.chdir(tmp_path)  # checkpoint nella cartella del test
+    monkeypatch.setattr(service_catalogue, "name_mapping", lambda: CATALOGUE)
+
+    result = reclassifier.ReclassificationJob().run(resume=False, batch_size=2, workers=1)
+
+    assert result["processed"] == 5
+    assert result["updated"] == 3
+    assert services_by_id(pg_engine) == {
+        1: ("Patent Box", SOURCE_AUTO),
+        2: ("Bandi", SOURCE_MANUAL),
+        3: ("Bandi", None),
+        4: ("Formazione 4.0", SOURCE_AUTO),
+        5: ("Bandi, Cashback, Patent Box", None),
+    }
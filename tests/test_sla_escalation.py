@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.models.sla_ledger import SLAEscalationLedger, SLAScanState
+from app.models.task import Task
+from app.models.user import User
+from app.services import sla_escalation_service as sla
+from app.services.sla_escalation_service import LEVEL_ESCALATION, SLAEscalationService
+
+NOW = datetime(2026, 3, 1, 9, 0)
+
+
+@pytest.fixture
+def db(pg_engine):
+    # Il ledger usa INSERT ... ON CONFLICT di PostgreSQL; le tabelle referenziate bastano minime
+    with pg_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE tickets (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("CREATE TABLE owners (id VARCHAR PRIMARY KEY)"))
+        conn.execute(text("CREATE TABLE milestones (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO tickets (id) VALUES (1)"))
+        conn.execute(text("INSERT INTO owners (id) VALUES ('u1'), ('u2')"))
+        for model in (User, Task, SLAEscalationLedger, SLAScanState):
+            model.__table__.create(conn)
+    session = sessionmaker(bind=pg_engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def service():
+    return SLAEscalationService()
+
+
+@pytest.fixture
+def outbox(service, monkeypatch):
+    """Consegne finte: registra gli id dei task notificati, solo per owner con email"""
+    delivered = []
+
+    def send_notifications(template, items):
+        sent = [(task, owner) for task, owner, _ in items if owner and owner.email]
+        delivered.extend(task.id for task, _ in sent)
+        return sent
+
+    monkeypatch.setattr(service, "_send_notifications", send_notifications)
+    return delivered
+
+
+def add_task(db, task_id, due_date, owner="u1", status="aperto"):
+    db.add(Task(id=task_id, ticket_id=1, title=f"Task {task_id}", status=status, due_date=due_date, owner=owner))
+    db.commit()
+
+
+def run(service, db, now):
+    """Come check_overdue_tasks, con l'ora del run fissata"""
+    checked, escalations, _, full_scan = service._collect_overdue(db, now, {})
+    sent, _, _ = service._notify(escalations, [])
+    service._record_run(db, "overdue", LEVEL_ESCALATION, now, sent, full_scan)
+    return checked, full_scan
+
+
+def ledger(db, task_id):
+    db.expire_all()
+    return db.query(SLAEscalationLedger).filter_by(task_id=task_id, level=LEVEL_ESCALATION).one_or_none()
+
+
+def test_long_threshold_is_escalated_from_the_pending_ledger(db, service, outbox, monkeypatch):
+    # Soglia di 30 giorni, run ogni giorno: il task entra nel ledger appena scade e parte al 30° giorno
+    monkeypatch.setattr(sla, "DEFAULT_ESCALATION_DAYS", 30)
+    db.add(User(id="u1", email="owner@example.com"))
+    due_date = NOW - timedelta(hours=12)
+    add_task(db, 1, due_date)
+
+    run(service, db, NOW - timedelta(days=1))
+    assert run(service, db, NOW) == (1, True)
+    assert ledger(db, 1).sent_at is None
+    assert ledger(db, 1).notify_after == due_date + timedelta(days=30)
+
+    for day in range(1, 30):
+        # Il task in attesa non è ancora dovuto: non viene riletto, nemmeno dalla scansione completa
+        assert run(service, db, NOW + timedelta(days=day, minutes=1))[0] == 0
+    assert outbox == []
+
+    run(service, db, due_date + timedelta(days=30, minutes=5))
+    assert outbox == [1]
+    assert ledger(db, 1).sent_at is not None
+
+
+def test_incremental_run_skips_old_backlog_until_full_scan(db, service, outbox, monkeypatch):
+    db.add(User(id="u1", email="owner@example.com"))
+    run(service, db, NOW - timedelta(hours=2))
+
+    # Task creato già scaduto da giorni: non passa dalla finestra dell'ultimo run
+    add_task(db, 1, NOW - timedelta(days=10))
+    add_task(db, 2, NOW - timedelta(hours=1), owner="u2")
+
+    assert run(service, db, NOW) == (1, False)
+    assert outbox == []
+    assert ledger(db, 2).sent_at is None
+
+    monkeypatch.setattr(sla, "SLA_FULL_SCAN_HOURS", 1)
+    # Il task 2 è già in attesa nel ledger (non ancora dovuto): si rilegge solo il task 1
+    assert run(service, db, NOW + timedelta(hours=1)) == (1, True)
+    assert outbox == [1]
+
+
+def test_task_skipped_without_email_comes_back(db, service, outbox):
+    owner = User(id="u1", email=None)
+    db.add(owner)
+    add_task(db, 1, NOW - timedelta(days=40))
+
+    run(service, db, NOW)
+    assert outbox == []
+    assert ledger(db, 1).sent_at is None
+
+    # L'owner ottiene un'email dopo mesi: il task è ancora in attesa nel ledger
+    owner.email = "owner@example.com"
+    db.commit()
+    run(service, db, NOW + timedelta(days=90))
+    assert outbox == [1]
+
+
+def test_ledger_prevents_duplicates_until_due_date_changes(db, service, outbox):
+    db.add(User(id="u1", email="owner@example.com"))
+    add_task(db, 1, NOW - timedelta(days=5))
+    add_task(db, 2, NOW - timedelta(days=5), status="chiuso")
+
+    run(service, db, NOW)
+    assert run(service, db, NOW + timedelta(hours=1))[0] == 0
+    assert outbox == [1]
+
+    # Nuova scadenza: il ledger non vale più e il task si rinotifica quando torna in ritardo
+    db.get(Task, 1).due_date = NOW + timedelta(hours=2)
+    db.commit()
+    run(service, db, NOW + timedelta(hours=3))
+    assert ledger(db, 1).sent_at is None
+    run(service, db, NOW + timedelta(days=3, hours=3))
+    assert outbox == [1, 1]
+
+
+def test_notifications_wait_for_delivery_before_ledger(service, monkeypatch):
+    from app.services.email_service import email_service
+    from app.services.notification_renderer import notification_renderer
+
+    calls = []
+
+    def send_email(to_email, wait=False, **email):
+        calls.append((to_email, wait))
+        return to_email != "broken@example.com"
+
+    monkeypatch.setattr(notification_renderer, "render_batch", lambda template, items: [
+        {"subject": "SLA", "html_body": "<p>SLA</p>", "text_body": "SLA"} for _ in items
+    ])
+    monkeypatch.setattr(email_service, "send_email", send_email)
+
+    ok, broken = User(id="u1", email="ok@example.com"), User(id="u2", email="broken@example.com")
+    task_ok, task_broken = Task(id=1, title="A"), Task(id=2, title="B")
+    sent = service._send_notifications("sla_escalation", [(task_ok, ok, 4), (task_broken, broken, 4)])
+
+    # Solo le consegne riuscite finiscono nel ledger
+    assert sent == [(task_ok, ok)]
+    assert all(wait for _, wait in calls)